@@ -4,6 +4,8 @@ import pika
 
 from nauron import Nauron
 
+from sample_worker import SampleSchema
+
 mq_parameters = pika.ConnectionParameters(host='localhost',
                                           port=5672,
                                           credentials=pika.credentials.PlainCredentials(username='guest',
@@ -13,7 +15,8 @@ mq_parameters = pika.ConnectionParameters(host='localhost',
 app = Nauron(__name__, mq_parameters=mq_parameters)
 CORS(app)
 
-app.add_service(name='sample_service', remote=True)
+# Invalid requests are rejected before they are sent to RabbitMQ.
+app.add_service(name='sample_service', remote=True, validator=SampleSchema)
 
 
 @app.post('/sample-service')
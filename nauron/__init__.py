@@ -6,6 +6,6 @@ logging.getLogger(__name__).addHandler(logging.NullHandler())
 from .__version__ import __version__
 
 from nauron.nauron import Nauron
-from nauron.helpers import Response
+from nauron.helpers import Response, StreamingResponse
 from nauron.worker import Worker
 
@@ -0,0 +1,90 @@
+import logging
+import threading
+from time import time
+from concurrent.futures import Future
+
+from typing import Dict, List, Tuple
+
+from nauron.helpers import Response
+from nauron.worker import Worker
+
+LOGGER = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    def __init__(self, worker: Worker, batch_size: int, batch_timeout: int = 0):
+        """
+        Collects requests from concurrent threads and passes them to a local worker in batches using
+        Worker.process_batch().
+
+        :param worker: A nauron Worker instance.
+        :param batch_size: Maximum number of requests in a batch.
+        :param batch_timeout: Maximum time in milliseconds to wait for a batch to fill up after the first request
+        has arrived.
+        """
+        if batch_size < 1:
+            raise ValueError("Batch size must be at least 1.")
+        self.worker = worker
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+
+        self._queue: List[Tuple[Dict, str, Future]] = []
+        self._first_arrival = None
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='nauron-batcher', daemon=True)
+        self._thread.start()
+
+    def process_request(self, content: Dict, signature: str) -> Response:
+        """
+        Adds the request to the next batch and blocks until it has been processed.
+        """
+        future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Cannot process requests after the batcher has been closed.")
+            if not self._queue:
+                self._first_arrival = time()
+            self._queue.append((content, signature, future))
+            self._condition.notify()
+        return future.result()
+
+    def close(self):
+        """
+        Stops the collector thread once the pending requests have been processed.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+
+    def _next_batch(self) -> List[Tuple[Dict, str, Future]]:
+        """
+        Waits for the next batch. Returns an empty batch once the batcher is closed and no requests are left.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._queue or self._closed)
+            deadline = self._first_arrival + self.batch_timeout / 1000 if self._queue else 0
+            while len(self._queue) < self.batch_size and time() < deadline and not self._closed:
+                self._condition.wait(deadline - time())
+            batch, self._queue = self._queue[:self.batch_size], self._queue[self.batch_size:]
+            self._first_arrival = time() if self._queue else None
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+            contents = [content for content, _, _ in batch]
+            signatures = [signature for _, signature, _ in batch]
+            LOGGER.debug(f"Processing batch: {{size: {len(batch)}}}")
+            try:
+                responses = self.worker.process_batch(contents, signatures)
+                if len(responses) != len(batch):
+                    raise ValueError(f"Worker returned {len(responses)} responses to a batch of {len(batch)} "
+                                     f"requests.")
+            except Exception as e:
+                LOGGER.error(e)
+                responses = [Response(http_status_code=500)] * len(batch)
+            for (_, _, future), response in zip(batch, responses):
+                future.set_result(response)
@@ -0,0 +1,347 @@
+"""
+Benchmarks of nauron's own overhead. Requests are sent through Nauron, Service, MQProducerPool and MQConsumer
+end to end using the in-memory or the local multiprocessing transport instead of RabbitMQ, so no broker is
+needed:
+
+    python -m nauron.bench --requests 5000 --concurrency 16 --payload-size 1024 --mimetype text/plain
+
+The serialization cost of responses is measured separately for each mimetype.
+"""
+import json
+import argparse
+import logging
+import threading
+import multiprocessing
+from time import sleep, perf_counter
+from dataclasses import dataclass, asdict, field
+
+from typing import Dict, List, Optional, Union, Tuple
+
+import pika.exceptions
+
+from nauron.nauron import Nauron
+from nauron.worker import Worker
+from nauron.helpers import Response, compress, decompress, COMPRESSION_THRESHOLD
+from nauron.transport import Transport
+from nauron.memory_broker import InMemoryBroker
+from nauron.local_transport import LocalTransport
+from nauron.mq_consumer import MQConsumer
+
+LOGGER = logging.getLogger(__name__)
+
+MIMETYPES = ('application/json', 'text/plain', 'audio/wav')
+
+
+def make_content(mimetype: str, size: int) -> Union[Dict, str, bytes]:
+    """
+    Returns response content of roughly the given size in bytes in the form used for the mimetype.
+    """
+    if mimetype == 'application/json':
+        return {'text': 'x' * size}
+    if mimetype.startswith('text/'):
+        return 'x' * size
+    return bytes(range(256)) * (size // 256) + bytes(size % 256)
+
+
+class BenchmarkWorker(Worker):
+    def __init__(self, mimetype: str = 'application/json', payload_size: int = 1024, latency: float = 0):
+        """
+        A worker that simulates processing by sleeping for latency seconds and responds with a payload of the given
+        size and mimetype.
+        """
+        self.mimetype = mimetype
+        self.latency = latency
+        self.content = make_content(mimetype, payload_size)
+
+    def process_request(self, content: Dict, _: str) -> Response:
+        if self.latency:
+            sleep(self.latency)
+        return Response(self.content, mimetype=self.mimetype)
+
+
+@dataclass
+class LoadResult:
+    mode: str
+    mimetype: str
+    requests: int
+    concurrency: int
+    payload_size: int
+    worker_latency: float
+    errors: int
+    duration: float
+    throughput: float
+    latency: Dict[str, float] = field(default_factory=dict)
+
+    def __str__(self):
+        latency = ', '.join(f'{name}: {value * 1000:.2f} ms' for name, value in self.latency.items())
+        return (f"{self.mode:7} {self.mimetype:16} {self.requests} requests, concurrency {self.concurrency}: "
+                f"{self.throughput:.1f} req/s, {self.errors} errors, latency {{{latency}}}")
+
+
+@dataclass
+class SerializationResult:
+    mimetype: str
+    envelope: str
+    payload_size: int
+    message_size: int
+    encode: float
+    decode: float
+
+    def __str__(self):
+        return (f"{self.envelope:6} {self.mimetype:16} {self.message_size} bytes: "
+                f"encode {self.encode * 1e6:.1f} us, decode {self.decode * 1e6:.1f} us")
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    """
+    Returns the median, 90th, 99th percentile and maximum of the values using the nearest-rank method.
+    """
+    if not values:
+        return {}
+    values = sorted(values)
+    result = {}
+    for name, percentile in (('p50', 50), ('p90', 90), ('p99', 99)):
+        rank = max(int(round(percentile / 100 * len(values) + 0.5)) - 1, 0)
+        result[name] = values[min(rank, len(values) - 1)]
+    result['max'] = values[-1]
+    return result
+
+
+def _drive(app: Nauron, service_name: str, requests: int, concurrency: int,
+           content: Dict) -> Tuple[List[float], int, float]:
+    """
+    Sends requests from concurrent threads the same way a Flask view would and returns the latencies, the
+    number of errors and the total duration.
+    """
+    latencies: List[float] = []
+    errors = [0]
+    counter = iter(range(requests))
+    lock = threading.Lock()
+
+    def run():
+        with app.test_request_context():
+            while True:
+                with lock:
+                    if next(counter, None) is None:
+                        return
+                t1 = perf_counter()
+                try:
+                    response = app.process_request(service_name, content)
+                    # Consume the body like a WSGI server would, send_file() responses do not support get_data().
+                    for _ in response.response:
+                        pass
+                    response.close()
+                    failed = response.status_code != 200
+                except Exception as e:
+                    LOGGER.debug(e)
+                    failed = True
+                t2 = perf_counter()
+                with lock:
+                    latencies.append(t2 - t1)
+                    errors[0] += failed
+
+    threads = [threading.Thread(target=run, name=f'nauron-bench-{i}') for i in range(concurrency)]
+    t1 = perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0], perf_counter() - t1
+
+
+def _wait_for_consumers(transport: Transport, queue: str, count: int, timeout: float) -> bool:
+    """
+    Polls the queue until at least count consumers are listening to it.
+    """
+    connection = transport.connect()
+    try:
+        deadline = perf_counter() + timeout
+        while perf_counter() < deadline:
+            try:
+                channel = connection.channel()
+                if channel.queue_declare(queue, passive=True).method.consumer_count >= count:
+                    return True
+            except pika.exceptions.ChannelClosedByBroker:
+                pass
+            sleep(0.05)
+        return False
+    finally:
+        connection.close()
+
+
+def run_load(mode: str = 'remote', requests: int = 1000, concurrency: int = 8, payload_size: int = 1024,
+             mimetype: str = 'application/json', worker_latency: float = 0, consumers: int = 1,
+             consumer_concurrency: int = 1, pool_size: int = 8, compression: Optional[str] = None,
+             compression_threshold: int = COMPRESSION_THRESHOLD, warmup: int = 50,
+             envelope: str = 'binary') -> LoadResult:
+    """
+    Measures the throughput and latency of requests processed by a local worker ('local' mode), by remote
+    workers in the same process through the in-memory broker ('remote' mode) or by remote workers in separate
+    processes through the local multiprocessing transport ('process' mode).
+
+    :param requests: Number of measured requests.
+    :param concurrency: Number of threads sending requests simultaneously.
+    :param payload_size: Size of the request and response content in bytes.
+    :param mimetype: Mimetype of the responses.
+    :param worker_latency: Simulated processing time of each request in seconds.
+    :param consumers: Number of remote workers.
+    :param consumer_concurrency: Number of requests processed simultaneously by each remote worker using a
+    thread pool.
+    :param pool_size: Number of producer connections of the service.
+    :param compression: Compression codec of requests and responses.
+    :param compression_threshold: Minimum message size in bytes to be compressed.
+    :param warmup: Number of requests sent before the measurement.
+    :param envelope: Envelope format of requests and responses of remote workers ('json' or 'binary').
+    """
+    if mode not in ('local', 'remote', 'process'):
+        raise ValueError(f"Unknown mode: {mode}")
+    service_name = f'bench_{mode}'
+    worker = BenchmarkWorker(mimetype, payload_size, worker_latency)
+    transport = None
+    if mode == 'remote':
+        transport = InMemoryBroker()
+    elif mode == 'process':
+        transport = LocalTransport().start()
+    app = Nauron(__name__, mq_parameters=transport, timeout=60000)
+    service = app.add_service(service_name, remote=transport is not None, pool_size=pool_size,
+                              compression=compression, compression_threshold=compression_threshold,
+                              envelope=envelope)
+    mq_consumers, threads, processes = [], [], []
+    try:
+        if transport is not None:
+            for i in range(consumers):
+                consumer = MQConsumer(worker, transport, service_name, concurrency=consumer_concurrency,
+                                      executor='thread' if consumer_concurrency > 1 else None,
+                                      compression=compression, compression_threshold=compression_threshold)
+                if mode == 'process':
+                    process = multiprocessing.Process(target=consumer.start, name=f'nauron-bench-consumer-{i}',
+                                                      daemon=True)
+                    process.start()
+                    processes.append(process)
+                else:
+                    thread = threading.Thread(target=consumer.start, name=f'nauron-bench-consumer-{i}',
+                                              daemon=True)
+                    thread.start()
+                    mq_consumers.append(consumer)
+                    threads.append(thread)
+            if not service.wait_ready(10) or \
+                    not _wait_for_consumers(transport, f'{service_name}.default', consumers, timeout=10):
+                raise RuntimeError("The benchmark service did not become ready.")
+        else:
+            service.add_worker(worker)
+
+        content = {'text': 'x' * payload_size}
+        if warmup:
+            _drive(app, service_name, warmup, concurrency, content)
+        latencies, errors, duration = _drive(app, service_name, requests, concurrency, content)
+    finally:
+        for consumer in mq_consumers:
+            consumer.stop()
+        for thread in threads:
+            thread.join(timeout=5)
+        for process in processes:
+            process.terminate()
+            process.join()
+        service.close()
+        if app._mq_router is not None:
+            app._mq_router.stop()
+        app._services.pop(service_name, None)
+        if mode == 'process':
+            transport.shutdown()
+
+    return LoadResult(mode=mode, mimetype=mimetype, requests=requests, concurrency=concurrency,
+                      payload_size=payload_size, worker_latency=worker_latency, errors=errors,
+                      duration=duration, throughput=requests / duration, latency=percentiles(latencies))
+
+
+def _time(function, iterations: int) -> float:
+    t1 = perf_counter()
+    for _ in range(iterations):
+        function()
+    return (perf_counter() - t1) / iterations
+
+
+def run_serialization(payload_size: int = 1024, mimetypes=MIMETYPES, iterations: int = 1000,
+                      compression: Optional[str] = None,
+                      compression_threshold: int = COMPRESSION_THRESHOLD) -> List[SerializationResult]:
+    """
+    Measures the average time of encoding and decoding a response of each mimetype in both envelope formats,
+    including compression if a codec is given.
+    """
+    results = []
+    for mimetype in mimetypes:
+        response = Response(make_content(mimetype, payload_size), mimetype=mimetype)
+
+        def encode_legacy():
+            return compress(response.encode(), compression, compression_threshold)
+
+        def encode_binary():
+            body, headers = response.encode_binary()
+            return compress(body, compression, compression_threshold) + (headers,)
+
+        legacy_body, legacy_encoding = encode_legacy()
+        binary_body, binary_encoding, headers = encode_binary()
+        results.append(SerializationResult(
+            mimetype=mimetype, envelope='json', payload_size=payload_size, message_size=len(legacy_body),
+            encode=_time(encode_legacy, iterations),
+            decode=_time(lambda: Response.decode(decompress(legacy_body, legacy_encoding), None, None), iterations)))
+        results.append(SerializationResult(
+            mimetype=mimetype, envelope='binary', payload_size=payload_size, message_size=len(binary_body),
+            encode=_time(encode_binary, iterations),
+            decode=_time(lambda: Response.decode(decompress(binary_body, binary_encoding), 'application/x-nauron',
+                                                 headers), iterations)))
+    return results
+
+
+def main(args: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(prog='python -m nauron.bench', description=__doc__.strip().split('\n\n')[0],
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--mode', choices=('local', 'remote', 'process', 'all'), default='all',
+                        help="local workers, remote workers through the in-memory broker, remote workers in "
+                             "separate processes through the local transport or all of them")
+    parser.add_argument('--requests', type=int, default=1000, help="number of measured requests")
+    parser.add_argument('--concurrency', type=int, default=8, help="number of concurrent clients")
+    parser.add_argument('--payload-size', type=int, default=1024, help="request and response size in bytes")
+    parser.add_argument('--mimetype', action='append', choices=MIMETYPES,
+                        help="response mimetype, can be repeated (default: all)")
+    parser.add_argument('--worker-latency', type=float, default=0, help="simulated processing time in ms")
+    parser.add_argument('--consumers', type=int, default=1, help="number of remote workers")
+    parser.add_argument('--consumer-concurrency', type=int, default=1,
+                        help="requests processed simultaneously by each remote worker")
+    parser.add_argument('--pool-size', type=int, default=8, help="producer connections of the service")
+    parser.add_argument('--compression', choices=('gzip', 'zlib', 'lz4'), default=None)
+    parser.add_argument('--compression-threshold', type=int, default=COMPRESSION_THRESHOLD)
+    parser.add_argument('--envelope', choices=('json', 'binary'), default='binary',
+                        help="envelope format of messages to remote workers")
+    parser.add_argument('--iterations', type=int, default=1000, help="iterations of serialization benchmarks")
+    parser.add_argument('--json', action='store_true', help="print the results as JSON")
+    options = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.ERROR)
+    mimetypes = options.mimetype or list(MIMETYPES)
+    modes = ('local', 'remote', 'process') if options.mode == 'all' else (options.mode,)
+
+    load_results = [run_load(mode=mode, requests=options.requests, concurrency=options.concurrency,
+                             payload_size=options.payload_size, mimetype=mimetype,
+                             worker_latency=options.worker_latency / 1000, consumers=options.consumers,
+                             consumer_concurrency=options.consumer_concurrency, pool_size=options.pool_size,
+                             compression=options.compression, compression_threshold=options.compression_threshold,
+                             envelope=options.envelope)
+                    for mimetype in mimetypes for mode in modes]
+    serialization_results = run_serialization(options.payload_size, mimetypes, options.iterations,
+                                              options.compression, options.compression_threshold)
+
+    if options.json:
+        print(json.dumps({'load': [asdict(result) for result in load_results],
+                          'serialization': [asdict(result) for result in serialization_results]}, indent=2))
+    else:
+        print("Load:")
+        for result in load_results:
+            print(f"  {result}")
+        print("Serialization:")
+        for result in serialization_results:
+            print(f"  {result}")
+
+
+if __name__ == '__main__':
+    main()
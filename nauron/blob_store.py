@@ -0,0 +1,155 @@
+import os
+import re
+import mmap
+import uuid
+import logging
+import threading
+from time import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+from typing import Dict, Iterator, Optional, Tuple, Union
+
+LOGGER = logging.getLogger(__name__)
+
+# Messages larger than this (in bytes) are offloaded to the blob store by default.
+CLAIM_CHECK_THRESHOLD = 8 * 1024 * 1024
+
+_REFERENCE = re.compile(r'^[0-9a-f]{32}$')
+
+
+class BlobStore(ABC):
+    """
+    A store for message bodies that are too large to be passed through the message broker (the claim-check
+    pattern). The body is written to the store and only a reference to it is sent in the 'claim_check' header of
+    the message. Both the services and the workers must have access to the same store.
+    """
+
+    @abstractmethod
+    def put(self, data: bytes) -> str:
+        """
+        Stores the data and returns a reference to it.
+        """
+        pass
+
+    @abstractmethod
+    def open(self, reference: str) -> Iterator[Union[bytes, mmap.mmap]]:
+        """
+        A context manager that returns the stored data as a bytes-like object that is only valid within the block.
+        Raises a KeyError if the reference is unknown or has expired.
+        """
+        pass
+
+    @abstractmethod
+    def delete(self, reference: str):
+        """
+        Deletes the data if it still exists.
+        """
+        pass
+
+
+class DirectoryBlobStore(BlobStore):
+    def __init__(self, path: str, ttl: float = 3600, cleanup_interval: float = 60):
+        """
+        Stores blobs as files in a directory that is shared by all services and workers (a local directory if they
+        run on the same host, or an NFS mount). Blobs are read through mmap, so compressed payloads are decompressed
+        straight from the page cache while uncompressed ones are copied once into the decoded message. Services
+        delete requests once they are answered and responses once they are read, expired blobs (e.g. of requests
+        whose service was stopped) are removed by whichever process stores a blob next, at most once per
+        cleanup_interval seconds.
+
+        :param path: Path to the directory, created if it does not exist.
+        :param ttl: Time in seconds after which a blob is removed. Should be longer than the message timeout.
+        :param cleanup_interval: Minimum time in seconds between checks for expired blobs.
+        """
+        self.path = path
+        self.ttl = ttl
+        self.cleanup_interval = cleanup_interval
+        self._cleaned_at = 0
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, reference: str) -> str:
+        if not _REFERENCE.match(reference):
+            raise KeyError(reference)
+        return os.path.join(self.path, reference)
+
+    def put(self, data: bytes) -> str:
+        self._cleanup()
+        reference = uuid.uuid4().hex
+        temp_file = os.path.join(self.path, f'.{reference}.tmp')
+        with open(temp_file, 'wb') as f:
+            f.write(data)
+        # Readers never see a partially written blob.
+        os.replace(temp_file, self._file(reference))
+        return reference
+
+    @contextmanager
+    def open(self, reference: str) -> Iterator[Union[bytes, mmap.mmap]]:
+        try:
+            f = open(self._file(reference), 'rb')
+        except FileNotFoundError:
+            raise KeyError(reference)
+        with f:
+            if os.fstat(f.fileno()).st_size == 0:
+                yield b''
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                yield data
+
+    def delete(self, reference: str):
+        try:
+            os.remove(self._file(reference))
+        except (FileNotFoundError, KeyError):
+            pass
+
+    def _cleanup(self):
+        now = time()
+        with self._lock:
+            if now - self._cleaned_at < self.cleanup_interval:
+                return
+            self._cleaned_at = now
+        removed = 0
+        for entry in os.scandir(self.path):
+            try:
+                if entry.is_file() and entry.stat().st_mtime < now - self.ttl:
+                    os.remove(entry.path)
+                    removed += 1
+            except FileNotFoundError:
+                # Removed by another process.
+                pass
+        if removed:
+            LOGGER.debug(f"Expired blobs removed: {{path: {self.path}, count: {removed}}}")
+
+
+class MemoryBlobStore(BlobStore):
+    def __init__(self, ttl: Optional[float] = 3600):
+        """
+        Keeps blobs in memory. Only usable if the services and workers run in the same process, e.g. in tests or
+        together with nauron.memory_broker.InMemoryBroker.
+
+        :param ttl: Time in seconds after which a blob is removed, None to keep blobs until they are deleted.
+        """
+        self.ttl = ttl
+        self._blobs: Dict[str, Tuple[Optional[float], bytes]] = {}
+        self._lock = threading.Lock()
+
+    def put(self, data: bytes) -> str:
+        reference = uuid.uuid4().hex
+        now = time()
+        with self._lock:
+            self._blobs = {key: value for key, value in self._blobs.items() if value[0] is None or value[0] > now}
+            self._blobs[reference] = (None if self.ttl is None else now + self.ttl, bytes(data))
+        return reference
+
+    @contextmanager
+    def open(self, reference: str) -> Iterator[bytes]:
+        with self._lock:
+            expires, data = self._blobs[reference]
+        if expires is not None and expires < time():
+            raise KeyError(reference)
+        yield data
+
+    def delete(self, reference: str):
+        with self._lock:
+            self._blobs.pop(reference, None)
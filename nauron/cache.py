@@ -0,0 +1,214 @@
+import json
+import asyncio
+import hashlib
+import logging
+import threading
+from abc import abstractmethod
+from time import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from typing import Dict, Optional, Callable, Union, Awaitable, Tuple
+
+from nauron.helpers import Response, StreamingResponse
+
+LOGGER = logging.getLogger(__name__)
+
+
+def cache_key(service_name: str, routing_key: str, signature: str, content: Dict) -> str:
+    """
+    Returns a cache key for the request. The content is serialized with sorted keys so that the key does not depend
+    on the order of the fields in the request.
+    """
+    canonical_content = json.dumps(content, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    digest = hashlib.sha256(canonical_content.encode('utf8')).hexdigest()
+    return f'{service_name}:{routing_key}:{signature}:{digest}'
+
+
+class CacheBackend:
+    """
+    An abstract storage for cached responses. Subclasses can implement a shared cache (e.g. Redis or Memcached) by
+    storing the responses using Response.encode_binary() or pickle. Backends used as the replay cache of a worker
+    (see MQConsumer) store encoded responses instead, which can be pickled as well.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Response]:
+        """
+        Returns the cached response or None if the key is not cached or has expired.
+        """
+        pass
+
+    @abstractmethod
+    def set(self, key: str, response: Response):
+        """
+        Stores the response.
+        """
+        pass
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns statistics of the cache.
+        """
+        return {}
+
+
+class LRUCache(CacheBackend):
+    def __init__(self, max_size: int = 64 * 1024 * 1024, ttl: Optional[float] = 300):
+        """
+        An in-memory cache that evicts the least recently used responses once the total size of cached content
+        exceeds max_size.
+
+        :param max_size: Maximum total size of the cached content in bytes.
+        :param ttl: Time in seconds after which a cached response expires, None to never expire.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self._items: OrderedDict = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+
+    @staticmethod
+    def _sizeof(response: Response) -> int:
+        if isinstance(response, Response):
+            body, _ = response.encode_binary()
+            return len(body)
+        # Responses stored by the replay cache of a worker are already encoded.
+        return len(response.body)
+
+    def get(self, key: str) -> Optional[Response]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self._stats['misses'] += 1
+                return None
+            expires, size, response = item
+            if expires is not None and expires < time():
+                del self._items[key]
+                self._size -= size
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._items.move_to_end(key)
+            self._stats['hits'] += 1
+            return response
+
+    def set(self, key: str, response: Response):
+        size = self._sizeof(response)
+        if size > self.max_size:
+            return
+        expires = None if self.ttl is None else time() + self.ttl
+        with self._lock:
+            if key in self._items:
+                self._size -= self._items.pop(key)[1]
+            self._items[key] = (expires, size, response)
+            self._size += size
+            while self._size > self.max_size:
+                _, (_, evicted_size, _) = self._items.popitem(last=False)
+                self._size -= evicted_size
+                self._stats['evictions'] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'items': len(self._items), 'size': self._size, **self._stats}
+
+
+class ResponseCache:
+    def __init__(self, backend: CacheBackend):
+        """
+        Serves repeated requests from a cache backend and collapses concurrent identical requests into a single
+        call. Only successful (HTTP 200) non-streamed responses are cached.
+        """
+        self.backend = backend
+        self._in_flight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._collapsed = 0
+
+    def _join(self, key: str) -> Tuple[Future, bool]:
+        """
+        Returns the future of the in-flight request for the key and whether the caller is responsible for computing
+        it (i.e. no identical request is in flight).
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self._collapsed += 1
+                return future, False
+            future = Future()
+            self._in_flight[key] = future
+            return future, True
+
+    def _store(self, key: str, response: Union[Response, StreamingResponse]):
+        if isinstance(response, Response) and response.http_status_code == 200:
+            try:
+                self.backend.set(key, response)
+            except Exception as e:
+                LOGGER.error(f"Unable to cache response: {e}")
+
+    def _leave(self, key: str):
+        with self._lock:
+            del self._in_flight[key]
+
+    def get_or_compute(self, key: str,
+                       compute: Callable[[], Union[Response, StreamingResponse]]) -> Union[Response, StreamingResponse]:
+        """
+        Returns the cached response for the key or computes it. If the same key is already being computed by
+        another thread, waits for its result instead.
+        """
+        response = self.backend.get(key)
+        if response is not None:
+            return response
+
+        future, leader = self._join(key)
+        if not leader:
+            response = future.result()
+            if isinstance(response, StreamingResponse):
+                # A stream can be consumed only once.
+                return compute()
+            return response
+
+        try:
+            response = compute()
+            self._store(key, response)
+            future.set_result(response)
+            return response
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._leave(key)
+
+    async def get_or_compute_async(self, key: str,
+                                   compute: Callable[[], Awaitable[Response]]) -> Union[Response, StreamingResponse]:
+        """
+        An asyncio equivalent of get_or_compute(). Requests are collapsed with both synchronous and asynchronous
+        requests for the same key.
+        """
+        response = self.backend.get(key)
+        if response is not None:
+            return response
+
+        future, leader = self._join(key)
+        if not leader:
+            response = await asyncio.wrap_future(future)
+            if isinstance(response, StreamingResponse):
+                return await compute()
+            return response
+
+        try:
+            response = await compute()
+            self._store(key, response)
+            future.set_result(response)
+            return response
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._leave(key)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = {'in_flight': len(self._in_flight), 'collapsed': self._collapsed}
+        return {**self.backend.stats(), **stats}
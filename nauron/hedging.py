@@ -0,0 +1,108 @@
+import logging
+import threading
+from collections import deque
+
+from typing import Dict, Optional
+
+LOGGER = logging.getLogger(__name__)
+
+# Maximum number of hedges that can be sent in a burst after a quiet period.
+MAX_HEDGE_BURST = 10
+# The hedge delay of a routing key is recomputed after this many new latency samples.
+RECOMPUTE_INTERVAL = 20
+
+
+class HedgePolicy:
+    def __init__(self, percentile: float = 95, max_rate: float = 0.05, min_delay: int = 0, window: int = 1000,
+                 min_samples: int = 50, routing_key: Optional[str] = None):
+        """
+        Decides when a duplicate of a request to remote workers is published because its response is late. A
+        request is hedged if no response has arrived by the given percentile of the recent response times of its
+        routing key, so that a single slow worker does not dictate the tail latency. The first response to arrive
+        is used and the other one is dropped.
+
+        Hedges put extra load on the workers, so their rate is capped: each request earns max_rate hedges, up to a
+        burst of MAX_HEDGE_BURST. Hedging should only be used for idempotent workers.
+
+        Requests that time out are recorded with the time waited for them. It is only a lower bound of their
+        latency, but leaving them out would bias the delay low exactly when the workers are slow. Requests that
+        fail before they are published are not recorded.
+
+        :param percentile: Percentile of recent response times (0-100) after which a request is hedged.
+        :param max_rate: Maximum fraction of requests that are hedged.
+        :param min_delay: Minimum time in milliseconds to wait before hedging.
+        :param window: Number of recent response times per routing key used to compute the percentile.
+        :param min_samples: Requests are not hedged until this many response times have been observed.
+        :param routing_key: An optional alternate routing key (without the service name) for the duplicates, e.g.
+        a queue of dedicated standby workers. The original routing key is used by default.
+        """
+        if not 0 < percentile < 100:
+            raise ValueError("Percentile must be between 0 and 100.")
+        if not 0 <= max_rate <= 1:
+            raise ValueError("Maximum hedge rate must be between 0 and 1.")
+        self.percentile = percentile
+        self.max_rate = max_rate
+        self.min_delay = min_delay
+        self.window = window
+        self.min_samples = min_samples
+        self.routing_key = routing_key
+
+        self._latencies: Dict[str, deque] = {}
+        self._delays: Dict[str, Optional[float]] = {}
+        self._new_samples: Dict[str, int] = {}
+        self._tokens = 0.0
+        self._lock = threading.Lock()
+        self._stats = {'requests': 0, 'hedged': 0, 'capped': 0, 'hedge_won': 0, 'timed_out': 0}
+
+    def delay(self, routing_key: str) -> Optional[float]:
+        """
+        Returns the time in seconds after which a new request to the routing key should be hedged, or None if
+        there are not enough samples yet. Every call counts as a request for the rate limit.
+        """
+        with self._lock:
+            self._stats['requests'] += 1
+            self._tokens = min(self._tokens + self.max_rate, MAX_HEDGE_BURST)
+            return self._delays.get(routing_key)
+
+    def acquire(self) -> bool:
+        """
+        Returns whether a hedge may be sent without exceeding the maximum rate.
+        """
+        with self._lock:
+            if self._tokens < 1:
+                self._stats['capped'] += 1
+                return False
+            self._tokens -= 1
+            self._stats['hedged'] += 1
+            return True
+
+    def observe(self, routing_key: str, latency: float, hedge_won: bool = False, timed_out: bool = False):
+        """
+        Records the time in seconds between publishing a request and receiving the first response, or the time
+        waited until the request timed out without any response.
+        """
+        with self._lock:
+            if hedge_won:
+                self._stats['hedge_won'] += 1
+            if timed_out:
+                self._stats['timed_out'] += 1
+            latencies = self._latencies.setdefault(routing_key, deque(maxlen=self.window))
+            latencies.append(latency)
+            self._new_samples[routing_key] = self._new_samples.get(routing_key, 0) + 1
+            if len(latencies) < self.min_samples or \
+                    (routing_key in self._delays and self._new_samples[routing_key] < RECOMPUTE_INTERVAL):
+                return
+            self._new_samples[routing_key] = 0
+            ordered = sorted(latencies)
+        index = min(int(len(ordered) * self.percentile / 100), len(ordered) - 1)
+        delay = max(ordered[index], self.min_delay / 1000)
+        with self._lock:
+            self._delays[routing_key] = delay
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Returns the hedging counters and the current hedge delays in milliseconds.
+        """
+        with self._lock:
+            return {**self._stats,
+                    'delay_ms': {routing_key: round(delay * 1000, 3) for routing_key, delay in self._delays.items()}}
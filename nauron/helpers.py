@@ -1,18 +1,127 @@
 import logging
 import json
+import gzip
+import zlib
 from io import BytesIO
 
 from dataclasses import dataclass, asdict
-from typing import Optional, Union, Dict
+from typing import Optional, Union, Dict, Tuple, Any, List, Iterable, Iterator
 
 from flask.helpers import make_response, send_file
-from flask import jsonify, abort
+from flask import jsonify, abort, current_app, stream_with_context
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
 
 LOGGER = logging.getLogger(__name__)
 
 SIZE_WARNING_THRESHOLD = 64
 SIZE_ERROR_THRESHOLD = 128
 
+# AMQP content types of the message envelopes. The legacy format is a JSON document with all fields of the request
+# or response, the binary format carries the metadata in AMQP headers and only the content in the message body.
+JSON_ENVELOPE = 'application/json'
+BINARY_ENVELOPE = 'application/x-nauron'
+# Envelope formats by the names used in the configuration.
+ENVELOPES = {'json': JSON_ENVELOPE, 'binary': BINARY_ENVELOPE}
+
+
+def check_envelope(envelope: str):
+    """
+    Raises a ValueError if the envelope format is unknown.
+    """
+    if envelope not in ENVELOPES:
+        raise ValueError(f"Unknown envelope format: {envelope}, available formats: {list(ENVELOPES)}")
+
+
+def encode_request(content: Dict, signature: str, envelope: str = 'binary') -> Tuple[bytes, Dict[str, Any]]:
+    """
+    Encodes a request into a message body and AMQP headers. The signature is sent in a header in the binary
+    envelope and as a part of the body in the legacy JSON envelope.
+    """
+    if envelope == 'json':
+        return json.dumps({'content': content, 'signature': signature}).encode(), {}
+    return json.dumps(content).encode(), {'signature': signature}
+
+
+def decode_request(body: bytes, content_type: Optional[str], headers: Optional[Dict[str, Any]]) -> Dict:
+    """
+    Decodes a request sent either in the binary or the legacy JSON envelope into a dict with the keys 'content'
+    and 'signature'. Raises a ValueError if the message is not a valid request.
+    """
+    if content_type == BINARY_ENVELOPE:
+        return {'content': json.loads(body), 'signature': (headers or {}).get('signature', 'default')}
+    request = json.loads(body)
+    if not isinstance(request, dict) or 'content' not in request or 'signature' not in request:
+        raise ValueError("Requests in the legacy envelope must be objects with 'content' and 'signature' fields.")
+    return request
+
+
+# Messages smaller than this (in bytes) are not compressed by default.
+COMPRESSION_THRESHOLD = 64 * 1024
+
+
+def available_codecs() -> List[str]:
+    """
+    Returns the names of compression codecs that can be used in this environment. The 'lz4' codec requires the
+    optional lz4 package.
+    """
+    codecs = ['gzip', 'zlib']
+    if lz4 is not None:
+        codecs.append('lz4')
+    return codecs
+
+
+def check_codec(codec: Optional[str]):
+    """
+    Raises a ValueError if the compression codec is not available.
+    """
+    if codec is not None and codec not in available_codecs():
+        raise ValueError(f"Unsupported compression codec: {codec}, available codecs: {available_codecs()}")
+
+
+def compress(body: bytes, codec: Optional[str], threshold: int = COMPRESSION_THRESHOLD) -> Tuple[bytes, Optional[str]]:
+    """
+    Compresses the message body if it is larger than the threshold and compression actually reduces its size.
+
+    :return: the (possibly) compressed body and the value for the content_encoding message property.
+    """
+    if codec is None or len(body) < threshold:
+        return body, None
+    if codec == 'gzip':
+        compressed = gzip.compress(body, compresslevel=6)
+    elif codec == 'zlib':
+        compressed = zlib.compress(body, 6)
+    else:
+        compressed = lz4.frame.compress(body)
+    if len(compressed) >= len(body):
+        return body, None
+    return compressed, codec
+
+
+def decompress(body: bytes, content_encoding: Optional[str]) -> bytes:
+    """
+    Decompresses the message body according to its content_encoding property. Memory-mapped bodies (see
+    nauron.blob_store) are decompressed directly from the mapping, or copied if they are not compressed. Raises a
+    ValueError if the body is corrupt or truncated, whatever the codec.
+    """
+    if content_encoding is None:
+        return body if isinstance(body, bytes) else bytes(body)
+    try:
+        if content_encoding == 'gzip':
+            return gzip.decompress(body)
+        if content_encoding == 'zlib':
+            return zlib.decompress(body)
+        if content_encoding == 'lz4' and lz4 is not None:
+            return lz4.frame.decompress(body)
+    except (OSError, EOFError, zlib.error, RuntimeError) as e:
+        # Each codec reports corrupt data with a different exception type.
+        raise ValueError(f"Unable to decompress the message body ({content_encoding}): {e}") from e
+    raise ValueError(f"Unsupported content encoding: {content_encoding}")
+
+
 @dataclass
 class Response:
     """
@@ -23,9 +132,48 @@ class Response:
     mimetype: str = 'application/json'
 
     def encode(self) -> bytes:
+        """
+        Encodes the response using the legacy JSON envelope.
+        """
+        response = asdict(self)
         if type(self.content) == bytes:
-            self.content = self.content.decode('ISO-8859-1')
-        return json.dumps(asdict(self)).encode("utf8")
+            response['content'] = self.content.decode('ISO-8859-1')
+        return json.dumps(response).encode("utf8")
+
+    def encode_binary(self) -> Tuple[bytes, Dict[str, Any]]:
+        """
+        Encodes the response using the binary envelope. Binary content is used as the message body as is.
+        """
+        if self.content is None:
+            body, content_format = b'', 'none'
+        elif type(self.content) == bytes:
+            body, content_format = self.content, 'bytes'
+        elif type(self.content) == str:
+            body, content_format = self.content.encode('utf8'), 'str'
+        else:
+            body, content_format = json.dumps(self.content).encode('utf8'), 'json'
+        return body, {'http_status_code': self.http_status_code,
+                      'mimetype': self.mimetype,
+                      'content_format': content_format}
+
+    @classmethod
+    def decode(cls, body: bytes, content_type: Optional[str], headers: Optional[Dict[str, Any]]) -> 'Response':
+        """
+        Decodes a response sent either in the binary or the legacy JSON envelope.
+        """
+        if content_type != BINARY_ENVELOPE:
+            return cls(**json.loads(body))
+
+        content_format = headers.get('content_format')
+        if content_format == 'none':
+            content = None
+        elif content_format == 'bytes':
+            content = body
+        elif content_format == 'str':
+            content = body.decode('utf8')
+        else:
+            content = json.loads(body)
+        return cls(content=content, http_status_code=headers['http_status_code'], mimetype=headers['mimetype'])
 
     def flask_response(self):
         """
@@ -39,7 +187,52 @@ class Response:
 
         if self.mimetype == 'application/json':
             return make_response(jsonify(self.content), self.http_status_code)
+        elif type(self.content) == bytes:
+            # Binary content is passed on without copying it into a file-like object first.
+            response = make_response(self.content, self.http_status_code)
+            response.mimetype = self.mimetype
+            return response
         else:
-            if type(self.content) == str:
-                self.content = self.content.encode('ISO-8859-1')
-            return send_file(BytesIO(self.content), mimetype=self.mimetype)
+            return send_file(BytesIO(self.content.encode('ISO-8859-1')), mimetype=self.mimetype)
+
+
+@dataclass
+class StreamingResponse:
+    """
+    A response that is produced and transferred in chunks. Workers can return it instead of a Response to send
+    the content to the client as soon as parts of it are ready. Chunks must be bytes or str (encoded as UTF-8).
+    """
+    chunks: Iterable[Union[bytes, str]]
+    mimetype: str = 'application/octet-stream'
+    http_status_code: int = 200
+
+    def iter_bytes(self) -> Iterator[bytes]:
+        for chunk in self.chunks:
+            yield chunk.encode('utf8') if type(chunk) == str else chunk
+
+    def join(self) -> Response:
+        """
+        Collects all chunks into a regular Response.
+        """
+        return Response(content=b''.join(self.iter_bytes()), http_status_code=self.http_status_code,
+                        mimetype=self.mimetype)
+
+    def close(self):
+        """
+        Releases the stream if it is not read to the end, e.g. because the client disconnected. Called when the
+        Flask response is closed.
+        """
+        close = getattr(self.chunks, 'close', None)
+        if close is not None:
+            close()
+
+    def flask_response(self):
+        """
+        Returns a streamed Flask response or aborts the request if needed.
+        """
+        if self.http_status_code != 200:
+            self.close()
+            abort(status=self.http_status_code)
+        response = current_app.response_class(stream_with_context(self.iter_bytes()), mimetype=self.mimetype)
+        response.call_on_close(self.close)
+        return response
@@ -0,0 +1,116 @@
+import queue
+import logging
+import threading
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, ProcessPoolExecutor
+
+from typing import Dict, Optional, Union
+
+from nauron.helpers import Response, StreamingResponse
+from nauron.worker import Worker
+
+LOGGER = logging.getLogger(__name__)
+
+_PROCESS_WORKER: Optional[Worker] = None
+
+
+def _init_process_worker(worker: Worker):
+    """
+    Stores a copy of the worker in a process pool worker process.
+    """
+    global _PROCESS_WORKER
+    _PROCESS_WORKER = worker
+
+
+def _process_in_subprocess(content: Dict, signature: str) -> Response:
+    """
+    Generators cannot be passed between processes, so streamed responses are collected in the worker process.
+    """
+    response = _PROCESS_WORKER.process_request(content, signature)
+    if isinstance(response, StreamingResponse):
+        response = response.join()
+    return response
+
+
+class LocalExecutor:
+    def __init__(self, worker: Worker, executor: str = 'thread', concurrency: int = 1,
+                 max_queue_size: Optional[int] = None):
+        """
+        Runs a local worker in a bounded thread or process pool instead of the Flask thread that handles the
+        request, so that a CPU-heavy worker cannot oversubscribe the cores or starve other endpoints.
+
+        :param worker: A nauron Worker instance.
+        :param executor: 'thread' to use a thread pool or 'process' to use a process pool, in which case the worker
+        must be picklable and each process uses its own copy of it.
+        :param concurrency: Number of requests processed simultaneously.
+        :param max_queue_size: Maximum number of requests waiting for a free thread or process, further requests
+        are rejected. Unlimited by default.
+        """
+        if executor not in ('thread', 'process'):
+            raise ValueError(f"Unknown executor type: {executor}")
+        if concurrency < 1:
+            raise ValueError("Concurrency must be at least 1.")
+        self.worker = worker
+        self.executor_type = executor
+        self.concurrency = concurrency
+        self.max_queue_size = max_queue_size
+
+        self._pending = 0
+        self._running = 0
+        self._stats = {'processed': 0, 'rejected': 0}
+        self._lock = threading.Lock()
+        if executor == 'thread':
+            self._executor: Executor = ThreadPoolExecutor(max_workers=concurrency,
+                                                          thread_name_prefix='nauron-local-worker')
+        else:
+            self._executor = ProcessPoolExecutor(max_workers=concurrency, initializer=_init_process_worker,
+                                                 initargs=(worker,))
+
+    def _run(self, content: Dict, signature: str) -> Union[Response, StreamingResponse]:
+        with self._lock:
+            self._running += 1
+        try:
+            return self.worker.process_request(content, signature)
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def _on_done(self, _: Future):
+        with self._lock:
+            self._pending -= 1
+            self._stats['processed'] += 1
+
+    def process_request(self, content: Dict, signature: str) -> Union[Response, StreamingResponse]:
+        """
+        Processes the request in the pool and blocks until it is done. Raises queue.Full if the queue of waiting
+        requests is full. Streamed responses of thread pool workers are produced by the calling thread.
+        """
+        with self._lock:
+            if self.max_queue_size is not None and self._pending >= self.concurrency + self.max_queue_size:
+                self._stats['rejected'] += 1
+                raise queue.Full
+            self._pending += 1
+        try:
+            if self.executor_type == 'process':
+                future = self._executor.submit(_process_in_subprocess, content, signature)
+            else:
+                future = self._executor.submit(self._run, content, signature)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        future.add_done_callback(self._on_done)
+        return future.result()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the number of requests being processed and waiting in the queue and counters of past requests.
+        """
+        with self._lock:
+            running = self._running if self.executor_type == 'thread' else min(self._pending, self.concurrency)
+            return {'running': running, 'queued': self._pending - running, **self._stats}
+
+    def close(self):
+        """
+        Shuts down the pool once the pending requests have been processed.
+        """
+        self._executor.shutdown(wait=False)
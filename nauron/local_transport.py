@@ -0,0 +1,339 @@
+import os
+import uuid
+import logging
+import threading
+from time import time
+from types import SimpleNamespace
+from multiprocessing.managers import BaseManager
+
+from typing import Dict, List, Optional, Tuple, Any
+
+import pika
+import pika.exceptions
+from pika.adapters.blocking_connection import ReturnedMessage
+
+from nauron.transport import Transport
+from nauron.memory_broker import InMemoryBroker, EventLoopConnection, MessageCallback
+
+LOGGER = logging.getLogger(__name__)
+
+# Maximum time in seconds that a consumer waits for messages before checking whether its channel is still open.
+POLL_INTERVAL = 1
+
+
+class _SharedBroker:
+    """
+    The broker state that lives in the server process of a LocalTransport. Clients call its methods through a
+    multiprocessing manager, each client connection being served by a separate thread.
+    """
+
+    def __init__(self):
+        self._broker = InMemoryBroker()
+
+    def exchange_declare(self, exchange: str):
+        with self._broker._condition:
+            self._broker._bindings.setdefault(exchange, {})
+
+    def queue_declare(self, queue: str, passive: bool, arguments: Optional[Dict],
+                      owner: Optional[str]) -> Tuple[str, int, int]:
+        with self._broker._condition:
+            declared = self._broker._declare_queue(queue, passive, arguments, owner)
+            return declared.name, len(declared.messages), declared.consumers
+
+    def queue_bind(self, queue: str, exchange: str, routing_key: str):
+        with self._broker._condition:
+            if exchange not in self._broker._bindings or queue not in self._broker._queues:
+                raise pika.exceptions.ChannelClosedByBroker(404, f"NOT_FOUND - {exchange} or {queue}")
+            self._broker._bindings[exchange].setdefault(routing_key, set()).add(queue)
+
+    def publish(self, exchange: str, routing_key: str, properties: pika.BasicProperties, body: bytes) -> bool:
+        with self._broker._condition:
+            return self._broker._publish(exchange, routing_key, properties, body)
+
+    def consume(self, queue: str, delta: int = 1):
+        with self._broker._condition:
+            if queue not in self._broker._queues:
+                raise pika.exceptions.ChannelClosedByBroker(404, f"NOT_FOUND - no queue '{queue}'")
+            self._broker._queues[queue].consumers += delta
+            self._broker._condition.notify_all()
+
+    def get(self, queues: List[str], timeout: float) -> Optional[Tuple[str, pika.BasicProperties, bytes, str]]:
+        """
+        Removes and returns the next message from any of the queues, waiting up to timeout seconds for one.
+        """
+        deadline = time() + timeout
+        with self._broker._condition:
+            while True:
+                for name in queues:
+                    queue = self._broker._queues.get(name)
+                    message = queue.pop() if queue is not None else None
+                    if message is not None:
+                        properties, body, routing_key, _ = message
+                        return name, properties, body, routing_key
+                remaining = deadline - time()
+                if remaining <= 0:
+                    return None
+                self._broker._condition.wait(remaining)
+
+    def disconnect(self, owner: str):
+        with self._broker._condition:
+            self._broker._delete_exclusive_queues(owner)
+
+
+_SHARED_BROKER: Optional[_SharedBroker] = None
+
+
+def _get_shared_broker() -> _SharedBroker:
+    global _SHARED_BROKER
+    if _SHARED_BROKER is None:
+        _SHARED_BROKER = _SharedBroker()
+    return _SHARED_BROKER
+
+
+class _BrokerManager(BaseManager):
+    pass
+
+
+_BrokerManager.register('broker', callable=_get_shared_broker)
+
+
+class LocalTransport(Transport):
+    def __init__(self, address: Any = None, authkey: Optional[bytes] = None):
+        """
+        A transport for services and workers running in different processes on the same host without a broker,
+        e.g. in development, tests or small single-host deployments. The queues are kept in a server process
+        started with start() (a multiprocessing manager) and every operation is a call to it over a local socket
+        with pickled arguments. The transport can be passed to other processes (e.g. as an argument of
+        multiprocessing.Process) or recreated there using the same address and authkey.
+
+        It is not a shared-memory or low-latency path: each message is copied through the server process, which
+        makes it slower than the in-process nauron.memory_broker.InMemoryBroker (see nauron.bench). Messages are
+        removed from the queues when they are delivered and acknowledgements only release prefetch slots, so
+        unlike RabbitMQ, requests of a worker that dies are lost instead of redelivered, and nothing survives a
+        restart of the server process.
+
+        :param address: Address of the server process, a Unix socket is used by default.
+        :param authkey: Authentication key shared by all processes, a random key is generated by default.
+        """
+        self.address = address
+        self.authkey = authkey or os.urandom(32)
+        self._manager: Optional[_BrokerManager] = None
+
+    def start(self) -> 'LocalTransport':
+        """
+        Starts the server process that holds the queues.
+        """
+        self._manager = _BrokerManager(address=self.address, authkey=self.authkey)
+        self._manager.start()
+        self.address = self._manager.address
+        LOGGER.info(f"Local transport started: {{address: {self.address}}}")
+        return self
+
+    def shutdown(self):
+        """
+        Stops the server process if it was started by this instance.
+        """
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+
+    def connect(self) -> 'LocalConnection':
+        if self.address is None:
+            raise pika.exceptions.AMQPConnectionError("The local transport has not been started.")
+        manager = _BrokerManager(address=self.address, authkey=self.authkey)
+        try:
+            manager.connect()
+        except OSError as e:
+            raise pika.exceptions.AMQPConnectionError(e)
+        return LocalConnection(manager.broker())
+
+    def __getstate__(self):
+        return {'address': self.address, 'authkey': self.authkey, '_manager': None}
+
+    def __str__(self):
+        return f'{{address: {self.address}}}'
+
+
+class LocalChannel:
+    def __init__(self, connection: 'LocalConnection'):
+        self.connection = connection
+        self.is_open = True
+        self._prefetch_count = 0
+        self._callbacks: Dict[str, Tuple[MessageCallback, bool]] = {}
+        self._inbox: List[Tuple[str, pika.BasicProperties, bytes, str]] = []
+        self._unacked = set()
+        self._delivery_tag = 0
+        self._consuming = False
+        self._receiver: Optional[threading.Thread] = None
+
+    @property
+    def _broker(self):
+        return self.connection.broker
+
+    @property
+    def _condition(self) -> threading.Condition:
+        return self.connection._condition
+
+    def _call(self, method: str, *args):
+        if not self.is_open or not self.connection.is_open:
+            raise pika.exceptions.ChannelWrongStateError('Channel is closed.')
+        try:
+            return getattr(self._broker, method)(*args)
+        except pika.exceptions.ChannelClosedByBroker:
+            self.close()
+            raise
+        except (OSError, EOFError) as e:
+            self.connection._lost(e)
+            raise pika.exceptions.StreamLostError(str(e))
+
+    def confirm_delivery(self):
+        # Publishing waits for the server process, so every message is confirmed right away.
+        pass
+
+    def exchange_declare(self, exchange: str, exchange_type: str = 'direct', **_):
+        self._call('exchange_declare', exchange)
+
+    def queue_declare(self, queue: str = '', passive: bool = False, exclusive: bool = False,
+                      arguments: Optional[Dict] = None, **_) -> SimpleNamespace:
+        name, message_count, consumer_count = self._call('queue_declare', queue, passive, arguments,
+                                                         self.connection.id if exclusive else None)
+        return SimpleNamespace(method=SimpleNamespace(queue=name, message_count=message_count,
+                                                      consumer_count=consumer_count))
+
+    def queue_bind(self, queue: str, exchange: str, routing_key: Optional[str] = None, **_):
+        self._call('queue_bind', queue, exchange, routing_key or queue)
+
+    def basic_qos(self, prefetch_count: int = 0, **_):
+        self._prefetch_count = prefetch_count
+
+    def basic_publish(self, exchange: str, routing_key: str, body: bytes,
+                      properties: Optional[pika.BasicProperties] = None, mandatory: bool = False):
+        properties = properties or pika.BasicProperties()
+        routed = self._call('publish', exchange, routing_key, properties, body)
+        if not routed and mandatory:
+            method = pika.spec.Basic.Return(reply_code=312, reply_text='NO_ROUTE', exchange=exchange,
+                                            routing_key=routing_key)
+            raise pika.exceptions.UnroutableError([ReturnedMessage(method, properties, body)])
+
+    def basic_consume(self, queue: str, on_message_callback: MessageCallback, auto_ack: bool = False, **_) -> str:
+        self._call('consume', queue)
+        with self._condition:
+            self._callbacks[queue] = (on_message_callback, auto_ack)
+        if self._receiver is None:
+            self._receiver = threading.Thread(target=self._receive, name='nauron-local-receiver', daemon=True)
+            self._receiver.start()
+        return f'ctag-{uuid.uuid4().hex}'
+
+    def basic_ack(self, delivery_tag: int = 0, multiple: bool = False):
+        with self._condition:
+            if multiple:
+                self._unacked = {tag for tag in self._unacked if tag > delivery_tag}
+            else:
+                self._unacked.discard(delivery_tag)
+            self._condition.notify_all()
+
+    def start_consuming(self):
+        self._consuming = True
+        while self._consuming and self.is_open and self.connection.is_open:
+            self.connection.process_data_events(time_limit=None)
+
+    def stop_consuming(self):
+        self._consuming = False
+
+    def close(self):
+        with self._condition:
+            if not self.is_open:
+                return
+            self.is_open = False
+            queues = list(self._callbacks)
+            self._callbacks = {}
+            self._condition.notify_all()
+        if self.connection.is_open:
+            for queue in queues:
+                try:
+                    self._broker.consume(queue, -1)
+                except Exception as e:
+                    LOGGER.debug(e)
+
+    def _has_capacity(self) -> bool:
+        # Only one message is buffered locally, the rest is left in the queues for other consumers.
+        if self._inbox:
+            return False
+        return not self._prefetch_count or len(self._unacked) < self._prefetch_count
+
+    def _receive(self):
+        """
+        Fetches messages from the server process in the background and hands them over to the connection thread.
+        """
+        # Proxies open a separate connection to the server process for each thread, so waiting for messages here
+        # does not hold up publishing on the connection thread.
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: not self.is_open or self._has_capacity())
+                if not self.is_open:
+                    return
+                queues = list(self._callbacks)
+            try:
+                message = self._broker.get(queues, POLL_INTERVAL)
+            except (OSError, EOFError) as e:
+                self.connection._lost(e)
+                return
+            if message is not None:
+                with self._condition:
+                    self._inbox.append(message)
+                    self._condition.notify_all()
+
+    def _next_delivery(self) -> Optional[Tuple[MessageCallback, SimpleNamespace, pika.BasicProperties, bytes]]:
+        if not self.is_open or not self._inbox:
+            return None
+        queue, properties, body, routing_key = self._inbox.pop(0)
+        # Called while holding the condition, lets the receiver fetch the next message.
+        self._condition.notify_all()
+        if queue not in self._callbacks:
+            return None
+        callback, auto_ack = self._callbacks[queue]
+        self._delivery_tag += 1
+        if not auto_ack:
+            self._unacked.add(self._delivery_tag)
+        method = SimpleNamespace(delivery_tag=self._delivery_tag, routing_key=routing_key, redelivered=False,
+                                 consumer_tag=None, exchange='')
+        return callback, method, properties, body
+
+
+class LocalConnection(EventLoopConnection):
+    def __init__(self, broker):
+        super().__init__(threading.Condition())
+        self.broker = broker
+        self.id = uuid.uuid4().hex
+
+    def _lost(self, error: Exception):
+        LOGGER.error(f"Lost connection to the local transport: {error}")
+        with self._condition:
+            self.is_open = False
+            self._condition.notify_all()
+
+    def channel(self) -> LocalChannel:
+        if not self.is_open:
+            raise pika.exceptions.ConnectionWrongStateError('Connection is closed.')
+        channel = LocalChannel(self)
+        self._channels.append(channel)
+        return channel
+
+    def process_data_events(self, time_limit: Optional[float] = 0):
+        if not self.is_open:
+            raise pika.exceptions.StreamLostError('Connection to the local transport is closed.')
+        super().process_data_events(time_limit)
+
+    def close(self):
+        if not self.is_open:
+            return
+        for channel in self._channels:
+            channel.close()
+        try:
+            self.broker.disconnect(self.id)
+        except Exception as e:
+            LOGGER.debug(e)
+        with self._condition:
+            self.is_open = False
+            self._callbacks = []
+            self._condition.notify_all()
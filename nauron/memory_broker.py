@@ -0,0 +1,351 @@
+import uuid
+import heapq
+import itertools
+import logging
+import threading
+from time import time
+from functools import partial
+from types import SimpleNamespace
+
+from typing import Dict, List, Optional, Set, Tuple, Callable, Any
+
+import pika
+import pika.exceptions
+from pika.adapters.blocking_connection import ReturnedMessage
+
+from nauron.transport import Transport
+
+LOGGER = logging.getLogger(__name__)
+
+MessageCallback = Callable[['InMemoryChannel', Any, pika.BasicProperties, bytes], None]
+
+
+class _Queue:
+    def __init__(self, name: str, max_priority: Optional[int] = None, owner: Any = None):
+        self.name = name
+        self.max_priority = max_priority
+        self.owner = owner
+        self.messages: List[Tuple[int, int, float, pika.BasicProperties, bytes, str, bool]] = []
+        self.consumers = 0
+
+    def push(self, sequence: int, properties: pika.BasicProperties, body: bytes, routing_key: str,
+             redelivered: bool = False):
+        priority = 0
+        if self.max_priority is not None and properties.priority:
+            priority = -min(properties.priority, self.max_priority)
+        expires = float('inf') if properties.expiration is None else time() + int(properties.expiration) / 1000
+        heapq.heappush(self.messages, (priority, sequence, expires, properties, body, routing_key, redelivered))
+
+    def pop(self) -> Optional[Tuple[pika.BasicProperties, bytes, str, bool]]:
+        now = time()
+        while self.messages:
+            _, _, expires, properties, body, routing_key, redelivered = heapq.heappop(self.messages)
+            if expires >= now:
+                return properties, body, routing_key, redelivered
+        return None
+
+
+class InMemoryBroker(Transport):
+    """
+    An in-process transport that keeps all exchanges and queues in memory. It supports direct exchanges,
+    mandatory publishing, per-message TTL, priority queues, prefetch limits and acknowledgements, so producers,
+    routers and consumers can run in a single process without a broker, e.g. in tests and benchmarks.
+    """
+    host = 'in-memory'
+    port = 0
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._bindings: Dict[str, Dict[str, Set[str]]] = {}
+        self._queues: Dict[str, _Queue] = {}
+        self._sequence = itertools.count()
+
+    def connect(self) -> 'InMemoryConnection':
+        return InMemoryConnection(self)
+
+    def consumer_count(self, queue: str) -> int:
+        with self._condition:
+            return self._queues[queue].consumers if queue in self._queues else 0
+
+    def wait_for_consumers(self, queue: str, count: int = 1, timeout: Optional[float] = None) -> bool:
+        """
+        Blocks until at least count consumers are listening to the queue.
+        """
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: queue in self._queues and self._queues[queue].consumers >= count, timeout)
+
+    # The methods below are called by connections and channels while holding the lock.
+
+    def _declare_queue(self, name: str, passive: bool, arguments: Optional[Dict], owner: Any) -> _Queue:
+        if name not in self._queues:
+            if passive:
+                raise pika.exceptions.ChannelClosedByBroker(404, f"NOT_FOUND - no queue '{name}'")
+            name = name or f'amq.gen-{uuid.uuid4().hex}'
+            max_priority = (arguments or {}).get('x-max-priority')
+            self._queues[name] = _Queue(name, max_priority, owner)
+        return self._queues[name]
+
+    def _route(self, exchange: str, routing_key: str) -> List[_Queue]:
+        if exchange == '':
+            return [self._queues[routing_key]] if routing_key in self._queues else []
+        if exchange not in self._bindings:
+            raise pika.exceptions.ChannelClosedByBroker(404, f"NOT_FOUND - no exchange '{exchange}'")
+        return [self._queues[name] for name in self._bindings[exchange].get(routing_key, ())
+                if name in self._queues]
+
+    def _publish(self, exchange: str, routing_key: str, properties: pika.BasicProperties, body: bytes) -> bool:
+        queues = self._route(exchange, routing_key)
+        for queue in queues:
+            queue.push(next(self._sequence), properties, body, routing_key)
+        if queues:
+            self._condition.notify_all()
+        return bool(queues)
+
+    def _delete_queue(self, name: str):
+        self._queues.pop(name, None)
+        for bindings in self._bindings.values():
+            for queues in bindings.values():
+                queues.discard(name)
+
+    def _delete_exclusive_queues(self, owner: Any):
+        for name, queue in list(self._queues.items()):
+            if queue.owner == owner:
+                self._delete_queue(name)
+
+    def __str__(self):
+        return 'in-memory'
+
+
+class InMemoryChannel:
+    def __init__(self, connection: 'InMemoryConnection'):
+        self.connection = connection
+        self.is_open = True
+        self._prefetch_count = 0
+        self._consumers: List[Tuple[str, MessageCallback, bool]] = []
+        self._unacked: Dict[int, Tuple[_Queue, pika.BasicProperties, bytes, str]] = {}
+        self._delivery_tags = itertools.count(1)
+        self._consuming = False
+
+    @property
+    def _broker(self) -> InMemoryBroker:
+        return self.connection.broker
+
+    def _check_open(self):
+        if not self.is_open or not self.connection.is_open:
+            raise pika.exceptions.ChannelWrongStateError('Channel is closed.')
+
+    def _fail(self, error: pika.exceptions.ChannelClosedByBroker):
+        self._close()
+        raise error
+
+    def confirm_delivery(self):
+        # Publishing is synchronous, so every message is confirmed right away.
+        self._check_open()
+
+    def exchange_declare(self, exchange: str, exchange_type: str = 'direct', **_):
+        self._check_open()
+        with self._broker._condition:
+            self._broker._bindings.setdefault(exchange, {})
+
+    def queue_declare(self, queue: str = '', passive: bool = False, exclusive: bool = False,
+                      arguments: Optional[Dict] = None, **_) -> SimpleNamespace:
+        self._check_open()
+        with self._broker._condition:
+            try:
+                declared = self._broker._declare_queue(queue, passive, arguments,
+                                                       self.connection if exclusive else None)
+            except pika.exceptions.ChannelClosedByBroker as e:
+                self._fail(e)
+            return SimpleNamespace(method=SimpleNamespace(queue=declared.name, message_count=len(declared.messages),
+                                                          consumer_count=declared.consumers))
+
+    def queue_bind(self, queue: str, exchange: str, routing_key: Optional[str] = None, **_):
+        self._check_open()
+        with self._broker._condition:
+            if exchange not in self._broker._bindings or queue not in self._broker._queues:
+                self._fail(pika.exceptions.ChannelClosedByBroker(404, f"NOT_FOUND - {exchange} or {queue}"))
+            self._broker._bindings[exchange].setdefault(routing_key or queue, set()).add(queue)
+
+    def basic_qos(self, prefetch_count: int = 0, **_):
+        self._check_open()
+        self._prefetch_count = prefetch_count
+
+    def basic_publish(self, exchange: str, routing_key: str, body: bytes,
+                      properties: Optional[pika.BasicProperties] = None, mandatory: bool = False):
+        self._check_open()
+        properties = properties or pika.BasicProperties()
+        with self._broker._condition:
+            try:
+                routed = self._broker._publish(exchange, routing_key, properties, body)
+            except pika.exceptions.ChannelClosedByBroker as e:
+                self._fail(e)
+        if not routed and mandatory:
+            method = pika.spec.Basic.Return(reply_code=312, reply_text='NO_ROUTE', exchange=exchange,
+                                            routing_key=routing_key)
+            raise pika.exceptions.UnroutableError([ReturnedMessage(method, properties, body)])
+
+    def basic_consume(self, queue: str, on_message_callback: MessageCallback, auto_ack: bool = False, **_) -> str:
+        self._check_open()
+        with self._broker._condition:
+            if queue not in self._broker._queues:
+                self._fail(pika.exceptions.ChannelClosedByBroker(404, f"NOT_FOUND - no queue '{queue}'"))
+            self._broker._queues[queue].consumers += 1
+            self._consumers.append((queue, on_message_callback, auto_ack))
+            self._broker._condition.notify_all()
+        return f'ctag-{uuid.uuid4().hex}'
+
+    def basic_ack(self, delivery_tag: int = 0, multiple: bool = False):
+        self._check_open()
+        with self._broker._condition:
+            tags = [tag for tag in self._unacked if tag <= delivery_tag] if multiple else [delivery_tag]
+            for tag in tags:
+                self._unacked.pop(tag, None)
+            self._broker._condition.notify_all()
+
+    def start_consuming(self):
+        self._consuming = True
+        while self._consuming and self.is_open and self.connection.is_open:
+            self.connection.process_data_events(time_limit=None)
+
+    def stop_consuming(self):
+        self._consuming = False
+
+    def close(self):
+        with self._broker._condition:
+            self._close()
+
+    def _close(self):
+        if not self.is_open:
+            return
+        self.is_open = False
+        for queue, _, _ in self._consumers:
+            if queue in self._broker._queues:
+                self._broker._queues[queue].consumers -= 1
+        self._consumers = []
+        # Unacknowledged messages are returned to their queues just like RabbitMQ does.
+        for queue, properties, body, routing_key in self._unacked.values():
+            if queue.name in self._broker._queues:
+                queue.push(next(self._broker._sequence), properties, body, routing_key, redelivered=True)
+        self._unacked = {}
+        self._broker._condition.notify_all()
+
+    def _next_delivery(self) -> Optional[Tuple[MessageCallback, SimpleNamespace, pika.BasicProperties, bytes]]:
+        if not self.is_open:
+            return None
+        for queue_name, callback, auto_ack in self._consumers:
+            if self._prefetch_count and not auto_ack and len(self._unacked) >= self._prefetch_count:
+                return None
+            queue = self._broker._queues.get(queue_name)
+            message = queue.pop() if queue is not None else None
+            if message is None:
+                continue
+            properties, body, routing_key, redelivered = message
+            delivery_tag = next(self._delivery_tags)
+            if not auto_ack:
+                self._unacked[delivery_tag] = (queue, properties, body, routing_key)
+            method = SimpleNamespace(delivery_tag=delivery_tag, routing_key=routing_key, redelivered=redelivered,
+                                     consumer_tag=None, exchange='')
+            return callback, method, properties, body
+        return None
+
+
+class EventLoopConnection:
+    def __init__(self, condition: threading.Condition):
+        """
+        The event loop of a pika-compatible blocking connection. Callbacks, timers and deliveries are dispatched
+        on the thread that calls process_data_events(). Subclasses open channels that implement _next_delivery()
+        and notify the condition whenever a delivery becomes available.
+        """
+        self.is_open = True
+        self._condition = condition
+        self._channels: List[Any] = []
+        self._callbacks: List[Callable[[], None]] = []
+        self._timers: Dict[int, Tuple[float, Callable[[], None]]] = {}
+        self._timer_ids = itertools.count()
+        self._next_channel = 0
+
+    @property
+    def is_closed(self) -> bool:
+        return not self.is_open
+
+    def add_callback_threadsafe(self, callback: Callable[[], None]):
+        with self._condition:
+            if not self.is_open:
+                raise pika.exceptions.ConnectionWrongStateError('Connection is closed.')
+            self._callbacks.append(callback)
+            self._condition.notify_all()
+
+    def call_later(self, delay: float, callback: Callable[[], None]) -> int:
+        timer_id = next(self._timer_ids)
+        self._timers[timer_id] = (time() + delay, callback)
+        return timer_id
+
+    def remove_timeout(self, timer_id: int):
+        self._timers.pop(timer_id, None)
+
+    def _next_event(self) -> Optional[Callable[[], None]]:
+        if self._callbacks:
+            return self._callbacks.pop(0)
+        now = time()
+        for timer_id, (due, callback) in list(self._timers.items()):
+            if due <= now:
+                del self._timers[timer_id]
+                return callback
+        # Channels are polled in turns so that a busy channel does not hold up the deliveries of the others.
+        for i in range(len(self._channels)):
+            channel = self._channels[(self._next_channel + i) % len(self._channels)]
+            delivery = channel._next_delivery()
+            if delivery is not None:
+                self._next_channel = (self._next_channel + i + 1) % len(self._channels)
+                callback, method, properties, body = delivery
+                return partial(callback, channel, method, properties, body)
+        return None
+
+    def process_data_events(self, time_limit: Optional[float] = 0):
+        """
+        Waits up to time_limit seconds (indefinitely if None) for an event and dispatches all pending events on
+        the calling thread, like pika.BlockingConnection does.
+        """
+        if not self.is_open:
+            raise pika.exceptions.ConnectionWrongStateError('Connection is closed.')
+        deadline = None if time_limit is None else time() + time_limit
+        with self._condition:
+            event = self._next_event()
+            while event is None and self.is_open:
+                timeout = None if deadline is None else deadline - time()
+                if self._timers:
+                    next_timer = min(due for due, _ in self._timers.values()) - time()
+                    timeout = next_timer if timeout is None else min(timeout, next_timer)
+                if timeout is not None and timeout <= 0:
+                    break
+                self._condition.wait(timeout)
+                event = self._next_event()
+        while event is not None:
+            event()
+            with self._condition:
+                event = self._next_event() if self.is_open else None
+
+
+class InMemoryConnection(EventLoopConnection):
+    def __init__(self, broker: InMemoryBroker):
+        super().__init__(broker._condition)
+        self.broker = broker
+
+    def channel(self) -> InMemoryChannel:
+        if not self.is_open:
+            raise pika.exceptions.ConnectionWrongStateError('Connection is closed.')
+        channel = InMemoryChannel(self)
+        self._channels.append(channel)
+        return channel
+
+    def close(self):
+        with self.broker._condition:
+            if not self.is_open:
+                return
+            self.is_open = False
+            for channel in self._channels:
+                channel._close()
+            self.broker._delete_exclusive_queues(self)
+            self._callbacks = []
+            self.broker._condition.notify_all()
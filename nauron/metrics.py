@@ -0,0 +1,241 @@
+import logging
+import threading
+from bisect import bisect_left
+from socketserver import ThreadingMixIn
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from typing import Dict, List, Tuple, Sequence, Optional
+
+LOGGER = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+SIZE_BUCKETS = tuple(2 ** exponent for exponent in range(8, 28, 2))
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: str = '') -> str:
+    labels = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+
+class Metric:
+    type_name = 'untyped'
+
+    def __init__(self, name: str, description: str, label_names: Sequence[str] = ()):
+        """
+        A metric with a fixed set of label names. Values are stored separately for each combination of label
+        values.
+        """
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(labels.get(name, '') for name in self.label_names)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} {self.type_name}']
+        lines.extend(self._samples())
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    type_name = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f'{self.name}{_format_labels(self.label_names, key)} {value}' for key, value in values]
+
+
+class Gauge(Counter):
+    type_name = 'gauge'
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name: str, description: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, description, label_names)
+        self.buckets = tuple(sorted(buckets))
+        # Per label combination: the count in each bucket (the last one being +Inf), the sum and the total count.
+        self._values: Dict[Tuple, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            if key not in self._values:
+                self._values[key] = ([0] * (len(self.buckets) + 1), [0.0, 0])
+            counts, totals = self._values[key]
+            counts[bisect_left(self.buckets, value)] += 1
+            totals[0] += value
+            totals[1] += 1
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            values = self._values.get(self._key(labels))
+            return 0 if values is None else values[1][1]
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = [(key, list(counts), list(totals)) for key, (counts, totals) in self._values.items()]
+        lines = []
+        for key, counts, (total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = 'le="{}"'.format('+Inf' if bound == float('inf') else repr(bound))
+                lines.append(f'{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.label_names, key)} {total}')
+            lines.append(f'{self.name}_count{_format_labels(self.label_names, key)} {count}')
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        """
+        A collection of metrics that can be rendered in the Prometheus text exposition format.
+        """
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, metric_class, name: str, *args, **kwargs):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = metric_class(name, *args, **kwargs)
+            metric = self._metrics[name]
+        if not isinstance(metric, metric_class):
+            raise ValueError(f"Metric {name} is already registered as a {metric.type_name}.")
+        return metric
+
+    def counter(self, name: str, description: str, label_names: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, description, label_names)
+
+    def gauge(self, name: str, description: str, label_names: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, description, label_names)
+
+    def histogram(self, name: str, description: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, description, label_names, buckets=buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+# API side
+REQUESTS = REGISTRY.counter('nauron_requests_total', 'Requests processed by services.',
+                            ('service', 'routing_key', 'signature', 'status'))
+REQUEST_DURATION = REGISTRY.histogram('nauron_request_duration_seconds',
+                                      'End-to-end request latency (time to first byte for streamed responses).',
+                                      ('service', 'routing_key', 'signature'))
+REQUESTS_IN_FLIGHT = REGISTRY.gauge('nauron_requests_in_flight', 'Requests currently being processed.',
+                                    ('service', 'routing_key', 'signature'))
+REQUESTS_REJECTED = REGISTRY.counter('nauron_requests_rejected_total',
+                                     'Requests rejected by admission control or validation.', ('service', 'reason'))
+REQUEST_SIZE = REGISTRY.histogram('nauron_request_size_bytes', 'Size of requests published to RabbitMQ.',
+                                  ('service',), buckets=SIZE_BUCKETS)
+RESPONSE_SIZE = REGISTRY.histogram('nauron_response_size_bytes', 'Size of responses received from RabbitMQ.',
+                                   ('service',), buckets=SIZE_BUCKETS)
+REQUESTS_HEDGED = REGISTRY.counter('nauron_requests_hedged_total',
+                                   'Requests to remote workers that were duplicated because their response was late, '
+                                   'by the copy that responded first.', ('service', 'winner'))
+
+# Worker side
+WORKER_REQUESTS = REGISTRY.counter('nauron_worker_requests_total', 'Requests processed by the worker.',
+                                   ('service', 'routing_key', 'signature', 'status'))
+WORKER_QUEUE_TIME = REGISTRY.histogram('nauron_worker_queue_seconds',
+                                       'Time between publishing a request and the worker receiving it.',
+                                       ('service', 'routing_key'))
+WORKER_PROCESSING_TIME = REGISTRY.histogram('nauron_worker_processing_seconds',
+                                            'Time spent in Worker.process_request() or Worker.process_batch().',
+                                            ('service', 'routing_key', 'signature'))
+WORKER_RESPONSE_SIZE = REGISTRY.histogram('nauron_worker_response_size_bytes', 'Size of published responses.',
+                                          ('service', 'routing_key'), buckets=SIZE_BUCKETS)
+WORKER_REDELIVERED = REGISTRY.counter('nauron_worker_redelivered_total',
+                                      'Requests redelivered by the broker by outcome: replayed from the replay cache, '
+                                      'joined to the original delivery still in progress, processed again, or '
+                                      'expired or rejected as undecodable without processing.',
+                                      ('service', 'routing_key', 'outcome'))
+MODEL_LOAD_TIME = REGISTRY.histogram('nauron_model_load_seconds', 'Time spent loading models on demand.',
+                                     ('registry',))
+MODEL_EVICTIONS = REGISTRY.counter('nauron_model_evictions_total', 'Models unloaded by the model registry.',
+                                   ('registry', 'reason'))
+MODELS_LOADED = REGISTRY.gauge('nauron_models_loaded', 'Models currently held by the model registry.', ('registry',))
+
+# Both sides
+BROKER_RECONNECTS = REGISTRY.counter('nauron_broker_reconnects_total',
+                                     'Connections to the message broker re-established after a failure.',
+                                     ('component',))
+BROKER_DOWNTIME = REGISTRY.histogram('nauron_broker_downtime_seconds',
+                                     'Time between losing the connection to the message broker and reconnecting.',
+                                     ('component',))
+SERIALIZATION_TIME = REGISTRY.histogram('nauron_serialization_seconds',
+                                        'Time spent encoding, decoding and (de)compressing messages.',
+                                        ('service', 'operation'))
+
+
+class _MetricsServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry: MetricsRegistry = REGISTRY
+
+    def do_GET(self):
+        body = self.registry.render().encode('utf8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        LOGGER.debug(format % args)
+
+
+def start_metrics_server(port: int, address: str = '',
+                         registry: Optional[MetricsRegistry] = None) -> HTTPServer:
+    """
+    Starts a lightweight HTTP server in a background thread that serves the metrics on any path.
+    """
+    handler = type('MetricsHandler', (_MetricsHandler,), {'registry': registry or REGISTRY})
+    server = _MetricsServer((address, port), handler)
+    threading.Thread(target=server.serve_forever, name='nauron-metrics', daemon=True).start()
+    LOGGER.info(f"Serving metrics: {{address: {address or '0.0.0.0'}, port: {server.server_address[1]}}}")
+    return server
@@ -0,0 +1,222 @@
+import logging
+import threading
+from time import time
+from contextlib import contextmanager
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from nauron.metrics import MODEL_LOAD_TIME, MODEL_EVICTIONS, MODELS_LOADED
+
+LOGGER = logging.getLogger(__name__)
+
+# Maximum time in seconds between checks for idle models.
+IDLE_CHECK_INTERVAL = 10
+
+
+@dataclass
+class _Entry:
+    model: Any
+    size: float
+    last_used: float
+    users: int = 0
+
+
+class ModelRegistry:
+    def __init__(self, loader: Callable[[str], Any],
+                 max_size: Optional[float] = None,
+                 sizeof: Callable[[Any], float] = lambda model: 1,
+                 idle_timeout: Optional[float] = None,
+                 unloader: Optional[Callable[[str, Any], None]] = None,
+                 name: str = 'default'):
+        """
+        Loads models on demand for workers that serve many models (e.g. one per language pair behind dynamic
+        routing keys) and keeps the recently used ones within a memory budget. A worker typically creates the
+        registry in its __init__() and looks up the model in process_request() based on the request content or
+        signature:
+
+            self.models = ModelRegistry(load_model, max_size=4, idle_timeout=600)
+            self.models.warm_up(['et-en', 'en-et'])
+            ...
+            with self.models.use(f"{content['src']}-{content['tgt']}") as model:
+                ...
+
+        Concurrent requests for a model that is not loaded yet wait for a single load. Once the total size exceeds
+        max_size, the least recently used models are unloaded. Models that are in use are never unloaded, so the
+        budget may be exceeded while they are.
+
+        :param loader: A function that loads the model with the given key.
+        :param max_size: Memory budget in the units returned by sizeof, no limit by default.
+        :param sizeof: A function that returns the size of a loaded model. Each model counts as 1 by default, so
+        that max_size is the maximum number of models.
+        :param idle_timeout: Time in seconds after which a model that has not been used is unloaded, None to keep
+        models until they are evicted to make room for others.
+        :param unloader: A function called with the key and the model when it is unloaded (e.g. to free GPU
+        memory). The registry only drops its reference by default.
+        :param name: Name of the registry in metrics.
+        """
+        self.loader = loader
+        self.max_size = max_size
+        self.sizeof = sizeof
+        self.idle_timeout = idle_timeout
+        self.unloader = unloader
+        self.name = name
+
+        self._models: OrderedDict = OrderedDict()
+        self._loading: Dict[str, Future] = {}
+        self._size = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'loads': 0, 'load_errors': 0, 'evictions': 0}
+        self._closed = threading.Event()
+        if idle_timeout is not None:
+            threading.Thread(target=self._evict_idle_models, name='nauron-model-eviction', daemon=True).start()
+
+    def get(self, key: str) -> Any:
+        """
+        Returns the model, loading it first if needed. The model is not protected from being unloaded while it is
+        used, see use().
+        """
+        with self.use(key) as model:
+            return model
+
+    @contextmanager
+    def use(self, key: str) -> Iterator[Any]:
+        """
+        A context manager that returns the model, loading it first if needed, and keeps it loaded until the block
+        exits.
+        """
+        model = self._acquire(key)
+        try:
+            yield model
+        finally:
+            self._release(key)
+
+    def warm_up(self, keys: Iterable[str], background: bool = True):
+        """
+        Loads the given models, by default in a background thread so that the worker can start consuming
+        requests right away. Models that fail to load are logged and loaded again on demand.
+        """
+        keys = list(keys)
+        if not background:
+            for key in keys:
+                self.get(key)
+            return
+
+        def load_all():
+            for key in keys:
+                try:
+                    self.get(key)
+                except Exception as e:
+                    LOGGER.error(f"Unable to load model: {{registry: {self.name}, key: {key}, error: {e}}}")
+
+        threading.Thread(target=load_all, name='nauron-model-warmup', daemon=True).start()
+
+    def _acquire(self, key: str) -> Any:
+        while True:
+            with self._lock:
+                entry = self._models.get(key)
+                if entry is not None:
+                    self._models.move_to_end(key)
+                    entry.users += 1
+                    entry.last_used = time()
+                    self._stats['hits'] += 1
+                    return entry.model
+                future = self._loading.get(key)
+                leader = future is None
+                if leader:
+                    future = Future()
+                    self._loading[key] = future
+                    self._stats['misses'] += 1
+
+            if not leader:
+                # Raises the error of the load that was waited for.
+                future.result()
+                continue
+            return self._load(key, future)
+
+    def _load(self, key: str, future: Future) -> Any:
+        LOGGER.info(f"Loading model: {{registry: {self.name}, key: {key}}}")
+        t1 = time()
+        try:
+            model = self.loader(key)
+            size = self.sizeof(model)
+        except BaseException as e:
+            with self._lock:
+                del self._loading[key]
+                self._stats['load_errors'] += 1
+            future.set_exception(e)
+            raise
+        duration = time() - t1
+        MODEL_LOAD_TIME.observe(duration, registry=self.name)
+        LOGGER.info(f"Model loaded: {{registry: {self.name}, key: {key}, duration: {round(duration, 3)} s}}")
+
+        with self._lock:
+            del self._loading[key]
+            self._models[key] = _Entry(model, size, time(), users=1)
+            self._size += size
+            self._stats['loads'] += 1
+            evicted = self._pop_evictable(lambda entry: self.max_size is not None and self._size > self.max_size)
+        future.set_result(None)
+        self._unload(evicted, 'memory')
+        return model
+
+    def _release(self, key: str):
+        with self._lock:
+            entry = self._models.get(key)
+            if entry is not None:
+                entry.users -= 1
+                entry.last_used = time()
+
+    def _pop_evictable(self, condition: Callable[[_Entry], bool]) -> List[Tuple[str, Any]]:
+        """
+        Removes the least recently used models that are not in use while the condition holds. Called while
+        holding the lock.
+        """
+        evicted = []
+        for key, entry in list(self._models.items()):
+            if entry.users == 0 and condition(entry):
+                del self._models[key]
+                self._size -= entry.size
+                evicted.append((key, entry.model))
+        self._stats['evictions'] += len(evicted)
+        MODELS_LOADED.set(len(self._models), registry=self.name)
+        return evicted
+
+    def _unload(self, evicted: List[Tuple[str, Any]], reason: str):
+        for key, model in evicted:
+            LOGGER.info(f"Unloading model: {{registry: {self.name}, key: {key}, reason: {reason}}}")
+            MODEL_EVICTIONS.inc(registry=self.name, reason=reason)
+            if self.unloader is not None:
+                try:
+                    self.unloader(key, model)
+                except Exception as e:
+                    LOGGER.error(f"Unable to unload model: {{registry: {self.name}, key: {key}, error: {e}}}")
+
+    def _evict_idle_models(self):
+        while not self._closed.wait(min(self.idle_timeout, IDLE_CHECK_INTERVAL)):
+            with self._lock:
+                idle_since = time() - self.idle_timeout
+                evicted = self._pop_evictable(lambda entry: entry.last_used < idle_since)
+            self._unload(evicted, 'idle')
+
+    def close(self):
+        """
+        Stops the idle model eviction and unloads all models that are not in use.
+        """
+        self._closed.set()
+        with self._lock:
+            evicted = self._pop_evictable(lambda entry: True)
+        self._unload(evicted, 'closed')
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._models
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Returns statistics of the registry.
+        """
+        with self._lock:
+            return {'models': len(self._models), 'size': self._size, 'loading': len(self._loading), **self._stats}
@@ -1,20 +1,38 @@
-import json
 import logging
-from sys import getsizeof
 from time import time, sleep
+from functools import partial
+from dataclasses import replace
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, ProcessPoolExecutor
 
-from dataclasses import dataclass
-from typing import Tuple, Optional, Dict
+from dataclasses import dataclass, field
+from typing import Tuple, Optional, Dict, List, Any, Union, Iterable, Iterator, Callable
 
 import pika
 import pika.exceptions
 
 from nauron import Worker
-from nauron.helpers import Response, SIZE_WARNING_THRESHOLD, SIZE_ERROR_THRESHOLD
+from nauron.helpers import Response, StreamingResponse, SIZE_WARNING_THRESHOLD, SIZE_ERROR_THRESHOLD, \
+    BINARY_ENVELOPE, COMPRESSION_THRESHOLD, decode_request, compress, decompress, check_codec
+from nauron.cache import CacheBackend
+from nauron.blob_store import BlobStore, CLAIM_CHECK_THRESHOLD
+from nauron.transport import BrokerParameters, Reconnector, get_transport
+from nauron.metrics import WORKER_REQUESTS, WORKER_QUEUE_TIME, WORKER_PROCESSING_TIME, WORKER_RESPONSE_SIZE, \
+    WORKER_REDELIVERED, SERIALIZATION_TIME
 
 LOGGER = logging.getLogger(__name__)
 
 
+@dataclass
+class ReplyFormat:
+    """
+    The envelope format and compression of a response, negotiated based on the request.
+    """
+    binary: bool = False
+    compression: Optional[str] = None
+    compression_threshold: int = COMPRESSION_THRESHOLD
+    claim_check: bool = False
+
+
 @dataclass
 class MQItem:
     """
@@ -24,108 +42,664 @@ class MQItem:
     reply_to: Optional[str]
     correlation_id: Optional[str]
     request: Dict
+    routing_key: str = 'default'
+    reply_format: ReplyFormat = field(default_factory=ReplyFormat)
+    deadline: Optional[float] = None
+
+    def expired(self) -> bool:
+        """
+        Whether the client has already stopped waiting for the response.
+        """
+        return self.deadline is not None and self.deadline < time()
+
+
+@dataclass
+class EncodedResponse:
+    """
+    A response ready to be published. Headers are None in case of the legacy JSON envelope, unless the response
+    is offloaded to the blob store. The status code and timings are only used for metrics, they are measured where
+    the response is produced (which may be a different process) and recorded on the connection thread.
+    """
+    body: bytes
+    headers: Optional[Dict[str, Any]] = None
+    content_encoding: Optional[str] = None
+    http_status_code: int = 200
+    processing_time: float = 0
+    serialization_time: float = 0
+
+
+@dataclass
+class EncodedStream:
+    """
+    A streamed response ready to be published as a sequence of messages, the last of which is the end marker.
+    """
+    messages: Iterable[EncodedResponse]
+    http_status_code: int = 200
+    processing_time: float = 0
+
+
+EncodedResult = Union[EncodedResponse, EncodedStream]
+
+_PROCESS_WORKER: Optional[Worker] = None
+
+
+def _init_process_worker(worker: Worker):
+    """
+    Stores a copy of the worker in a process pool worker process.
+    """
+    global _PROCESS_WORKER
+    _PROCESS_WORKER = worker
+
+
+def _encode_stream(response: StreamingResponse, reply_format: ReplyFormat) -> Iterator[EncodedResponse]:
+    """
+    Encodes each chunk of a streamed response as a separate message with a sequence number. The chunks are
+    produced lazily, an error while producing them ends the stream with an error flag.
+    """
+    headers = {'http_status_code': response.http_status_code, 'mimetype': response.mimetype,
+               'content_format': 'bytes'}
+    sequence = 0
+    try:
+        for chunk in response.iter_bytes():
+            body, content_encoding = compress(chunk, reply_format.compression, reply_format.compression_threshold)
+            yield EncodedResponse(body, {**headers, 'stream_sequence': sequence}, content_encoding)
+            sequence += 1
+        yield EncodedResponse(b'', {**headers, 'stream_sequence': sequence, 'stream_end': True})
+    except Exception as e:
+        LOGGER.error(e)
+        yield EncodedResponse(b'', {**headers, 'stream_sequence': sequence, 'stream_end': True,
+                                    'stream_error': True})
+
+
+def _encode(response: Union[Response, StreamingResponse],
+            reply_format: ReplyFormat) -> EncodedResult:
+    """
+    Encodes the response using the same envelope format that was used by the request and compresses it if
+    the producer accepts it. Streamed responses are collected into a single message for legacy producers.
+    """
+    if isinstance(response, StreamingResponse):
+        if reply_format.binary:
+            return EncodedStream(_encode_stream(response, reply_format), response.http_status_code)
+        response = response.join()
+
+    t1 = time()
+    if reply_format.binary:
+        body, headers = response.encode_binary()
+    else:
+        body, headers = response.encode(), None
+    body, content_encoding = compress(body, reply_format.compression, reply_format.compression_threshold)
+    return EncodedResponse(body, headers, content_encoding, http_status_code=response.http_status_code,
+                           serialization_time=time() - t1)
+
+
+def _process(worker: Worker, content: Dict, signature: str, reply_format: ReplyFormat,
+             deadline: Optional[float] = None) -> EncodedResult:
+    """
+    Processes the request with the worker and returns the encoded response. Requests that waited in the executor
+    queue past their deadline are not processed.
+    """
+    t1 = time()
+    if deadline is not None and deadline < t1:
+        return _encode(Response(http_status_code=504), reply_format)
+    try:
+        response = worker.process_request(content, signature)
+    except Exception as e:
+        LOGGER.error(e)
+        response = Response(http_status_code=500)
+    processing_time = time() - t1
+    encoded = _encode(response, reply_format)
+    encoded.processing_time = processing_time
+    return encoded
+
+
+def _process_batch(worker: Worker, contents: List[Dict], signatures: List[str],
+                   reply_formats: List[ReplyFormat]) -> List[EncodedResult]:
+    """
+    Processes a batch of requests with the worker and returns the encoded responses in the same order.
+    """
+    t1 = time()
+    try:
+        responses = worker.process_batch(contents, signatures)
+        if len(responses) != len(contents):
+            raise ValueError(f"Worker returned {len(responses)} responses to a batch of {len(contents)} requests.")
+    except Exception as e:
+        LOGGER.error(e)
+        responses = [Response(http_status_code=500)] * len(contents)
+    # The whole batch is processed at once, so each request is attributed the full processing time.
+    processing_time = time() - t1
+    encoded = [_encode(response, reply_format) for response, reply_format in zip(responses, reply_formats)]
+    for response in encoded:
+        response.processing_time = processing_time
+    return encoded
+
+
+def _materialize(response: EncodedResult) -> EncodedResult:
+    """
+    Generators cannot be passed between processes, so streamed responses from process pools are produced in full
+    before they are returned.
+    """
+    if isinstance(response, EncodedStream):
+        return EncodedStream(list(response.messages), response.http_status_code, response.processing_time)
+    return response
+
+
+def _process_in_subprocess(content: Dict, signature: str, reply_format: ReplyFormat,
+                           deadline: Optional[float] = None) -> EncodedResult:
+    return _materialize(_process(_PROCESS_WORKER, content, signature, reply_format, deadline))
+
+
+def _process_batch_in_subprocess(contents: List[Dict], signatures: List[str],
+                                 reply_formats: List[ReplyFormat]) -> List[EncodedResult]:
+    return [_materialize(response) for response in _process_batch(_PROCESS_WORKER, contents, signatures,
+                                                                   reply_formats)]
 
 
 class MQConsumer:
     def __init__(self, worker: Worker,
-                 connection_parameters: pika.connection.ConnectionParameters, exchange_name: str,
+                 connection_parameters: BrokerParameters, exchange_name: str,
                  routing_key: str = "default",
-                 alt_routes: Tuple[str] = ()):
+                 alt_routes: Tuple[str] = (),
+                 prefetch_count: Optional[int] = None,
+                 concurrency: int = 1,
+                 executor: Optional[str] = None,
+                 batch_size: int = 1,
+                 batch_timeout: int = 0,
+                 compression: Optional[str] = None,
+                 compression_threshold: int = COMPRESSION_THRESHOLD,
+                 max_priority: Optional[int] = None,
+                 replay_cache: Optional[CacheBackend] = None,
+                 blob_store: Optional[BlobStore] = None,
+                 claim_check_threshold: int = CLAIM_CHECK_THRESHOLD):
         """
         Initializes a RabbitMQ consumer class that listens for requests for a specific worker and responds to
         them.
 
         :param worker: A worker instance to be used.
-        :param connection_parameters: RabbitMQ connection_parameters parameters.
+        :param connection_parameters: RabbitMQ connection parameters, a sequence of them to fail over between the
+        nodes of a cluster, or another transport.
         :param exchange_name: RabbitMQ exchange name.
         :param routing_key: RabbitMQ routing key. The actual queue name will also automatically include the service
         name to ensure that unique queues names are used.
         :param alt_routes: alternative allowed routing keys to be used in case of dynamic routing.
+        :param prefetch_count: maximum number of unacknowledged requests delivered to the consumer, defaults to
+        the concurrency value multiplied by the batch size.
+        :param concurrency: number of requests processed simultaneously when an executor is used.
+        :param executor: None to process requests on the connection thread, 'thread' to use a thread pool or
+        'process' to use a process pool. In case of a process pool, the worker must be picklable and each
+        process will use its own copy of it.
+        :param batch_size: maximum number of requests passed to Worker.process_batch() at once. Batching is
+        disabled by default.
+        :param batch_timeout: maximum time in milliseconds to wait for a batch to fill up before processing it.
+        :param compression: compression codec ('gzip', 'zlib' or 'lz4') used for responses larger than
+        compression_threshold bytes if the producer supports it. Responses are not compressed by default.
+        :param compression_threshold: minimum response size in bytes to be compressed.
+        :param max_priority: if set, the queue is declared as a priority queue with priorities from 0 to
+        max_priority (RabbitMQ recommends at most 10). An existing queue must be deleted before its priority
+        settings can be changed. Priorities only reorder requests that are waiting in RabbitMQ, so a low
+        prefetch_count is recommended.
+        :param replay_cache: if set, completed responses are stored by correlation id so that a request that is
+        redelivered (e.g. because the connection was lost before it was acknowledged) is answered with the stored
+        response instead of being processed again. A redelivered request whose original delivery is still being
+        processed waits for its response. An LRUCache only covers redeliveries to the same worker process, a
+        shared backend is needed to replay responses computed by other workers. Server errors (5xx) and streamed
+        responses are not stored.
+        :param blob_store: a store shared with the services for messages that are too large to be sent through
+        RabbitMQ. Requests offloaded by the service are read from it and responses larger than
+        claim_check_threshold bytes are written to it if the service uses the same store.
+        :param claim_check_threshold: minimum response size in bytes to be offloaded to the blob store.
         """
+        if executor not in (None, 'thread', 'process'):
+            raise ValueError(f"Unknown executor type: {executor}")
+        if concurrency < 1:
+            raise ValueError("Concurrency must be at least 1.")
+        if batch_size < 1:
+            raise ValueError("Batch size must be at least 1.")
+        if max_priority is not None and not 1 <= max_priority <= 255:
+            raise ValueError("Maximum priority must be between 1 and 255.")
+        check_codec(compression)
         self.worker = worker
 
         self.exchange_name = exchange_name
         self.queue_name = '{}.{}'.format(exchange_name, routing_key)
         self.alt_routes = ['{}.{}'.format(exchange_name, alt_route) for alt_route in alt_routes]
         self.connection_parameters = connection_parameters
+        self.transport = get_transport(connection_parameters)
+        self.prefetch_count = concurrency * batch_size if prefetch_count is None else prefetch_count
+        if self.prefetch_count < batch_size:
+            LOGGER.warning(f"Prefetch count {self.prefetch_count} is smaller than the batch size {batch_size}, "
+                           f"batches will never be full.")
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.compression = compression
+        self.compression_threshold = compression_threshold
+        self.max_priority = max_priority
+        self.replay_cache = replay_cache
+        self.blob_store = blob_store
+        self.claim_check_threshold = claim_check_threshold
+        # Redelivered copies of the requests that are being processed, keyed by correlation id.
+        self._processing: Dict[str, List[Tuple[pika.adapters.blocking_connection.BlockingChannel, MQItem, float]]] = {}
+        self._batch: List[Tuple[MQItem, float]] = []
+        self._batch_timer = None
+        self.executor_type = executor
+        self.executor: Optional[Executor] = None
+        self.connection = None
         self.channel = None
+        self._stopped = False
+        self._reconnector = Reconnector('worker')
+
+    def _init_executor(self):
+        if self.executor is not None or self.executor_type is None:
+            return
+        if self.executor_type == 'thread':
+            self.executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='nauron-worker')
+        else:
+            self.executor = ProcessPoolExecutor(max_workers=self.concurrency, initializer=_init_process_worker,
+                                                initargs=(self.worker,))
 
     def start(self):
         """
         Connect to RabbitMQ and start listening for requests. Automatically tries to reconnect if the connection
         is lost.
         """
-        while True:
+        self._init_executor()
+        while not self._stopped:
             try:
                 self._connect()
+                self._reconnector.connected()
                 LOGGER.info('Ready to process requests.')
                 self.channel.start_consuming()
             except pika.exceptions.AMQPConnectionError as e:
-                LOGGER.error(e)
-                LOGGER.info('Trying to reconnect in 10 seconds.')
-                sleep(10)
+                sleep(self._reconnector.failed(e))
             except KeyboardInterrupt:
                 LOGGER.info('Interrupted by user. Exiting...')
                 self.channel.close()
+                if self.executor is not None:
+                    self.executor.shutdown(wait=False)
                 break
+        else:
+            if self.connection is not None and self.connection.is_open:
+                self.connection.close()
+            if self.executor is not None:
+                self.executor.shutdown(wait=False)
+
+    def stop(self):
+        """
+        Stops consuming and makes start() return. Can be called from any thread. Requests that have been received
+        but not acknowledged yet are redelivered to other workers by RabbitMQ.
+        """
+        self._stopped = True
+        if self.connection is not None and self.connection.is_open:
+            self.connection.add_callback_threadsafe(self.channel.stop_consuming)
 
     def _connect(self):
         """
-        Connects to RabbitMQ, (re)declares the exchange for the service and a queue for the worker binding
-        any alternative routing keys as needed.
+        Connects to RabbitMQ and starts consuming on a new channel.
+        """
+        LOGGER.info(f'Connecting to message broker: {self.transport}')
+        self._open_channel(self.transport.connect())
+
+    def _open_channel(self, connection: pika.BlockingConnection):
+        """
+        Opens a channel on the connection, (re)declares the exchange for the service and a queue for the worker
+        binding any alternative routing keys as needed. The connection may be shared with other consumers (see
+        nauron.worker_host.WorkerHost), each of them using its own channel and prefetch count.
         """
-        LOGGER.info(f'Connecting to RabbitMQ server: {{host: {self.connection_parameters.host}, '
-                    f'port :{self.connection_parameters.port}}}')
-        connection = pika.BlockingConnection(self.connection_parameters)
-        self.channel = connection.channel()
-        self.channel.queue_declare(queue=self.queue_name)
+        # Requests of an unfinished batch will be redelivered and processed again.
+        for mq_item, _ in self._batch:
+            self._processing.pop(mq_item.correlation_id, None)
+        self._batch, self._batch_timer = [], None
+        self.connection = connection
+        self.channel = self.connection.channel()
+        arguments = None if self.max_priority is None else {'x-max-priority': self.max_priority}
+        self.channel.queue_declare(queue=self.queue_name, arguments=arguments)
         self.channel.exchange_declare(exchange=self.exchange_name, exchange_type='direct')
         self.channel.queue_bind(exchange=self.exchange_name, queue=self.queue_name, routing_key=self.queue_name)
         for alt_route in self.alt_routes:
             self.channel.queue_bind(exchange=self.exchange_name, queue=self.queue_name, routing_key=alt_route)
 
-        self.channel.basic_qos(prefetch_count=1)
+        self.channel.basic_qos(prefetch_count=self.prefetch_count)
         self.channel.basic_consume(queue=self.queue_name, on_message_callback=self._on_request)
 
     @staticmethod
-    def _respond(channel: pika.adapters.blocking_connection.BlockingChannel, mq_item: MQItem, response: bytes):
+    def _publish(channel: pika.adapters.blocking_connection.BlockingChannel, mq_item: MQItem,
+                 response: EncodedResponse):
         """
-        Publish the response to the callback queue and acknowlesge the original queue item.
+        Publish the response (or a part of a streamed response) to the callback queue.
         """
+        if not mq_item.reply_format.binary:
+            properties = pika.BasicProperties(correlation_id=mq_item.correlation_id,
+                                              content_encoding=response.content_encoding,
+                                              headers=response.headers)
+        else:
+            properties = pika.BasicProperties(correlation_id=mq_item.correlation_id,
+                                              content_type=BINARY_ENVELOPE,
+                                              content_encoding=response.content_encoding,
+                                              headers=response.headers)
         channel.basic_publish(exchange='',
                               routing_key=mq_item.reply_to,
-                              properties=pika.BasicProperties(correlation_id=mq_item.correlation_id),
-                              body=response)
+                              properties=properties,
+                              body=response.body)
+
+    def _check_in(self, mq_item: MQItem, response: EncodedResponse) -> EncodedResponse:
+        """
+        Writes a large response to the blob store and returns a message that only contains a reference to it, if
+        the producer supports it.
+        """
+        if self.blob_store is None or not mq_item.reply_format.claim_check or \
+                len(response.body) <= self.claim_check_threshold:
+            return response
+        try:
+            reference = self.blob_store.put(response.body)
+        except OSError as e:
+            LOGGER.error(f"Unable to offload the response to the blob store: {{id: {mq_item.correlation_id}, "
+                         f"error: {e}}}")
+            return response
+        LOGGER.debug(f"Response offloaded to the blob store: {{id: {mq_item.correlation_id}, "
+                     f"size: {len(response.body)}}}")
+        # Responses in the legacy envelope have no other headers, but the producer accepts the reference anyway.
+        return replace(response, body=b'', headers={**(response.headers or {}), 'claim_check': reference})
+
+    def _respond(self, channel: pika.adapters.blocking_connection.BlockingChannel, mq_item: MQItem,
+                 response: EncodedResponse):
+        """
+        Publish the response to the callback queue and acknowlesge the original queue item.
+        """
+        self._publish(channel, mq_item, self._check_in(mq_item, response))
         channel.basic_ack(delivery_tag=mq_item.delivery_tag)
 
+    def _publish_chunk(self, channel: pika.adapters.blocking_connection.BlockingChannel, mq_item: MQItem,
+                       response: EncodedResponse):
+        if channel is self.channel and channel.is_open:
+            self._publish(channel, mq_item, response)
+
     def _on_request(self, channel: pika.adapters.blocking_connection.BlockingChannel, method: pika.spec.Basic.Deliver,
                     properties: pika.BasicProperties, body: bytes):
         """
-        Pass the request to the worker and return its response.
+        Pass the request to the worker and return its response. If an executor is used, the request is processed
+        in the background and the response is sent from the connection thread once it is ready. If batching is
+        enabled, the request is added to the current batch instead.
         """
         t1 = time()
+        LOGGER.info(f"Received request: {{id: {properties.correlation_id}, size: {len(body)} bytes}}")
+        headers = properties.headers or {}
+        accepted_codecs = headers.get('accept_encoding', '').split(',')
+        reply_format = ReplyFormat(binary=properties.content_type == BINARY_ENVELOPE,
+                                   compression=self.compression if self.compression in accepted_codecs else None,
+                                   compression_threshold=self.compression_threshold,
+                                   claim_check=bool(headers.get('accept_claim_check')))
+        routing_key = method.routing_key[len(self.exchange_name) + 1:]
+        if 'sent_at' in headers:
+            WORKER_QUEUE_TIME.observe(max(t1 - headers['sent_at'], 0), service=self.exchange_name,
+                                      routing_key=routing_key)
+        if headers.get('deadline') is not None and headers['deadline'] < t1:
+            # The client has given up, so the request is dropped without even decoding it.
+            if method.redelivered:
+                self._record_redelivery(properties.correlation_id, routing_key, 'expired')
+            self._skip(channel, MQItem(method.delivery_tag, properties.reply_to, properties.correlation_id, None,
+                                       routing_key, reply_format, headers['deadline']))
+            return
+        try:
+            if 'claim_check' in headers:
+                if self.blob_store is None:
+                    raise ValueError("the request was offloaded to a blob store but none is configured")
+                with self.blob_store.open(headers['claim_check']) as payload:
+                    request = decode_request(decompress(payload, properties.content_encoding),
+                                             properties.content_type, properties.headers)
+            else:
+                request = decode_request(decompress(body, properties.content_encoding), properties.content_type,
+                                         properties.headers)
+        except (ValueError, KeyError, OSError) as e:
+            LOGGER.error(f"Unable to decode request: {{id: {properties.correlation_id}, error: {e}}}")
+            request = None
+        SERIALIZATION_TIME.observe(time() - t1, service=self.exchange_name, operation='decode_request')
         mq_item = MQItem(method.delivery_tag,
                          properties.reply_to,
                          properties.correlation_id,
-                         json.loads(body))
-        LOGGER.info(f"Received request: {{id: {mq_item.correlation_id}, size: {getsizeof(body)} bytes}}")
+                         request,
+                         routing_key,
+                         reply_format,
+                         headers.get('deadline'))
+        if request is None:
+            if method.redelivered:
+                self._record_redelivery(mq_item.correlation_id, routing_key, 'rejected')
+            self._on_processed(channel, [(mq_item, t1)], [_encode(Response(http_status_code=400), reply_format)])
+            return
+        if method.redelivered and self._on_redelivered(channel, mq_item, t1):
+            return
+        self._dispatch(channel, mq_item, t1)
+
+    def _dispatch(self, channel: pika.adapters.blocking_connection.BlockingChannel, mq_item: MQItem, t1: float):
+        """
+        Processes the request on the connection thread, submits it to the executor or adds it to the current batch.
+        """
+        if self.replay_cache is not None and mq_item.correlation_id is not None:
+            self._processing[mq_item.correlation_id] = []
+        if self.batch_size > 1:
+            self._batch.append((mq_item, t1))
+            if len(self._batch) >= self.batch_size:
+                self._flush_batch()
+            elif self._batch_timer is None:
+                self._batch_timer = self.connection.call_later(self.batch_timeout / 1000, self._on_batch_timeout)
+            return
+
+        args = (mq_item.request['content'], mq_item.request['signature'], mq_item.reply_format, mq_item.deadline)
+        if self.executor is None:
+            self._on_processed(channel, [(mq_item, t1)], [_process(self.worker, *args)])
+        else:
+            if self.executor_type == 'process':
+                future = self.executor.submit(_process_in_subprocess, *args)
+            else:
+                future = self.executor.submit(self._process_in_thread, channel, [(mq_item, t1)], _process, *args)
+            future.add_done_callback(partial(self._schedule_response, channel, [(mq_item, t1)]))
+
+    def _replay_key(self, mq_item: MQItem) -> str:
+        return f'replay:{self.queue_name}:{mq_item.correlation_id}'
+
+    def _on_redelivered(self, channel: pika.adapters.blocking_connection.BlockingChannel, mq_item: MQItem,
+                        t1: float) -> bool:
+        """
+        Answers a redelivered request without processing it again if possible. Returns False if the request still
+        has to be processed.
+        """
+        outcome = 'processed'
+        if self.replay_cache is not None and mq_item.correlation_id is not None:
+            if mq_item.correlation_id in self._processing:
+                self._processing[mq_item.correlation_id].append((channel, mq_item, t1))
+                outcome = 'joined'
+            else:
+                try:
+                    response = self.replay_cache.get(self._replay_key(mq_item))
+                except Exception as e:
+                    LOGGER.error(f"Unable to read the replay cache: {e}")
+                    response = None
+                if response is not None:
+                    self._respond(channel, mq_item, response)
+                    outcome = 'replayed'
+        self._record_redelivery(mq_item.correlation_id, mq_item.routing_key, outcome)
+        return outcome != 'processed'
+
+    def _record_redelivery(self, correlation_id: Optional[str], routing_key: str, outcome: str):
+        """
+        Logs and counts a redelivered request by its outcome: 'joined', 'replayed', 'processed' or, for requests
+        that are not processed at all, 'expired' or 'rejected' (undecodable).
+        """
+        LOGGER.info(f"Redelivered request: {{id: {correlation_id}, outcome: {outcome}}}")
+        WORKER_REDELIVERED.inc(service=self.exchange_name, routing_key=routing_key, outcome=outcome)
+
+    def _complete(self, mq_item: MQItem, response: EncodedResult):
+        """
+        Stores the response in the replay cache and answers the redelivered copies of the request that were
+        received while it was being processed. Copies of requests whose response cannot be replayed are processed
+        again.
+        """
+        if self.replay_cache is None or mq_item.correlation_id is None:
+            return
+        waiters = self._processing.pop(mq_item.correlation_id, [])
+        replayable = isinstance(response, EncodedResponse) and response.http_status_code < 500 and \
+            len(response.body) <= 1024 * 1024 * SIZE_ERROR_THRESHOLD
+        if replayable:
+            try:
+                self.replay_cache.set(self._replay_key(mq_item), response)
+            except Exception as e:
+                LOGGER.error(f"Unable to store the response in the replay cache: {e}")
+        for channel, waiter, t1 in waiters:
+            if channel is not self.channel or not channel.is_open:
+                # The copy will be redelivered once more.
+                continue
+            if replayable:
+                self._respond(channel, waiter, response)
+            else:
+                self._dispatch(channel, waiter, t1)
+
+    def _on_batch_timeout(self):
+        self._batch_timer = None
+        self._flush_batch()
+
+    def _flush_batch(self):
+        """
+        Passes the collected requests to the worker as a single batch.
+        """
+        if self._batch_timer is not None:
+            self.connection.remove_timeout(self._batch_timer)
+            self._batch_timer = None
+        pending, self._batch = self._batch, []
+        batch = []
+        for mq_item, t1 in pending:
+            if mq_item.expired():
+                self._skip(self.channel, mq_item)
+                # Redelivered copies share the deadline of the original request.
+                for channel, waiter, _ in self._processing.pop(mq_item.correlation_id, []):
+                    if channel is self.channel and channel.is_open:
+                        self._skip(channel, waiter)
+            else:
+                batch.append((mq_item, t1))
+        if not batch:
+            return
+
+        args = ([mq_item.request['content'] for mq_item, _ in batch],
+                [mq_item.request['signature'] for mq_item, _ in batch],
+                [mq_item.reply_format for mq_item, _ in batch])
+        LOGGER.debug(f"Processing batch: {{size: {len(batch)}}}")
+        if self.executor is None:
+            self._on_processed(self.channel, batch, _process_batch(self.worker, *args))
+        else:
+            if self.executor_type == 'process':
+                future = self.executor.submit(_process_batch_in_subprocess, *args)
+            else:
+                future = self.executor.submit(self._process_in_thread, self.channel, batch, _process_batch, *args)
+            future.add_done_callback(partial(self._schedule_response, self.channel, batch))
+
+    def _process_in_thread(self, channel: pika.adapters.blocking_connection.BlockingChannel,
+                           items: List[Tuple[MQItem, float]], process: Callable, *args) -> List[EncodedResult]:
+        """
+        Processes the request (or a batch of requests) in a thread pool. Streamed responses are produced in the
+        same thread and each chunk is passed to the connection thread as soon as it is ready, so only the
+        acknowledgement and the metrics of the stream are left to _on_processed().
+        """
+        responses = process(self.worker, *args)
+        if not isinstance(responses, list):
+            responses = [responses]
+        for i, ((mq_item, _), response) in enumerate(zip(items, responses)):
+            if isinstance(response, EncodedStream):
+                for message in response.messages:
+                    self.connection.add_callback_threadsafe(partial(self._publish_chunk, channel, mq_item, message))
+                responses[i] = EncodedStream([], response.http_status_code, response.processing_time)
+        return responses
+
+    def _schedule_response(self, channel: pika.adapters.blocking_connection.BlockingChannel,
+                           items: List[Tuple[MQItem, float]], future: Future):
+        """
+        Called once the request (or a batch of requests) is processed, either from the executor or from the
+        connection thread if the future was already done. Channels are not thread-safe so the responses are passed
+        back to the connection thread. Streams are fully produced by then, so no worker code is run here.
+        """
         try:
-            response = self.worker.process_request(mq_item.request['content'], mq_item.request['signature']).encode()
+            responses = future.result()
+            if not isinstance(responses, list):
+                responses = [responses]
         except Exception as e:
             LOGGER.error(e)
-            response = Response(http_status_code=500).encode()
-
-        respose_size = getsizeof(response)
-        if respose_size > 1024 * 1024 * SIZE_WARNING_THRESHOLD:
-            LOGGER.warning(f"Response size exceeds the recommended threshold: {{id: {mq_item.correlation_id},"
-                           f"size: {respose_size}}}")
-        if respose_size > 1024 * 1024 * SIZE_ERROR_THRESHOLD:
-            LOGGER.error(f"Response size exceeds RabbitMQ message size threshold: {{id: {mq_item.correlation_id},"
-                           f"size: {respose_size}}}")
-            response = Response(http_status_code=413).encode()
-
-        self._respond(channel, mq_item, response)
-        t2 = time()
-
-        LOGGER.info(f"Request processed: {{id: {mq_item.correlation_id}, duration: {round(t2 - t1, 3)} s, "
-                    f"size: {respose_size} bytes}}")
+            responses = [_encode(Response(http_status_code=500), mq_item.reply_format) for mq_item, _ in items]
+        try:
+            for item, response in zip(items, responses):
+                self.connection.add_callback_threadsafe(partial(self._on_processed, channel, [item], [response]))
+        except Exception as e:
+            LOGGER.error(f"Unable to respond, the connection was lost: {{ids: {[i.correlation_id for i, _ in items]}, "
+                         f"error: {e}}}")
+            for mq_item, _ in items:
+                self._processing.pop(mq_item.correlation_id, None)
+
+    def _skip(self, channel: pika.adapters.blocking_connection.BlockingChannel, mq_item: MQItem):
+        """
+        Acknowledges a request without processing it because its deadline has passed.
+        """
+        LOGGER.warning(f"Request expired before processing: {{id: {mq_item.correlation_id}, "
+                       f"overdue: {round(time() - mq_item.deadline, 3)} s}}")
+        WORKER_REQUESTS.inc(service=self.exchange_name, routing_key=mq_item.routing_key,
+                            signature=self._signature(mq_item), status=504)
+        channel.basic_ack(delivery_tag=mq_item.delivery_tag)
+
+    @staticmethod
+    def _signature(mq_item: MQItem) -> str:
+        return mq_item.request['signature'] if mq_item.request is not None else ''
+
+    def _observe(self, mq_item: MQItem, response: EncodedResult):
+        """
+        Records the metrics of a processed request. Called on the connection thread before the response is sent.
+        """
+        signature = self._signature(mq_item)
+        if isinstance(response, EncodedResponse):
+            SERIALIZATION_TIME.observe(response.serialization_time, service=self.exchange_name,
+                                       operation='encode_response')
+            # Oversized responses are replaced with an error and counted separately.
+            if len(response.body) > 1024 * 1024 * SIZE_ERROR_THRESHOLD:
+                return
+        WORKER_REQUESTS.inc(service=self.exchange_name, routing_key=mq_item.routing_key, signature=signature,
+                            status=response.http_status_code)
+        if mq_item.request is not None:
+            WORKER_PROCESSING_TIME.observe(response.processing_time, service=self.exchange_name,
+                                           routing_key=mq_item.routing_key, signature=signature)
+
+    def _on_processed(self, channel: pika.adapters.blocking_connection.BlockingChannel,
+                      items: List[Tuple[MQItem, float]],
+                      responses: List[EncodedResult]):
+        """
+        Checks the response sizes and responds to each request separately. Streams are published in full unless
+        their messages were already sent from the executor thread.
+        """
+        for (mq_item, t1), response in zip(items, responses):
+            # Responses are stored even if the channel was closed, as the request will be redelivered.
+            self._complete(mq_item, response)
+            if channel is not self.channel or not channel.is_open:
+                LOGGER.warning(f"Channel closed before the response was sent: {{id: {mq_item.correlation_id}}}")
+                continue
+
+            if isinstance(response, EncodedResponse):
+                response = self._check_in(mq_item, response)
+            self._observe(mq_item, response)
+            if isinstance(response, EncodedStream):
+                for message in response.messages:
+                    self._publish(channel, mq_item, message)
+                channel.basic_ack(delivery_tag=mq_item.delivery_tag)
+                LOGGER.info(f"Streamed request processed: {{id: {mq_item.correlation_id}, "
+                            f"duration: {round(time() - t1, 3)} s}}")
+                continue
+
+            respose_size = len(response.body)
+            if respose_size > 1024 * 1024 * SIZE_WARNING_THRESHOLD:
+                LOGGER.warning(f"Response size exceeds the recommended threshold: {{id: {mq_item.correlation_id},"
+                               f"size: {respose_size}}}")
+            if respose_size > 1024 * 1024 * SIZE_ERROR_THRESHOLD:
+                LOGGER.error(f"Response size exceeds RabbitMQ message size threshold: "
+                             f"{{id: {mq_item.correlation_id}, size: {respose_size}}}")
+                response = _encode(Response(http_status_code=413), mq_item.reply_format)
+                WORKER_REQUESTS.inc(service=self.exchange_name, routing_key=mq_item.routing_key,
+                                    signature=self._signature(mq_item), status=413)
+            WORKER_RESPONSE_SIZE.observe(respose_size, service=self.exchange_name, routing_key=mq_item.routing_key)
+
+            self._respond(channel, mq_item, response)
+            t2 = time()
+
+            LOGGER.info(f"Request processed: {{id: {mq_item.correlation_id}, duration: {round(t2 - t1, 3)} s, "
+                        f"size: {respose_size} bytes}}")
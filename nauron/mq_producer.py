@@ -1,94 +1,712 @@
-import json
 import uuid
+import queue
+import asyncio
 import logging
-from sys import getsizeof
+import threading
+from time import time
+from functools import partial
+from contextlib import contextmanager
 
-from typing import Dict
+from typing import Dict, List, Optional, Union, Iterator, Tuple, Any, Callable
 
 from flask import abort
+from werkzeug.exceptions import HTTPException
 import pika
 import pika.exceptions
 
-from nauron.helpers import Response, SIZE_WARNING_THRESHOLD, SIZE_ERROR_THRESHOLD
+from nauron.helpers import Response, StreamingResponse, SIZE_WARNING_THRESHOLD, SIZE_ERROR_THRESHOLD, \
+    ENVELOPES, COMPRESSION_THRESHOLD, encode_request, compress, decompress, available_codecs, check_codec, \
+    check_envelope
+from nauron.transport import BrokerParameters, get_transport
+from nauron.blob_store import BlobStore, CLAIM_CHECK_THRESHOLD
+from nauron.mq_router import MQResponseRouter
+from nauron.hedging import HedgePolicy
+from nauron.metrics import REQUEST_SIZE, RESPONSE_SIZE, SERIALIZATION_TIME, REQUESTS_HEDGED, BROKER_RECONNECTS, \
+    BROKER_DOWNTIME
 
 LOGGER = logging.getLogger(__name__)
 
+# Time in seconds between the checks of idle pooled connections, well below the default RabbitMQ heartbeat timeout.
+KEEPALIVE_INTERVAL = 10
+
 
 class MQProducer:
-    def __init__(self, connection_parameters: pika.connection.Parameters, exchange_name: str):
+    def __init__(self, connection_parameters: BrokerParameters, exchange_name: str):
+        """
+        Initializes a RabbitMQ producer class used for publishing requests using the relevant routing key. The
+        connection is kept open so that the producer can be reused for multiple requests.
+        """
+        self.exchange_name = exchange_name
+        self.connection_parameters = connection_parameters
+        self.transport = get_transport(connection_parameters)
+        self.mq_connection = None
+        self.channel = None
+
+        self._connect()
+
+    def _connect(self):
+        """
+        Opens a new connection and a channel with delivery confirmations enabled.
+        """
+        self.mq_connection = self.transport.connect()
+        self.channel = self.mq_connection.channel()
+        self.channel.confirm_delivery()
+
+    def reconnect(self):
+        """
+        Closes the current connection (if still open) and opens a new one.
+        """
+        self.close()
+        self._connect()
+
+    def is_healthy(self) -> bool:
+        """
+        Checks whether the connection and the channel are still usable. Processing pending data events also
+        keeps the heartbeats of an idle connection up to date.
+        """
+        if self.mq_connection is None or self.channel is None:
+            return False
+        try:
+            self.mq_connection.process_data_events(time_limit=0)
+        except pika.exceptions.AMQPError as e:
+            LOGGER.warning(f"Unhealthy MQ connection: {e}")
+            return False
+        return self.mq_connection.is_open and self.channel.is_open
+
+    def close(self):
+        """
+        Closes the connection, ignoring any errors caused by a connection that is already broken.
+        """
+        try:
+            if self.mq_connection is not None and self.mq_connection.is_open:
+                self.mq_connection.close()
+        except pika.exceptions.AMQPError as e:
+            LOGGER.debug(e)
+        self.mq_connection = None
+        self.channel = None
+
+    def publish(self, routing_key: str, properties: pika.BasicProperties, body: bytes):
+        """
+        Publishes a message to the exchange of the service. Raises pika.exceptions.UnroutableError if no queue is
+        bound with the routing key.
+        """
+        self.channel.basic_publish(exchange=self.exchange_name, routing_key=routing_key, properties=properties,
+                                   mandatory=True, body=body)
+
+    def queue_depth(self, queue_name: str) -> int:
+        """
+        Returns the number of messages ready in the queue using a passive declaration. Raises
+        pika.exceptions.ChannelClosedByBroker if the queue does not exist.
+        """
+        return self.channel.queue_declare(queue=queue_name, passive=True).method.message_count
+
+
+class ReplyStream:
+    def __init__(self, chunks: Iterator[bytes], on_close: Callable[[], None]):
+        """
+        The chunks of a streamed response received from a worker. Closing the stream stops waiting for further
+        chunks even if it was never iterated, which a generator alone cannot do.
+        """
+        self._chunks = chunks
+        self._on_close = on_close
+
+    def __iter__(self) -> Iterator[bytes]:
+        return self
+
+    def __next__(self) -> bytes:
+        return next(self._chunks)
+
+    def close(self):
+        self._chunks.close()
+        self._on_close()
+
+
+class MQProducerPool:
+    def __init__(self, connection_parameters: BrokerParameters, exchange_name: str,
+                 size: int = 8, compression: Optional[str] = None,
+                 compression_threshold: int = COMPRESSION_THRESHOLD, blob_store: Optional[BlobStore] = None,
+                 claim_check_threshold: int = CLAIM_CHECK_THRESHOLD, envelope: str = 'json',
+                 keepalive_interval: Optional[float] = KEEPALIVE_INTERVAL):
         """
-        Initializes a RabbitMQ producer class used for publishing requests using the relevant routing key and
-        receiving a response.
+        A thread-safe pool of long-lived producers. Connections are created lazily (or in advance using warm())
+        and returned to the pool after each request. Idle connections are serviced in the background so that
+        RabbitMQ does not close them for missed heartbeats. Broken connections are re-established transparently
+        when a producer is acquired, so a request following a broker failover connects to the next node right away.
+
+        :param connection_parameters: RabbitMQ connection parameters, a sequence of them to fail over between the
+        nodes of a cluster, or another transport.
+        :param exchange_name: RabbitMQ exchange name.
+        :param size: Maximum number of simultaneously open connections. Requests block until a producer is
+        available if all of them are in use.
+        :param compression: Compression codec ('gzip', 'zlib' or 'lz4') used for requests larger than
+        compression_threshold bytes. Requests are not compressed by default.
+        :param compression_threshold: Minimum request size in bytes to be compressed.
+        :param blob_store: An optional store shared with the workers. Requests larger than claim_check_threshold
+        bytes (after compression) are written to it and only a reference is sent through RabbitMQ. Workers that
+        use the same store may respond the same way.
+        :param claim_check_threshold: Minimum message size in bytes to be offloaded to the blob store.
+        :param envelope: Envelope format of requests: 'json' (default) for the legacy format that workers of all
+        versions understand, or 'binary' to send the content as the message body and the metadata in AMQP headers.
+        Workers respond in the format of the request, so streamed responses and responses with raw binary content
+        require the binary envelope, which older workers do not support.
+        :param keepalive_interval: Time in seconds between the checks of idle connections, which also send their
+        heartbeats. Must be well below the heartbeat timeout negotiated with RabbitMQ (60 seconds by default).
+        None disables the checks.
         """
-        self.response = None
-        self.correlation_id = None
-        self.callback_queue = None
+        if size < 1:
+            raise ValueError("Pool size must be at least 1.")
+        check_codec(compression)
+        check_envelope(envelope)
+        self.connection_parameters = connection_parameters
+        # Shared by all producers so that they remember which node of a cluster is reachable.
+        self.transport = get_transport(connection_parameters)
         self.exchange_name = exchange_name
+        self.size = size
+        self.compression = compression
+        self.compression_threshold = compression_threshold
+        self.blob_store = blob_store
+        self.claim_check_threshold = claim_check_threshold
+        self.envelope = envelope
+
+        self._idle: List[MQProducer] = []
+        self._lock = threading.Condition()
+        self._open = 0
+        # Time when RabbitMQ was first found unreachable, None while connections succeed.
+        self._lost_at: Optional[float] = None
+        self._stats = {'created': 0, 'reconnected': 0, 'discarded': 0, 'acquired': 0, 'waited': 0}
+        self.keepalive_interval = keepalive_interval
+        self._closed = threading.Event()
+        if keepalive_interval is not None:
+            threading.Thread(target=self._keep_alive, name=f'nauron-keepalive-{exchange_name}', daemon=True).start()
+
+    def _create(self) -> MQProducer:
+        try:
+            producer = MQProducer(self.transport, self.exchange_name)
+        except pika.exceptions.AMQPConnectionError:
+            self._connection_lost()
+            raise
+        with self._lock:
+            self._stats['created'] += 1
+        self._connection_restored(reconnected=False)
+        return producer
+
+    def _connection_lost(self):
+        with self._lock:
+            if self._lost_at is None:
+                self._lost_at = time()
+
+    def _connection_restored(self, reconnected: bool):
+        """
+        Records a successful connection to RabbitMQ. It only counts as a broker reconnection if an outage was
+        observed before: an attempt to connect has failed or a connection broke while it was in use. Replacing an
+        idle connection that was closed by RabbitMQ does not count.
+        """
+        with self._lock:
+            lost_at, self._lost_at = self._lost_at, None
+            if reconnected:
+                self._stats['reconnected'] += 1
+        if lost_at is not None:
+            BROKER_RECONNECTS.inc(component='producer')
+            BROKER_DOWNTIME.observe(time() - lost_at, component='producer')
+
+    def _keep_alive(self):
+        while not self._closed.wait(self.keepalive_interval):
+            self._service_idle()
+
+    def _service_idle(self):
+        """
+        Processes the pending data events of each idle connection, which sends and checks the heartbeats, and
+        reconnects the ones that are broken. Each producer is taken out of the pool while it is checked.
+        """
+        with self._lock:
+            idle = list(self._idle)
+        for producer in idle:
+            with self._lock:
+                if producer not in self._idle:
+                    # Acquired in the meantime.
+                    continue
+                self._idle.remove(producer)
+            if not producer.is_healthy():
+                try:
+                    producer.reconnect()
+                except Exception as e:
+                    LOGGER.error(e)
+                    self._connection_lost()
+                    self._discard(producer)
+                    continue
+                self._connection_restored(reconnected=True)
+            with self._lock:
+                # Checked producers keep their place as the least recently used ones.
+                self._idle.insert(0, producer)
+                self._lock.notify()
+
+    def warm(self, count: int = None):
+        """
+        Opens producer connections in advance so that the first requests do not have to wait for them.
+
+        :param count: Number of connections to open, defaults to the size of the pool.
+        """
+        count = self.size if count is None else min(count, self.size)
+        producers = []
+        for _ in range(count):
+            with self._lock:
+                if self._open >= self.size:
+                    break
+                self._open += 1
+            try:
+                producers.append(self._create())
+            except Exception:
+                with self._lock:
+                    self._open -= 1
+                raise
+        with self._lock:
+            self._idle.extend(producers)
+            self._lock.notify_all()
+
+    def _checkout(self, timeout: Optional[float] = None) -> MQProducer:
+        with self._lock:
+            if not self._idle and self._open >= self.size:
+                self._stats['waited'] += 1
+                if not self._lock.wait_for(lambda: self._idle or self._open < self.size, timeout):
+                    raise TimeoutError("No MQ connection became available in time.")
+            self._stats['acquired'] += 1
+            if self._idle:
+                return self._idle.pop()
+            self._open += 1
 
         try:
-            self.mq_connection = pika.BlockingConnection(connection_parameters)
-            self.channel = self.mq_connection.channel()
+            return self._create()
+        except Exception:
+            self._release_slot()
+            raise
+
+    def _release_slot(self):
+        with self._lock:
+            self._open -= 1
+            self._lock.notify()
+
+    def _checkin(self, producer: MQProducer):
+        with self._lock:
+            self._idle.append(producer)
+            self._lock.notify()
+
+    def _discard(self, producer: MQProducer):
+        producer.close()
+        with self._lock:
+            self._stats['discarded'] += 1
+        self._release_slot()
+
+    @contextmanager
+    def acquire(self, timeout: Optional[float] = None) -> MQProducer:
+        """
+        A context manager that yields a healthy producer and returns it to the pool afterwards. If the request
+        fails with an unexpected error, the producer is closed instead as its channel may be in an unknown state.
+        Aborts the request with HTTP error 503 if RabbitMQ is unreachable or if no producer becomes available
+        within the timeout (in seconds).
+        """
+        try:
+            producer = self._checkout(timeout)
         except Exception as e:
             LOGGER.error(e)
             abort(503)
 
-    def _init_callback(self):
-        """
-        Create an exclusive callback queue for the response.
-        """
-        result = self.channel.queue_declare(queue='', exclusive=True)
-        self.callback_queue = result.method.queue
-        self.channel.basic_consume(queue=self.callback_queue, on_message_callback=self._on_response, auto_ack=True)
+        if not producer.is_healthy():
+            try:
+                producer.reconnect()
+            except Exception as e:
+                LOGGER.error(e)
+                self._connection_lost()
+                self._discard(producer)
+                abort(503)
+            self._connection_restored(reconnected=True)
+
+        try:
+            yield producer
+        except pika.exceptions.UnroutableError:
+            self._checkin(producer)
+            raise
+        except Exception as e:
+            if isinstance(e, pika.exceptions.AMQPConnectionError):
+                # The connection was healthy when it was acquired, so RabbitMQ has become unreachable since.
+                self._connection_lost()
+            self._discard(producer)
+            raise
+        else:
+            self._checkin(producer)
 
-    def _on_response(self, _, __, properties: pika.spec.BasicProperties, body: bytes):
+    def queue_depth(self, queue_name: str, timeout: Optional[float] = None) -> Optional[int]:
         """
-        Verifies that the correct response was sent and loads the it into a Response instance.
+        Returns the number of requests waiting in the queue or None if it cannot be determined (e.g. the queue
+        does not exist yet or RabbitMQ is unreachable).
         """
-        if properties.correlation_id == self.correlation_id:
-            LOGGER.info(f"Received response for request: {{id: {self.correlation_id}}}")
-            self.response = Response(**json.loads(body))
+        try:
+            with self.acquire(timeout=timeout) as producer:
+                return producer.queue_depth(queue_name)
+        except (pika.exceptions.AMQPError, HTTPException) as e:
+            LOGGER.warning(f"Unable to check queue depth: {{queue: {queue_name}, error: {e}}}")
+            return None
 
-    def publish_request(self, content: Dict, routing_key: str, message_timeout: int) -> Response:
+    def _encode_request(self, correlation_id: str, content: Dict,
+                        signature: str) -> Tuple[bytes, Dict[str, Any], Optional[str], Optional[Response]]:
         """
-        Publishes the request to RabbitMQ, if no queue bound with the used routing key exists,
-        the request is aborted with HTTP error 503 as there are no matching workers listening.
+        Encodes and compresses the request, offloads it to the blob store if needed and checks its size.
+
+        :return: the message body, headers, content encoding and an error response if the request is too large.
         """
-        self.channel.confirm_delivery()
-        self._init_callback()
-        self.correlation_id = str(uuid.uuid4())
-        body = json.dumps(content).encode()
-        content_size = getsizeof(body)
+        t1 = time()
+        body, headers = encode_request(content, signature, self.envelope)
+        body, content_encoding = compress(body, self.compression, self.compression_threshold)
+        headers['accept_encoding'] = ','.join(available_codecs())
+        headers['sent_at'] = time()
+        content_size = len(body)
+        REQUEST_SIZE.observe(content_size, service=self.exchange_name)
+        if self.blob_store is not None:
+            headers['accept_claim_check'] = True
+            if content_size > self.claim_check_threshold:
+                try:
+                    headers['claim_check'] = self.blob_store.put(body)
+                    LOGGER.debug(f"Request offloaded to the blob store: {{id: {correlation_id}, size: {content_size}}}")
+                    body, content_size = b'', 0
+                except OSError as e:
+                    LOGGER.error(f"Unable to offload the request to the blob store: {{id: {correlation_id}, "
+                                 f"error: {e}}}")
+        SERIALIZATION_TIME.observe(time() - t1, service=self.exchange_name, operation='encode_request')
         if content_size > 1024 * 1024 * SIZE_WARNING_THRESHOLD:
-            LOGGER.warning(f"Request size exceeds the recommended threshold: {{id: {self.correlation_id},"
+            LOGGER.warning(f"Request size exceeds the recommended threshold: {{id: {correlation_id},"
                            f"size: {content_size}}}")
         if content_size > 1024 * 1024 * SIZE_ERROR_THRESHOLD:
-            LOGGER.error(f"Request size exceeds RabbitMQ message size threshold: {{id: {self.correlation_id},"
+            LOGGER.error(f"Request size exceeds RabbitMQ message size threshold: {{id: {correlation_id},"
                          f"size: {content_size}}}")
-            self.channel.close()
-            self.mq_connection.close()
-            return Response(http_status_code=413)
+            return body, headers, content_encoding, Response(http_status_code=413)
+        return body, headers, content_encoding, None
+
+    def _publish(self, correlation_id: str, routing_key: str, body: bytes, headers: Dict[str, Any],
+                 content_encoding: Optional[str], message_timeout: int, router: MQResponseRouter, timeout: float,
+                 priority: Optional[int] = None):
+        """
+        Publishes an encoded request using a producer from the pool.
+        """
+        with self.acquire(timeout=timeout) as producer:
+            producer.publish(routing_key,
+                             pika.BasicProperties(reply_to=router.callback_queue,
+                                                  correlation_id=correlation_id,
+                                                  expiration=str(message_timeout),
+                                                  content_type=ENVELOPES[self.envelope],
+                                                  content_encoding=content_encoding,
+                                                  priority=priority,
+                                                  headers=headers),
+                             body)
+        LOGGER.debug(f"Sent request: {{id: {correlation_id}}}")
+
+    def _hedge(self, hedging: HedgePolicy, correlation_id: str, routing_key: str, body: bytes,
+               headers: Dict[str, Any], content_encoding: Optional[str], message_timeout: int,
+               router: MQResponseRouter, callback: Callable, deadline: float, priority: Optional[int]) -> Optional[str]:
+        """
+        Publishes a duplicate of a request whose response is late, unless the hedge rate limit has been reached.
+
+        :return: the correlation id of the duplicate or None if it was not sent.
+        """
+        if time() >= deadline or not hedging.acquire():
+            return None
+        hedge_id = str(uuid.uuid4())
+        if hedging.routing_key is not None:
+            routing_key = '{}.{}'.format(self.exchange_name, hedging.routing_key)
+        router.register(hedge_id, callback)
+        try:
+            self._publish(hedge_id, routing_key, body, headers, content_encoding, message_timeout, router,
+                          timeout=max(deadline - time(), 0), priority=priority)
+        except (pika.exceptions.AMQPError, HTTPException, TimeoutError) as e:
+            router.unregister(hedge_id)
+            LOGGER.warning(f"Unable to hedge request: {{id: {correlation_id}, error: {e}}}")
+            return None
+        LOGGER.info(f"Request hedged: {{id: {correlation_id}, hedge: {hedge_id}, routing_key: {routing_key}}}")
+        return hedge_id
+
+    def _pick_reply(self, properties: pika.spec.BasicProperties, correlation_ids: List[str], routing_key: str,
+                    router: MQResponseRouter, hedging: Optional[HedgePolicy], t1: float):
+        """
+        Records the response time of a request and stops waiting for the responses of its other copies.
+        """
+        hedge_won = properties.correlation_id != correlation_ids[0]
+        if hedging is not None:
+            hedging.observe(routing_key, time() - t1, hedge_won=hedge_won)
+        if len(correlation_ids) > 1:
+            REQUESTS_HEDGED.inc(service=self.exchange_name, winner='hedge' if hedge_won else 'primary')
+            for correlation_id in correlation_ids:
+                if correlation_id != properties.correlation_id:
+                    router.unregister(correlation_id)
+
+    @staticmethod
+    def _observe_timeout(hedging: Optional[HedgePolicy], routing_key: str, t1: Optional[float]):
+        """
+        Records the time waited for a request that timed out without any reply as a lower bound of its latency.
+        """
+        if hedging is not None and t1 is not None:
+            hedging.observe(routing_key, time() - t1, timed_out=True)
+
+    def publish_request(self, content: Dict, signature: str, routing_key: str, message_timeout: int,
+                        router: MQResponseRouter, priority: Optional[int] = None,
+                        hedging: Optional[HedgePolicy] = None) -> Union[Response, StreamingResponse]:
+        """
+        Publishes the request to RabbitMQ, if no queue bound with the used routing key exists,
+        the request is aborted with HTTP error 503 as there are no matching workers listening. The producer is
+        returned to the pool right after publishing and the response is received through the shared callback
+        queue of the router. If no response arrives within message_timeout milliseconds, the request is
+        abandoned with HTTP error 504 and any late response to it is dropped by the router. If the worker streams
+        its response, a StreamingResponse is returned as soon as the first chunk arrives. The deadline of the
+        request is passed on in the 'deadline' header (a UNIX timestamp) so that workers can skip requests that
+        nobody is waiting for anymore. If a hedging policy is given, a duplicate of a request whose response is
+        late is published and the first response to arrive is used.
+        """
+        deadline = time() + message_timeout / 1000
+        correlation_id = str(uuid.uuid4())
+        body, headers, content_encoding, error = self._encode_request(correlation_id, content, signature)
+        if error is not None:
+            return error
+        headers['deadline'] = deadline
+
+        if not router.wait_ready(message_timeout / 1000):
+            LOGGER.error(f"Response router is not connected: {{id: {correlation_id}}}")
+            self._release_request(headers)
+            return Response(http_status_code=503)
+
+        replies = queue.Queue()
+        callback = lambda properties, reply: replies.put((properties, reply))
+        router.register(correlation_id, callback)
+        correlation_ids = [correlation_id]
+        streaming = False
+        # Time when the request was published, None once a reply has been picked.
+        t1 = None
+        try:
+            self._publish(correlation_id, routing_key, body, headers, content_encoding, message_timeout, router,
+                          timeout=max(deadline - time(), 0), priority=priority)
+            t1 = time()
+            hedge_delay = hedging.delay(routing_key) if hedging is not None else None
+            if hedge_delay is None:
+                properties, reply = replies.get(timeout=max(deadline - time(), 0))
+            else:
+                try:
+                    properties, reply = replies.get(timeout=max(min(hedge_delay, deadline - time()), 0))
+                except queue.Empty:
+                    hedge_id = self._hedge(hedging, correlation_id, routing_key, body, headers, content_encoding,
+                                           message_timeout, router, callback, deadline, priority)
+                    if hedge_id is not None:
+                        correlation_ids.append(hedge_id)
+                    properties, reply = replies.get(timeout=max(deadline - time(), 0))
+            self._pick_reply(properties, correlation_ids, routing_key, router, hedging, t1)
+            t1 = None
+            correlation_ids = [properties.correlation_id]
+            LOGGER.info(f"Received response for request: {{id: {properties.correlation_id}}}")
+            if properties.headers and 'stream_sequence' in properties.headers:
+                if properties.headers['http_status_code'] != 200:
+                    return Response(http_status_code=properties.headers['http_status_code'])
+                streaming = True
+                chunks = self._stream(properties, reply, replies, properties.correlation_id, router,
+                                      message_timeout)
+                return StreamingResponse(ReplyStream(chunks, partial(router.unregister, properties.correlation_id)),
+                                         mimetype=properties.headers['mimetype'],
+                                         http_status_code=properties.headers['http_status_code'])
+            return self._decode_response(properties, reply)
+
+        except pika.exceptions.UnroutableError:
+            return Response("Request cannot be processed. Check your request or try again later.",
+                            http_status_code=503)
+        except queue.Empty:
+            LOGGER.warning(f"Request timed out: {{id: {correlation_id}, timeout: {message_timeout} ms}}")
+            self._observe_timeout(hedging, routing_key, t1)
+            return Response("Request timed out. Try again later.", http_status_code=504)
+        finally:
+            self._release_request(headers)
+            if not streaming:
+                for correlation_id in correlation_ids:
+                    router.unregister(correlation_id)
+
+    async def publish_request_async(self, content: Dict, signature: str, routing_key: str, message_timeout: int,
+                                    router: MQResponseRouter, priority: Optional[int] = None,
+                                    hedging: Optional[HedgePolicy] = None) -> Response:
+        """
+        An asyncio equivalent of publish_request(). Publishing (which waits for the delivery confirmation),
+        encoding and decoding the messages and accessing the blob store are done in the default executor of the
+        event loop, waiting for the response does not occupy any threads. Streamed responses are collected into a
+        single Response.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = time() + message_timeout / 1000
+        correlation_id = str(uuid.uuid4())
+        body, headers, content_encoding, error = await loop.run_in_executor(
+            None, self._encode_request, correlation_id, content, signature)
+        if error is not None:
+            return error
+        headers['deadline'] = deadline
+
+        if not router.wait_ready(0) and \
+                not await loop.run_in_executor(None, router.wait_ready, message_timeout / 1000):
+            LOGGER.error(f"Response router is not connected: {{id: {correlation_id}}}")
+            await self._release_request_async(headers)
+            return Response(http_status_code=503)
+
+        replies = asyncio.Queue()
+        callback = lambda properties, reply: loop.call_soon_threadsafe(replies.put_nowait, (properties, reply))
+        router.register(correlation_id, callback)
+        correlation_ids = [correlation_id]
+        t1 = None
         try:
-            self.channel.basic_publish(
-                exchange=self.exchange_name,
-                routing_key=routing_key,
-                properties=pika.BasicProperties(
-                    reply_to=self.callback_queue,
-                    correlation_id=self.correlation_id,
-                    expiration=str(message_timeout)),
-                mandatory=True,
-                body=json.dumps(content).encode()
-            )
-            LOGGER.debug(f"Sent request: {{id: {self.correlation_id}}}")
-            while not self.response:
-                self.mq_connection.process_data_events()
-
-
-            self.channel.close()
-            self.mq_connection.close()
-            return self.response
+            await loop.run_in_executor(None, partial(self._publish, correlation_id, routing_key, body, headers,
+                                                     content_encoding, message_timeout, router,
+                                                     timeout=max(deadline - time(), 0), priority=priority))
+            t1 = time()
+            hedge_delay = hedging.delay(routing_key) if hedging is not None else None
+            if hedge_delay is None:
+                properties, reply = await asyncio.wait_for(replies.get(), timeout=max(deadline - time(), 0))
+            else:
+                try:
+                    properties, reply = await asyncio.wait_for(replies.get(),
+                                                               timeout=max(min(hedge_delay, deadline - time()), 0))
+                except asyncio.TimeoutError:
+                    hedge_id = await loop.run_in_executor(None, partial(
+                        self._hedge, hedging, correlation_id, routing_key, body, headers, content_encoding,
+                        message_timeout, router, callback, deadline, priority))
+                    if hedge_id is not None:
+                        correlation_ids.append(hedge_id)
+                    properties, reply = await asyncio.wait_for(replies.get(), timeout=max(deadline - time(), 0))
+            self._pick_reply(properties, correlation_ids, routing_key, router, hedging, t1)
+            t1 = None
+            correlation_ids = [properties.correlation_id]
+            correlation_id = properties.correlation_id
+            LOGGER.info(f"Received response for request: {{id: {correlation_id}}}")
+            if properties.headers and 'stream_sequence' in properties.headers:
+                if properties.headers['http_status_code'] != 200:
+                    return Response(http_status_code=properties.headers['http_status_code'])
+                chunks = []
+                while self._check_chunk(properties, len(chunks), correlation_id):
+                    chunks.append(decompress(reply, properties.content_encoding))
+                    properties, reply = await asyncio.wait_for(replies.get(), timeout=message_timeout / 1000)
+                    while properties.correlation_id != correlation_id:
+                        # A late message of the other copy of a hedged request.
+                        properties, reply = await asyncio.wait_for(replies.get(), timeout=message_timeout / 1000)
+                return Response(content=b''.join(chunks), mimetype=properties.headers['mimetype'])
+            return await loop.run_in_executor(None, self._decode_response, properties, reply)
 
         except pika.exceptions.UnroutableError:
-            self.channel.close()
-            self.mq_connection.close()
             return Response("Request cannot be processed. Check your request or try again later.",
                             http_status_code=503)
+        except asyncio.TimeoutError:
+            LOGGER.warning(f"Request timed out: {{id: {correlation_id}, timeout: {message_timeout} ms}}")
+            self._observe_timeout(hedging, routing_key, t1)
+            return Response("Request timed out. Try again later.", http_status_code=504)
+        except (IOError, ValueError) as e:
+            # A broken stream or a chunk that cannot be decompressed.
+            LOGGER.error(e)
+            return Response(http_status_code=502)
+        finally:
+            for correlation_id in correlation_ids:
+                router.unregister(correlation_id)
+            await self._release_request_async(headers)
+
+    def _release_request(self, headers: Dict[str, Any]):
+        """
+        Deletes the offloaded request from the blob store once a response has arrived or the request has been
+        abandoned. The worker that responded has already read the request and workers skip requests past their
+        deadline without reading them. The other copy of a hedged request is answered with an error that nobody
+        waits for if it has not been read yet.
+        """
+        if 'claim_check' in headers:
+            self.blob_store.delete(headers['claim_check'])
+
+    async def _release_request_async(self, headers: Dict[str, Any]):
+        if 'claim_check' in headers:
+            await asyncio.get_running_loop().run_in_executor(None, self._release_request, headers)
+
+    def _decode_response(self, properties: pika.spec.BasicProperties, reply: bytes) -> Response:
+        t1 = time()
+        reference = (properties.headers or {}).get('claim_check')
+        try:
+            if reference is None:
+                RESPONSE_SIZE.observe(len(reply), service=self.exchange_name)
+                response = Response.decode(decompress(reply, properties.content_encoding), properties.content_type,
+                                           properties.headers)
+            else:
+                try:
+                    with self.blob_store.open(reference) as payload:
+                        RESPONSE_SIZE.observe(len(payload), service=self.exchange_name)
+                        response = Response.decode(decompress(payload, properties.content_encoding),
+                                                   properties.content_type, properties.headers)
+                except (KeyError, OSError) as e:
+                    LOGGER.error(f"Unable to read the response from the blob store: "
+                                 f"{{id: {properties.correlation_id}, error: {e}}}")
+                    return Response(http_status_code=502)
+                finally:
+                    # Each response is read only once.
+                    self.blob_store.delete(reference)
+        except (ValueError, TypeError, KeyError) as e:
+            LOGGER.error(f"Unable to decode the response: {{id: {properties.correlation_id}, error: {e}}}")
+            return Response(http_status_code=502)
+        SERIALIZATION_TIME.observe(time() - t1, service=self.exchange_name, operation='decode_response')
+        return response
+
+    @staticmethod
+    def _check_chunk(properties: pika.spec.BasicProperties, expected_sequence: int, correlation_id: str) -> bool:
+        """
+        Validates a message of a streamed response.
+
+        :return: False if the message is the end marker, True if it contains a chunk.
+        """
+        headers = properties.headers
+        if headers.get('stream_sequence') != expected_sequence:
+            raise IOError(f"Streamed response chunk out of order: {{id: {correlation_id}, "
+                          f"expected: {expected_sequence}, received: {headers.get('stream_sequence')}}}")
+        if headers.get('stream_end'):
+            if headers.get('stream_error'):
+                raise IOError(f"Worker failed while streaming the response: {{id: {correlation_id}}}")
+            LOGGER.info(f"Received streamed response: {{id: {correlation_id}, chunks: {expected_sequence}}}")
+            return False
+        return True
+
+    @staticmethod
+    def _stream(properties: pika.spec.BasicProperties, reply: bytes, replies: queue.Queue, correlation_id: str,
+                router: MQResponseRouter, message_timeout: int) -> Iterator[bytes]:
+        """
+        Yields the chunks of a streamed response until the end marker is received. Each chunk must arrive within
+        message_timeout milliseconds of the previous one. Raises an error if the stream breaks so that the HTTP
+        response is not mistaken for a complete one.
+        """
+        try:
+            expected_sequence = 0
+            while MQProducerPool._check_chunk(properties, expected_sequence, correlation_id):
+                try:
+                    chunk = decompress(reply, properties.content_encoding)
+                except ValueError as e:
+                    raise IOError(f"Streamed response chunk is corrupt: {{id: {correlation_id}, error: {e}}}")
+                yield chunk
+                expected_sequence += 1
+                try:
+                    properties, reply = replies.get(timeout=message_timeout / 1000)
+                    while properties.correlation_id != correlation_id:
+                        # A late message of the other copy of a hedged request.
+                        properties, reply = replies.get(timeout=message_timeout / 1000)
+                except queue.Empty:
+                    raise IOError(f"Streamed response timed out: {{id: {correlation_id}}}")
+        finally:
+            router.unregister(correlation_id)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the current state of the pool and counters of pool events.
+        """
+        with self._lock:
+            return {'size': self.size,
+                    'open': self._open,
+                    'idle': len(self._idle),
+                    'in_use': self._open - len(self._idle),
+                    **self._stats}
+
+    def close(self):
+        """
+        Closes all idle connections and stops checking them.
+        """
+        self._closed.set()
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        for producer in idle:
+            producer.close()
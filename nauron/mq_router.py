@@ -0,0 +1,123 @@
+import logging
+import threading
+
+from typing import Callable, Dict, Optional
+
+import pika
+import pika.exceptions
+
+from nauron.transport import BrokerParameters, Reconnector, get_transport
+
+LOGGER = logging.getLogger(__name__)
+
+ReplyCallback = Callable[[pika.spec.BasicProperties, bytes], None]
+
+
+class MQResponseRouter:
+    def __init__(self, connection_parameters: BrokerParameters):
+        """
+        A long-lived reply consumer that is shared by all producers of the process. Responses from all workers are
+        sent to a single exclusive callback queue and dispatched to the waiting requests by their correlation id.
+
+        :param connection_parameters: RabbitMQ connection parameters, a sequence of them to fail over between the
+        nodes of a cluster, or another transport.
+        """
+        self.connection_parameters = connection_parameters
+        self.transport = get_transport(connection_parameters)
+        self.callback_queue: Optional[str] = None
+
+        self._pending: Dict[str, ReplyCallback] = {}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # Every remote request depends on the router, so it keeps retrying at least once a second.
+        self._reconnector = Reconnector('router', maximum=1)
+
+    def start(self):
+        """
+        Starts the consumer thread unless it is already running.
+        """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='nauron-response-router', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """
+        Stops the consumer thread. The callback queue is deleted automatically by RabbitMQ once the connection
+        is closed.
+        """
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """
+        Blocks until the callback queue has been declared and is being consumed.
+        """
+        return self._ready.wait(timeout)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            connection = None
+            try:
+                connection = self.transport.connect()
+                channel = connection.channel()
+                result = channel.queue_declare(queue='', exclusive=True)
+                channel.basic_consume(queue=result.method.queue, on_message_callback=self._on_response,
+                                      auto_ack=True)
+                self.callback_queue = result.method.queue
+                self._ready.set()
+                self._reconnector.connected()
+                LOGGER.info(f"Response router listening: {{queue: {self.callback_queue}}}")
+                while not self._stopped.is_set():
+                    connection.process_data_events(time_limit=1)
+            except pika.exceptions.AMQPError as e:
+                self._ready.clear()
+                self._stopped.wait(self._reconnector.failed(e))
+            finally:
+                if connection is not None and connection.is_open:
+                    try:
+                        connection.close()
+                    except pika.exceptions.AMQPError:
+                        pass
+        self._ready.clear()
+
+    def _on_response(self, _, __, properties: pika.spec.BasicProperties, body: bytes):
+        """
+        Passes the response to the request waiting for it. Responses to unknown requests are dropped.
+        """
+        with self._lock:
+            callback = self._pending.get(properties.correlation_id)
+        if callback is None:
+            LOGGER.debug(f"Dropped response for unknown request: {{id: {properties.correlation_id}}}")
+            return
+        try:
+            callback(properties, body)
+        except Exception as e:
+            LOGGER.error(f"Unable to pass on response: {{id: {properties.correlation_id}, error: {e}}}")
+
+    def register(self, correlation_id: str, callback: ReplyCallback):
+        """
+        Registers a callback for responses with the given correlation id. The callback is called from the router
+        thread so it should only hand over the response to the waiting thread.
+        """
+        with self._lock:
+            self._pending[correlation_id] = callback
+
+    def unregister(self, correlation_id: str):
+        """
+        Stops waiting for responses with the given correlation id.
+        """
+        with self._lock:
+            self._pending.pop(correlation_id, None)
+
+    def pending(self) -> int:
+        """
+        Returns the number of requests currently waiting for a response.
+        """
+        with self._lock:
+            return len(self._pending)
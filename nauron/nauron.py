@@ -1,54 +1,227 @@
 import uuid
+import queue
+import asyncio
+import threading
 from time import sleep, time
 import logging
-from typing import Dict, Optional
+from functools import partial
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict, Optional, Any, Union, Tuple, List, Callable
 from dataclasses import dataclass, field
 
-import pika
 import pika.exceptions
 from flask import Flask
+from werkzeug.exceptions import HTTPException, TooManyRequests, ServiceUnavailable
 
 from nauron.worker import Worker
+from nauron.helpers import Response, StreamingResponse, COMPRESSION_THRESHOLD
+from nauron.transport import BrokerParameters, Reconnector, get_transport
+from nauron.cache import CacheBackend, ResponseCache, cache_key
+from nauron.metrics import REGISTRY, CONTENT_TYPE, REQUESTS, REQUEST_DURATION, REQUESTS_IN_FLIGHT, \
+    REQUESTS_REJECTED
+from nauron.batching import MicroBatcher
+from nauron.local_executor import LocalExecutor
+from nauron.mq_producer import MQProducerPool
+from nauron.mq_router import MQResponseRouter
+from nauron.scatter_gather import Splitter, Merger
+from nauron.blob_store import BlobStore, CLAIM_CHECK_THRESHOLD
+from nauron.hedging import HedgePolicy
+from nauron.validation import Validator, VALIDATION_ERRORS, compile_validator, error_messages
 
 LOGGER = logging.getLogger(__name__)
 
+# Maximum delay in seconds between attempts to initialize a remote service.
+MAX_INIT_DELAY = 30
+
 
 @dataclass
 class Service:
     name: str
     timeout: int
     remote: bool = False
-    mq_parameters: Optional[pika.ConnectionParameters] = None
+    mq_parameters: Optional[BrokerParameters] = None
     workers: Dict[str, Worker] = field(default_factory=dict)
+    pool_size: int = 8
+    compression: Optional[str] = None
+    compression_threshold: int = COMPRESSION_THRESHOLD
+    router: Optional[MQResponseRouter] = None
+    cache: Optional[CacheBackend] = None
+    priority: Optional[int] = None
+    signature_priorities: Dict[str, int] = field(default_factory=dict)
+    max_in_flight: Optional[int] = None
+    max_queue_depth: Optional[int] = None
+    queue_depth_interval: float = 1
+    retry_after: Optional[int] = None
+    overload_status_code: int = 503
+    splitter: Optional[Splitter] = None
+    merger: Optional[Merger] = None
+    shard_concurrency: int = 16
+    blob_store: Optional[BlobStore] = None
+    claim_check_threshold: int = CLAIM_CHECK_THRESHOLD
+    validator: Optional[Validator] = None
+    signature_validators: Dict[str, Validator] = field(default_factory=dict)
+    hedging: Optional[HedgePolicy] = None
+    envelope: str = 'json'
+    _validators: Dict[Optional[str], Callable[[Dict], Dict]] = field(default_factory=dict, init=False, repr=False)
+    _in_flight: Optional[threading.BoundedSemaphore] = field(default=None, init=False, repr=False)
+    _queue_depths: Dict[str, Tuple[float, Optional[int]]] = field(default_factory=dict, init=False, repr=False)
+    _queue_depth_lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+    _response_cache: Optional[ResponseCache] = field(default=None, init=False, repr=False)
+    _handlers: Dict[str, Union[MicroBatcher, LocalExecutor]] = field(default_factory=dict, init=False, repr=False)
+    _pool: Optional[MQProducerPool] = field(default=None, init=False, repr=False)
+    _exchange_declared: threading.Event = field(default_factory=threading.Event, init=False, repr=False)
+    _shard_executor: Optional[ThreadPoolExecutor] = field(default=None, init=False, repr=False)
 
     def __post_init__(self):
+        if self.overload_status_code not in (429, 503):
+            raise ValueError("Overload status code must be either 429 or 503.")
+        if (self.splitter is None) != (self.merger is None):
+            raise ValueError("Both a splitter and a merger are needed to split requests.")
+        if self.validator is not None:
+            self._validators[None] = compile_validator(self.validator)
+        for signature, validator in self.signature_validators.items():
+            self._validators[signature] = compile_validator(validator)
+        if self.max_in_flight is not None:
+            self._in_flight = threading.BoundedSemaphore(self.max_in_flight)
+        if self.cache is not None:
+            self._response_cache = ResponseCache(self.cache)
         if self.remote:
-            while True:
-                try:
-                    connection = pika.BlockingConnection(self.mq_parameters)
-                    channel = connection.channel()
-                    channel.exchange_declare(exchange=self.name, exchange_type='direct')
-                    channel.close()
-                    connection.close()
-                    LOGGER.info(f'MQ exchange for service {self.name} initialized.')
-                    break
-                except pika.exceptions.AMQPConnectionError as e:
-                    LOGGER.error(e)
-                    LOGGER.error(f"Unable to initialize MQ exchange for service {self.name}.")
-                    LOGGER.info('Trying to reconnect in 10 seconds.')
-                    sleep(10)
+            self._pool = MQProducerPool(self.mq_parameters, self.name, size=self.pool_size,
+                                        compression=self.compression,
+                                        compression_threshold=self.compression_threshold,
+                                        blob_store=self.blob_store,
+                                        claim_check_threshold=self.claim_check_threshold,
+                                        envelope=self.envelope)
+            if self.router is None:
+                self.router = MQResponseRouter(self.mq_parameters)
+            self.router.start()
+            if self.splitter is not None:
+                self._shard_executor = ThreadPoolExecutor(max_workers=self.shard_concurrency,
+                                                          thread_name_prefix=f'nauron-shard-{self.name}')
+            threading.Thread(target=self._declare_exchange, name=f'nauron-init-{self.name}', daemon=True).start()
+
+    def _declare_exchange(self):
+        """
+        Declares the exchange of the service in the background, retrying with an exponentially increasing delay
+        until RabbitMQ is reachable.
+        """
+        transport = get_transport(self.mq_parameters)
+        reconnector = Reconnector(f'service:{self.name}', maximum=MAX_INIT_DELAY)
+        while True:
+            try:
+                connection = transport.connect()
+                channel = connection.channel()
+                channel.exchange_declare(exchange=self.name, exchange_type='direct')
+                channel.close()
+                connection.close()
+                self._exchange_declared.set()
+                reconnector.connected()
+                LOGGER.info(f'MQ exchange for service {self.name} initialized.')
+                return
+            except pika.exceptions.AMQPError as e:
+                LOGGER.error(f"Unable to initialize MQ exchange for service {self.name}.")
+                sleep(reconnector.failed(e))
+
+    @property
+    def status(self) -> str:
+        """
+        'ready' if the service can process requests, 'initializing' if the exchange of a remote service has not
+        been declared yet or 'disconnected' if the response router has lost its connection to RabbitMQ.
+        """
+        if not self.remote:
+            return 'ready'
+        if not self._exchange_declared.is_set():
+            return 'initializing'
+        if not self.router.wait_ready(0):
+            return 'disconnected'
+        return 'ready'
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """
+        Blocks until a remote service is ready to process requests. Returns False if the timeout (in seconds)
+        expired first.
+        """
+        if not self.remote:
+            return True
+        t1 = time()
+        if not self._exchange_declared.wait(timeout):
+            return False
+        return self.router.wait_ready(None if timeout is None else max(timeout - (time() - t1), 0))
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns runtime statistics of the service.
+        """
+        stats = {'status': self.status}
+        if self._pool is not None:
+            stats['pool'] = self._pool.stats()
+        if self.router is not None:
+            stats['pending_responses'] = self.router.pending()
+        if self._response_cache is not None:
+            stats['cache'] = self._response_cache.stats()
+        if self.hedging is not None:
+            stats['hedging'] = self.hedging.stats()
+        executors = {routing_key: handler.stats() for routing_key, handler in self._handlers.items()
+                     if isinstance(handler, LocalExecutor)}
+        if executors:
+            stats['executors'] = executors
+        if self._queue_depths:
+            with self._queue_depth_lock:
+                stats['queue_depth'] = {routing_key: depth for routing_key, (_, depth) in self._queue_depths.items()}
+        return stats
+
+    def close(self):
+        """
+        Closes the connections of the service and shuts down the executors and batchers of local workers. The
+        shared response router is left running.
+        """
+        if self._pool is not None:
+            self._pool.close()
+        if self._shard_executor is not None:
+            self._shard_executor.shutdown(wait=False)
+        for handler in self._handlers.values():
+            handler.close()
 
     def add_worker(self,
                    worker: Worker,
-                   routing_key: str = "default"):
+                   routing_key: str = "default",
+                   batch_size: int = 1,
+                   batch_timeout: int = 0,
+                   executor: Optional[str] = None,
+                   concurrency: int = 1,
+                   max_queue_size: Optional[int] = None):
         """
         Adds a local worker instance to the service.
         :param worker: A nauron Worker instance.
         :param routing_key: An optional routing key that can be used to map any request to this worker. Useful when
         multiple unique workers exist for the service. In case the same routing key is used multiple times,
         the last mapping will be used.
+        :param batch_size: Maximum number of concurrent requests passed to Worker.process_batch() at once.
+        Batching is disabled by default.
+        :param batch_timeout: Maximum time in milliseconds to wait for more requests before processing an
+        incomplete batch.
+        :param executor: None (default) to process requests on the Flask thread that received them, 'thread' to
+        use a dedicated thread pool or 'process' to use a process pool where each process holds its own copy of
+        the worker. Cannot be combined with batching.
+        :param concurrency: Number of requests processed simultaneously when an executor is used.
+        :param max_queue_size: Maximum number of requests waiting for the executor, further requests are rejected
+        with HTTP error 503 (or overload_status_code). Unlimited by default.
         """
+        if executor is not None and batch_size > 1:
+            raise ValueError("Batching cannot be combined with an executor.")
+        handler = None
+        if batch_size > 1:
+            handler = MicroBatcher(worker, batch_size, batch_timeout)
+        elif executor is not None:
+            handler = LocalExecutor(worker, executor, concurrency, max_queue_size)
+
         self.workers[routing_key]=worker
+        previous = self._handlers.pop(routing_key, None)
+        if previous is not None:
+            previous.close()
+        if handler is not None:
+            self._handlers[routing_key] = handler
 
     def process_request(self,
                         content: Dict,
@@ -66,22 +239,258 @@ class Service:
         mapping is prioritized.
         :return: Returns a Flask-friendly response from nauron's Response object.
         """
+        labels = {'service': self.name, 'routing_key': routing_key, 'signature': signature}
+        t1 = time()
+        REQUESTS_IN_FLIGHT.inc(**labels)
+        try:
+            response = self._get_response(content, signature, routing_key)
+        except HTTPException as e:
+            self._observe(labels, t1, e.code)
+            raise
+        except Exception:
+            self._observe(labels, t1, 500)
+            raise
+        self._observe(labels, t1, response.http_status_code)
+        return response.flask_response()
+
+    async def process_request_async(self,
+                                    content: Dict,
+                                    signature: str = "default",
+                                    routing_key: str = "default"):
+        """
+        An asyncio equivalent of process_request() that can be awaited in async Flask views. Remote requests do not
+        block a thread while waiting for the response and local workers are run in the default executor of the
+        event loop. Streamed responses of remote workers are collected into a single response. Async views require
+        Flask with the 'async' extra (pip install nauron[async]).
+        """
+        labels = {'service': self.name, 'routing_key': routing_key, 'signature': signature}
+        t1 = time()
+        REQUESTS_IN_FLIGHT.inc(**labels)
+        try:
+            response = await self._get_response_async(content, signature, routing_key)
+        except HTTPException as e:
+            self._observe(labels, t1, e.code)
+            raise
+        except Exception:
+            self._observe(labels, t1, 500)
+            raise
+        self._observe(labels, t1, response.http_status_code)
+        return response.flask_response()
+
+    @staticmethod
+    def _observe(labels: Dict[str, str], t1: float, status: int):
+        REQUESTS_IN_FLIGHT.dec(**labels)
+        REQUEST_DURATION.observe(time() - t1, **labels)
+        REQUESTS.inc(status=status, **labels)
+
+    def _validate(self, content: Dict, signature: str) -> Tuple[Dict, Optional[Response]]:
+        """
+        Validates the request before it reaches any worker.
+
+        :return: the normalized content and an error response if the request is invalid.
+        """
+        validator = self._validators.get(signature, self._validators.get(None))
+        if validator is None:
+            return content, None
+        try:
+            return validator(content), None
+        except VALIDATION_ERRORS as e:
+            LOGGER.debug(f"Invalid request: {{service: {self.name}, signature: {signature}, error: {e}}}")
+            REQUESTS_REJECTED.inc(service=self.name, reason='validation')
+            return content, Response(content=error_messages(e), http_status_code=400)
+
+    def _get_response(self, content: Dict, signature: str, routing_key: str) -> Union[Response, StreamingResponse]:
+        content, error = self._validate(content, signature)
+        if error is not None:
+            return error
+        if self._response_cache is not None:
+            try:
+                key = cache_key(self.name, routing_key, signature, content)
+            except (TypeError, ValueError) as e:
+                LOGGER.debug(f"Request cannot be cached: {e}")
+            else:
+                return self._response_cache.get_or_compute(
+                    key, partial(self._process_request, content, signature, routing_key))
+
+        return self._process_request(content, signature, routing_key)
+
+    async def _get_response_async(self, content: Dict, signature: str,
+                                  routing_key: str) -> Union[Response, StreamingResponse]:
+        content, error = self._validate(content, signature)
+        if error is not None:
+            return error
+        if self._response_cache is not None:
+            try:
+                key = cache_key(self.name, routing_key, signature, content)
+            except (TypeError, ValueError) as e:
+                LOGGER.debug(f"Request cannot be cached: {e}")
+            else:
+                return await self._response_cache.get_or_compute_async(
+                    key, partial(self._process_request_async, content, signature, routing_key))
+
+        return await self._process_request_async(content, signature, routing_key)
+
+    def _reject(self, reason: str, status_code: Optional[int] = None):
+        """
+        Rejects the request right away with HTTP error 429 or 503 (depending on overload_status_code) instead of
+        letting it wait in line.
+        """
+        LOGGER.warning(f"Request rejected: {{service: {self.name}, reason: {reason}}}")
+        REQUESTS_REJECTED.inc(service=self.name, reason=reason)
+        status_code = status_code or self.overload_status_code
+        exception = TooManyRequests() if status_code == 429 else ServiceUnavailable()
+        if self.retry_after is not None:
+            response = exception.get_response()
+            response.headers['Retry-After'] = str(self.retry_after)
+            exception.response = response
+        raise exception
+
+    def _queue_depth(self, routing_key: str) -> Optional[int]:
+        """
+        Returns the number of requests waiting in the queue of the routing key. The value is probed from RabbitMQ
+        at most once per queue_depth_interval seconds, other requests use the previous value in the meantime.
+        """
+        now = time()
+        with self._queue_depth_lock:
+            checked_at, depth = self._queue_depths.get(routing_key, (0, None))
+            if now - checked_at < self.queue_depth_interval:
+                return depth
+            self._queue_depths[routing_key] = (now, depth)
+        depth = self._pool.queue_depth('{}.{}'.format(self.name, routing_key), timeout=self.queue_depth_interval)
+        with self._queue_depth_lock:
+            self._queue_depths[routing_key] = (time(), depth)
+        return depth
+
+    def _check_ready(self):
+        if self.status != 'ready':
+            self._reject(self.status, status_code=503)
+
+    def _check_queue_depth(self, routing_key: str):
+        if self.max_queue_depth is None:
+            return
+        depth = self._queue_depth(routing_key)
+        if depth is not None and depth >= self.max_queue_depth:
+            self._reject('queue_depth')
+
+    @contextmanager
+    def _admit(self):
+        """
+        Holds an in-flight slot while the request is processed or rejects the request if there are none left.
+        Streamed responses release the slot once the first chunk has been received.
+        """
+        if self._in_flight is None:
+            yield
+            return
+        if not self._in_flight.acquire(blocking=False):
+            self._reject('in_flight')
+        try:
+            yield
+        finally:
+            self._in_flight.release()
+
+    async def _process_request_async(self, content: Dict, signature: str,
+                                     routing_key: str) -> Union[Response, StreamingResponse]:
+        if self.remote and routing_key not in self.workers:
+            self._check_ready()
+            if self.max_queue_depth is not None:
+                await asyncio.get_running_loop().run_in_executor(None, self._check_queue_depth, routing_key)
+            with self._admit():
+                shards = self._split(content)
+                responses = await asyncio.gather(*(self._pool.publish_request_async(
+                    shard, signature,
+                    routing_key='{}.{}'.format(self.name, routing_key),
+                    message_timeout=self.timeout,
+                    router=self.router,
+                    priority=self.signature_priorities.get(signature, self.priority),
+                    hedging=self.hedging) for shard in shards))
+                return responses[0] if len(shards) == 1 else self._merge(responses)
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self._process_request, content, signature, routing_key)
+
+    def _process_request(self, content: Dict, signature: str, routing_key: str) -> Union[Response, StreamingResponse]:
+        """
+        Processes the request after admission control. Cache hits and collapsed requests bypass it.
+        """
         if self.remote and routing_key not in self.workers:
-            from nauron.mq_producer import MQProducer
-            producer = MQProducer(self.mq_parameters, self.name)
-            response = producer.publish_request(
-                {"signature": signature, "content": content},
-                routing_key='{}.{}'.format(self.name, routing_key),
-                message_timeout=self.timeout)
+            self._check_ready()
+            self._check_queue_depth(routing_key)
+        with self._admit():
+            return self._dispatch(content, signature, routing_key)
+
+    def _split(self, content: Dict) -> List[Dict]:
+        if self.splitter is None:
+            return [content]
+        shards = self.splitter(content) or [content]
+        if len(shards) > 1:
+            LOGGER.debug(f"Request split: {{service: {self.name}, shards: {len(shards)}}}")
+        return shards
+
+    def _merge(self, responses: List[Response]) -> Response:
+        try:
+            return self.merger(responses)
+        except Exception as e:
+            LOGGER.error(f"Unable to merge responses: {{service: {self.name}, error: {e}}}")
+            return Response(http_status_code=500)
+
+    def _publish(self, content: Dict, signature: str, routing_key: str,
+                 message_timeout: Optional[int] = None) -> Union[Response, StreamingResponse]:
+        return self._pool.publish_request(
+            content, signature,
+            routing_key='{}.{}'.format(self.name, routing_key),
+            message_timeout=self.timeout if message_timeout is None else message_timeout,
+            router=self.router,
+            priority=self.signature_priorities.get(signature, self.priority),
+            hedging=self.hedging)
+
+    def _publish_shard(self, content: Dict, signature: str, routing_key: str, deadline: float) -> Response:
+        """
+        Publishes a shard of a split request with the time left until the deadline of the whole request. Shards
+        that waited for the executor until the deadline are not published at all.
+        """
+        message_timeout = int((deadline - time()) * 1000)
+        if message_timeout <= 0:
+            return Response("Request timed out. Try again later.", http_status_code=504)
+        response = self._publish(content, signature, routing_key, message_timeout)
+        if isinstance(response, StreamingResponse):
+            try:
+                return response.join()
+            except IOError as e:
+                LOGGER.error(e)
+                return Response(http_status_code=502)
+        return response
+
+    def _dispatch(self, content: Dict, signature: str, routing_key: str) -> Union[Response, StreamingResponse]:
+        if self.remote and routing_key not in self.workers:
+            shards = self._split(content)
+            if len(shards) == 1:
+                return self._publish(shards[0], signature, routing_key)
+            # The shards are processed by any workers listening on the queue at the same time, but together they
+            # have to finish within the timeout of a single request.
+            deadline = time() + self.timeout / 1000
+            futures = [self._shard_executor.submit(self._publish_shard, shard, signature, routing_key, deadline)
+                       for shard in shards]
+            try:
+                responses = [future.result(timeout=max(deadline - time(), 0)) for future in futures]
+            except FutureTimeoutError:
+                for future in futures:
+                    future.cancel()
+                LOGGER.warning(f"Split request timed out: {{service: {self.name}, shards: {len(shards)}, "
+                               f"timeout: {self.timeout} ms}}")
+                return Response("Request timed out. Try again later.", http_status_code=504)
+            response = self._merge(responses)
         else:
             correlation_id = str(uuid.uuid4())
             LOGGER.info(f"Forwarding request to local worker: {{id: {correlation_id}, worker: {routing_key}}}")
             t1 = time()
-            response = self.workers[routing_key].process_request(content, signature)
+            handler = self._handlers.get(routing_key, self.workers[routing_key])
+            try:
+                response = handler.process_request(content, signature)
+            except queue.Full:
+                self._reject('worker_queue')
             t2 = time()
             LOGGER.info(f"Request processed: {{id: {correlation_id}, duration: {round(t2 - t1, 3)}}}")
 
-        return response.flask_response()
+        return response
 
 class Nauron(Flask):
     _services: Dict[str, Service] = {}
@@ -92,38 +501,150 @@ class Nauron(Flask):
 
     def __init__(self, import_name,
                  timeout: int = 60000,
-                 mq_parameters: Optional[pika.ConnectionParameters] = None,
+                 mq_parameters: Optional[BrokerParameters] = None,
+                 mq_pool_size: int = 8,
+                 metrics_endpoint: Optional[str] = None,
                  **kwargs):
         """
         :param import_name: Flask import_name
         :param timeout: Default timeout value for the message queue
-        :param mq_parameters: RabbitMQ connection parameters required for remote services.
+        :param mq_parameters: RabbitMQ connection parameters, a sequence of them to fail over between the nodes of a
+        cluster, or another transport (see nauron.transport). Required for remote services.
+        :param mq_pool_size: Default number of long-lived RabbitMQ connections kept open by each remote service.
+        :param metrics_endpoint: An optional URL rule (e.g. '/metrics') that serves request metrics in the
+        Prometheus text format.
         :param kwargs: additional Flask parameters
         """
         self._timeout = timeout
-        self._mq_parameters = mq_parameters
+        # Resolved once so that all services and the response router share the state of the transport, e.g. which
+        # node of a cluster was reachable last.
+        self._mq_parameters = None if mq_parameters is None else get_transport(mq_parameters)
+        self._mq_pool_size = mq_pool_size
+        self._mq_router = None
         super().__init__(import_name, **kwargs)
+        if metrics_endpoint is not None:
+            self.add_url_rule(metrics_endpoint, 'nauron_metrics', self._metrics, methods=['GET'])
+
+    @staticmethod
+    def _metrics():
+        return REGISTRY.render(), 200, {'Content-Type': CONTENT_TYPE}
 
     def add_service(self,
                     name: str,
-                    remote: bool = False) -> Service:
+                    remote: bool = False,
+                    pool_size: Optional[int] = None,
+                    compression: Optional[str] = None,
+                    compression_threshold: int = COMPRESSION_THRESHOLD,
+                    cache: Optional[CacheBackend] = None,
+                    priority: Optional[int] = None,
+                    signature_priorities: Optional[Dict[str, int]] = None,
+                    max_in_flight: Optional[int] = None,
+                    max_queue_depth: Optional[int] = None,
+                    queue_depth_interval: float = 1,
+                    retry_after: Optional[int] = None,
+                    overload_status_code: int = 503,
+                    splitter: Optional[Splitter] = None,
+                    merger: Optional[Merger] = None,
+                    shard_concurrency: int = 16,
+                    blob_store: Optional[BlobStore] = None,
+                    claim_check_threshold: int = CLAIM_CHECK_THRESHOLD,
+                    validator: Optional[Validator] = None,
+                    signature_validators: Optional[Dict[str, Validator]] = None,
+                    hedging: Optional[HedgePolicy] = None,
+                    envelope: str = 'json') -> Service:
         """"
         Adds a new service that is used to process requests by local or remote workers.
 
         :param name: Name of the service, in case of a remote service, the same name must be used when initializing
         the consumer.
         :param remote: A boolean value that defines whether the service has any remote workers. Enabling this will
-        still allow for adding local workers to the service.
+        still allow for adding local workers to the service. Remote services connect to RabbitMQ in the background
+        and requests to remote workers are rejected with HTTP error 503 until the service is ready.
+        :param pool_size: Number of long-lived RabbitMQ connections kept open for the service. Defaults to the
+        mq_pool_size value of the app.
+        :param compression: Compression codec ('gzip', 'zlib' or the optional 'lz4') used for requests to remote
+        workers that are larger than compression_threshold bytes. Should only be enabled if all workers of the
+        service support it.
+        :param compression_threshold: Minimum request size in bytes to be compressed.
+        :param cache: An optional cache backend (e.g. nauron.cache.LRUCache) for successful responses. Requests
+        are cached by their routing key, signature and content, so it should only be used for deterministic
+        workers.
+        :param priority: RabbitMQ message priority of requests to remote workers. Only has an effect if the workers
+        are started with max_priority, higher values are processed first.
+        :param signature_priorities: Priorities of requests with specific signatures that override the default
+        priority, e.g. {'interactive': 5, 'batch': 1}.
+        :param max_in_flight: Maximum number of requests processed by the service at once. Further requests are
+        rejected immediately instead of waiting. Unlimited by default.
+        :param max_queue_depth: Reject requests to remote workers while at least this many requests are waiting
+        in their RabbitMQ queue. The queue depth is not checked by default.
+        :param queue_depth_interval: Time in seconds for which a probed queue depth is reused.
+        :param retry_after: An optional value in seconds for the Retry-After header of rejected requests.
+        :param overload_status_code: HTTP status code of rejected requests, either 503 (default) or 429.
+        :param splitter: An optional function that splits the content of a request to remote workers into shards
+        (e.g. nauron.scatter_gather.split_list('text', 20)). The shards are published as separate requests so that
+        they are processed by all workers of the queue in parallel, and their responses are combined by the merger.
+        Admission control and caching apply to the original request as a whole.
+        :param merger: A function that combines the responses of the shards, in the order of the shards, into a
+        single response (e.g. nauron.scatter_gather.merge_lists('text')). It is also responsible for handling
+        failed shards. Required if a splitter is used.
+        :param shard_concurrency: Maximum number of shards awaited at once by synchronous requests.
+        :param blob_store: A store shared with the remote workers (e.g. nauron.blob_store.DirectoryBlobStore on a
+        shared or NFS directory). Requests to remote workers that are larger than claim_check_threshold bytes are
+        written to it and only a reference is sent through RabbitMQ, which also lifts the RabbitMQ message size
+        limit. Workers started with the same store respond the same way.
+        :param claim_check_threshold: Minimum request size in bytes to be offloaded to the blob store.
+        :param validator: An optional validator of the request content that runs before the request is passed to
+        any worker, so that invalid requests are rejected with HTTP error 400 without reaching RabbitMQ. Either a
+        function that returns the normalized content or raises a ValueError, or a schema class or instance with a
+        load() method (e.g. a marshmallow Schema). The normalized content is passed on to the worker, so it must
+        remain JSON-serializable for remote workers.
+        :param signature_validators: Validators of requests with specific signatures that override the default
+        validator.
+        :param hedging: An optional nauron.hedging.HedgePolicy. Requests to remote workers whose response has not
+        arrived within a percentile of recent response times are published again (optionally to another routing
+        key) and the first response is used. Only suitable for idempotent workers.
+        :param envelope: Envelope format of requests to remote workers. 'json' (default) is the legacy format
+        that workers of all versions understand. 'binary' sends the content as the message body and the metadata
+        in AMQP headers, which avoids re-encoding binary responses (e.g. audio) as JSON strings and is needed for
+        streamed responses, but should only be enabled once all workers of the service have been upgraded.
         """
+        if remote and self._mq_router is None:
+            self._mq_router = MQResponseRouter(self._mq_parameters)
         service = Service(name=name, remote=remote, mq_parameters=self._mq_parameters,
-                                                 timeout=self._timeout)
+                          timeout=self._timeout,
+                          pool_size=self._mq_pool_size if pool_size is None else pool_size,
+                          compression=compression,
+                          compression_threshold=compression_threshold,
+                          cache=cache,
+                          priority=priority,
+                          signature_priorities=signature_priorities or {},
+                          max_in_flight=max_in_flight,
+                          max_queue_depth=max_queue_depth,
+                          queue_depth_interval=queue_depth_interval,
+                          retry_after=retry_after,
+                          overload_status_code=overload_status_code,
+                          splitter=splitter,
+                          merger=merger,
+                          shard_concurrency=shard_concurrency,
+                          blob_store=blob_store,
+                          claim_check_threshold=claim_check_threshold,
+                          validator=validator,
+                          signature_validators=signature_validators or {},
+                          hedging=hedging,
+                          envelope=envelope,
+                          router=self._mq_router)
         self._services[name] = service
         return service
 
     def add_worker(self,
                    service_name: str,
                    worker: Worker,
-                   routing_key: str = "default"):
+                   routing_key: str = "default",
+                   batch_size: int = 1,
+                   batch_timeout: int = 0,
+                   executor: Optional[str] = None,
+                   concurrency: int = 1,
+                   max_queue_size: Optional[int] = None):
         """
         Adds a local worker instance to the service.
 
@@ -133,10 +654,20 @@ class Nauron(Flask):
         :param routing_key: An optional routing key that can be used to map any request to this worker. Useful when
         multiple unique workers exist for the service. In case the same routing key is used multiple times,
         the last mapping will be used.
+        :param batch_size: Maximum number of concurrent requests passed to Worker.process_batch() at once.
+        Batching is disabled by default.
+        :param batch_timeout: Maximum time in milliseconds to wait for more requests before processing an
+        incomplete batch.
+        :param executor: None (default) to process requests on the Flask thread that received them, 'thread' to
+        use a dedicated thread pool or 'process' to use a process pool where each process holds its own copy of
+        the worker. Cannot be combined with batching.
+        :param concurrency: Number of requests processed simultaneously when an executor is used.
+        :param max_queue_size: Maximum number of requests waiting for the executor, further requests are rejected.
         """
         if service_name not in self._services:
             self.add_service(name=service_name)
-        self._services[service_name].add_worker(worker, routing_key)
+        self._services[service_name].add_worker(worker, routing_key, batch_size, batch_timeout, executor,
+                                                concurrency, max_queue_size)
 
     def process_request(self, service_name: str, *args, **kwargs):
         """
@@ -144,6 +675,25 @@ class Nauron(Flask):
         """
         return self._services[service_name].process_request(*args, **kwargs)
 
+    async def process_request_async(self, service_name: str, *args, **kwargs):
+        """
+        Process request by its service name without blocking the event loop. Equivalent of
+        Service.process_request_async(*args, **kwargs).
+        """
+        return await self._services[service_name].process_request_async(*args, **kwargs)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns runtime statistics (such as the state of the connection pool) of all services.
+        """
+        return {name: service.stats() for name, service in self._services.items()}
+
+    def status(self) -> Dict[str, str]:
+        """
+        Returns the status of each service, see Service.status.
+        """
+        return {name: service.status for name, service in self._services.items()}
+
     def _route(self, method: str, rule, **options):
         def decorator(view_func):
             endpoint = options.pop("endpoint", None)
@@ -0,0 +1,49 @@
+import logging
+
+from typing import Dict, List, Callable
+
+from nauron.helpers import Response
+
+LOGGER = logging.getLogger(__name__)
+
+Splitter = Callable[[Dict], List[Dict]]
+Merger = Callable[[List[Response]], Response]
+
+
+def split_list(field: str, shard_size: int) -> Splitter:
+    """
+    Returns a splitter that cuts the list in content[field] into shards of at most shard_size items. Other fields
+    are copied to every shard. Requests with a shorter list or without a list in the field are not split.
+    """
+    if shard_size < 1:
+        raise ValueError("Shard size must be at least 1.")
+
+    def split(content: Dict) -> List[Dict]:
+        items = content.get(field) if isinstance(content, dict) else None
+        if not isinstance(items, list) or len(items) <= shard_size:
+            return [content]
+        return [{**content, field: items[i:i + shard_size]} for i in range(0, len(items), shard_size)]
+
+    return split
+
+
+def merge_lists(field: str) -> Merger:
+    """
+    Returns a merger for shards split by split_list(). The lists in response.content[field] are concatenated in
+    the order of the shards and other fields are taken from the first response. If any shard fails, the response
+    of the first failed shard is returned instead, as a partial result cannot be told apart from a complete one.
+    """
+
+    def merge(responses: List[Response]) -> Response:
+        for response in responses:
+            if response.http_status_code != 200:
+                return response
+        if not all(isinstance(response.content, dict) and isinstance(response.content.get(field), list)
+                   for response in responses):
+            LOGGER.error(f"Unable to merge responses, the '{field}' field of the content is not a list.")
+            return Response(http_status_code=500)
+        content = dict(responses[0].content)
+        content[field] = [item for response in responses for item in response.content[field]]
+        return Response(content=content, mimetype=responses[0].mimetype)
+
+    return merge
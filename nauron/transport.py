@@ -0,0 +1,165 @@
+import random
+import logging
+from time import time
+from abc import ABC, abstractmethod
+
+from typing import Union, Sequence, Optional
+
+import pika
+import pika.exceptions
+
+from nauron.metrics import BROKER_RECONNECTS, BROKER_DOWNTIME
+
+LOGGER = logging.getLogger(__name__)
+
+# The first reconnection attempt follows almost immediately, later ones are spread out up to the maximum delay
+# (in seconds) so that clients do not reconnect in lockstep after a broker failover.
+INITIAL_RECONNECT_DELAY = 0.05
+MAX_RECONNECT_DELAY = 30
+
+
+class Transport(ABC):
+    """
+    A message transport used by services and workers. A transport is only a factory of connections, there is no
+    separate publish/consume interface: nauron's producers, routers and consumers talk AMQP through the
+    connections, so these must implement the subset of the pika.BlockingConnection API that nauron uses:
+    channels with exchange_declare(), queue_declare(), queue_bind(), basic_qos(), basic_publish() (raising
+    pika.exceptions.UnroutableError for mandatory messages that cannot be routed), basic_consume(), basic_ack()
+    and start_consuming()/stop_consuming(), and the connection methods process_data_events(),
+    add_callback_threadsafe(), call_later() and remove_timeout(). Delivery guarantees such as redelivery of
+    unacknowledged messages are up to each transport.
+
+    A transport can be used anywhere RabbitMQ connection parameters are accepted.
+    """
+
+    @abstractmethod
+    def connect(self):
+        """
+        Opens a new connection.
+        """
+        pass
+
+
+class RabbitMQTransport(Transport):
+    def __init__(self, parameters: Optional[Union[pika.connection.Parameters,
+                                                  Sequence[pika.connection.Parameters]]] = None):
+        """
+        The default transport that connects to a RabbitMQ server. If the parameters of several nodes of a cluster
+        are given, the nodes are tried in turns starting from the one that was last connected to, so that after a
+        failover the clients stay on the surviving node instead of waiting for the failed one to time out first.
+
+        :param parameters: pika connection parameters or a sequence of them, one per broker node. Defaults to
+        pika's default parameters (a broker on localhost).
+        """
+        if parameters is None:
+            parameters = pika.ConnectionParameters()
+        self.parameters = parameters
+        self.endpoints = [parameters] if isinstance(parameters, pika.connection.Parameters) else list(parameters)
+        if not self.endpoints:
+            raise ValueError("At least one set of connection parameters is required.")
+        self._preferred = 0
+
+    def connect(self) -> pika.BlockingConnection:
+        error = None
+        for i in range(len(self.endpoints)):
+            index = (self._preferred + i) % len(self.endpoints)
+            endpoint = self.endpoints[index]
+            try:
+                connection = pika.BlockingConnection(endpoint)
+            except pika.exceptions.AMQPConnectionError as e:
+                if len(self.endpoints) > 1:
+                    LOGGER.warning(f"Unable to connect to message broker: "
+                                   f"{{host: {endpoint.host}, port: {endpoint.port}, error: {repr(e)}}}")
+                error = e
+                continue
+            self._preferred = index
+            return connection
+        raise error
+
+    def __str__(self):
+        hosts = ', '.join(f'{endpoint.host}:{endpoint.port}' for endpoint in self.endpoints)
+        return f'{{hosts: [{hosts}]}}'
+
+
+# RabbitMQ connection parameters of one or several broker nodes, or another transport.
+BrokerParameters = Union[Transport, pika.connection.Parameters, Sequence[pika.connection.Parameters]]
+
+
+def get_transport(parameters: Optional[BrokerParameters]) -> Transport:
+    """
+    Returns the transport itself or a RabbitMQ transport in case of connection parameters (or None for the
+    default parameters).
+    """
+    if isinstance(parameters, Transport):
+        return parameters
+    return RabbitMQTransport(parameters)
+
+
+class Backoff:
+    def __init__(self, initial: float = INITIAL_RECONNECT_DELAY, maximum: float = MAX_RECONNECT_DELAY,
+                 multiplier: float = 2):
+        """
+        Exponentially growing delays between retries. Each delay is drawn at random from the upper half of the
+        current step, so that clients that lost the connection at the same time do not retry in lockstep.
+
+        :param initial: Delay of the first retry in seconds.
+        :param maximum: Maximum delay in seconds.
+        :param multiplier: Factor by which the step grows after each retry.
+        """
+        self.initial = initial
+        self.maximum = maximum
+        self.multiplier = multiplier
+        self.attempts = 0
+
+    def next(self) -> float:
+        """
+        Returns the delay in seconds before the next retry.
+        """
+        step = min(self.initial * self.multiplier ** self.attempts, self.maximum)
+        if step < self.maximum:
+            self.attempts += 1
+        return random.uniform(step / 2, step)
+
+    def reset(self):
+        self.attempts = 0
+
+
+class Reconnector:
+    def __init__(self, component: str, maximum: float = MAX_RECONNECT_DELAY):
+        """
+        Keeps track of the connection state of a long-lived broker connection: computes the delays between
+        reconnection attempts and records how often and for how long the connection was lost.
+
+        :param component: Name of the component in logs and metrics, e.g. 'worker' or 'router'.
+        :param maximum: Maximum delay between attempts in seconds.
+        """
+        self.component = component
+        self.backoff = Backoff(maximum=maximum)
+        self._connected_before = False
+        self._lost_at: Optional[float] = None
+
+    def connected(self):
+        """
+        Called after the connection has been (re-)established and the topology declared.
+        """
+        if self._connected_before and self._lost_at is not None:
+            downtime = time() - self._lost_at
+            BROKER_RECONNECTS.inc(component=self.component)
+            BROKER_DOWNTIME.observe(downtime, component=self.component)
+            LOGGER.info(f"Reconnected to message broker: {{component: {self.component}, "
+                        f"downtime: {round(downtime, 3)} s}}")
+        self._connected_before = True
+        self._lost_at = None
+        self.backoff.reset()
+
+    def failed(self, error: Exception) -> float:
+        """
+        Called when connecting fails or an established connection is lost. Returns the time in seconds to wait
+        before the next attempt.
+        """
+        if self._lost_at is None:
+            self._lost_at = time()
+        delay = self.backoff.next()
+        LOGGER.error(f"Message broker connection error: {{component: {self.component}, error: {repr(error)}}}")
+        LOGGER.info(f'Trying to reconnect in {round(delay, 3)} seconds.')
+        return delay
@@ -0,0 +1,38 @@
+import logging
+
+from typing import Dict, Callable, Union, Any, Tuple
+
+try:
+    from marshmallow import ValidationError as SchemaValidationError
+except ImportError:
+    SchemaValidationError = None
+
+LOGGER = logging.getLogger(__name__)
+
+# A function that returns the normalized content or raises a ValueError, or a schema class or instance with a
+# load() method (e.g. marshmallow.Schema).
+Validator = Union[Callable[[Dict], Dict], type, Any]
+
+VALIDATION_ERRORS: Tuple[type, ...] = (ValueError,) if SchemaValidationError is None \
+    else (ValueError, SchemaValidationError)
+
+
+def compile_validator(validator: Validator) -> Callable[[Dict], Dict]:
+    """
+    Returns a function that validates the request content and returns it in a normalized form. Schema classes are
+    instantiated once here so that the same instance is reused for all requests.
+    """
+    if isinstance(validator, type):
+        validator = validator()
+    if callable(getattr(validator, 'load', None)):
+        return validator.load
+    if callable(validator):
+        return validator
+    raise TypeError(f"Unsupported validator: {validator}")
+
+
+def error_messages(error: Exception) -> Union[str, Dict, list]:
+    """
+    Returns the description of a validation error to be sent to the client.
+    """
+    return getattr(error, 'messages', None) or str(error)
@@ -1,12 +1,35 @@
 import logging
+import threading
 from abc import abstractmethod
 
-from typing import Tuple, Dict
+from typing import Tuple, Dict, Optional, List, Union, Callable, Any
 
-from nauron.helpers import Response
+from nauron.cache import CacheBackend
+from nauron.blob_store import BlobStore, CLAIM_CHECK_THRESHOLD
+from nauron.metrics import start_metrics_server
+from nauron.helpers import Response, StreamingResponse, COMPRESSION_THRESHOLD
 
 LOGGER = logging.getLogger(__name__)
 
+_SHARED_RESOURCES: Dict[str, Any] = {}
+_SHARED_RESOURCES_LOCK = threading.Lock()
+
+
+def shared_resource(name: str, loader: Callable[[], Any]) -> Any:
+    """
+    Returns a resource (e.g. a tokenizer, embeddings or a model) that is loaded only once per process and shared by
+    all workers that ask for it by the same name. Useful when several workers run in one process (see
+    nauron.worker_host.WorkerHost).
+
+    :param name: A name that identifies the resource within the process.
+    :param loader: A function that loads the resource, called on the first request only.
+    """
+    with _SHARED_RESOURCES_LOCK:
+        if name not in _SHARED_RESOURCES:
+            LOGGER.info(f"Loading shared resource: {{name: {name}}}")
+            _SHARED_RESOURCES[name] = loader()
+        return _SHARED_RESOURCES[name]
+
 
 class Worker:
     _consumer = None
@@ -15,10 +38,11 @@ class Worker:
     """
 
     @abstractmethod
-    def process_request(self, content: Dict, signature: str) -> Response:
+    def process_request(self, content: Dict, signature: str) -> Union[Response, StreamingResponse]:
         """
         Method for processing the request. Request verification should also be done as this will be the first time the
-        request body is processed (unless dynamic routing parameters are looked up).
+        request body is processed (unless dynamic routing parameters are looked up). A StreamingResponse can be
+        returned to send the result to the client in chunks as soon as they are produced.
 
         :param content: A dict representing the content of the request.
         :param signature: Optional value that can be used to map the request to a specific function. Can be useful,
@@ -26,24 +50,88 @@ class Worker:
         """
         pass
 
+    def process_batch(self, contents: List[Dict], signatures: List[str]) -> List[Response]:
+        """
+        Method for processing multiple requests at once. Used only if batching is enabled for the worker. The
+        default implementation calls process_request() for each request separately, it should be overridden by
+        workers that benefit from batched inference.
+
+        :param contents: A list of request contents.
+        :param signatures: A list of signatures matching each request content.
+        :return: A list of responses in the same order as the requests.
+        """
+        return [self.process_request(content, signature) for content, signature in zip(contents, signatures)]
+
+    def __getstate__(self):
+        # The consumer holds an open connection and is not needed in process pool copies of the worker.
+        state = self.__dict__.copy()
+        state.pop('_consumer', None)
+        return state
+
     def start(self, connection_parameters, service_name: str,
-              routing_key: str = "default", alt_routes: Tuple[str] = ()):
+              routing_key: str = "default", alt_routes: Tuple[str] = (),
+              prefetch_count: Optional[int] = None, concurrency: int = 1, executor: Optional[str] = None,
+              batch_size: int = 1, batch_timeout: int = 0,
+              compression: Optional[str] = None, compression_threshold: int = COMPRESSION_THRESHOLD,
+              metrics_port: Optional[int] = None, max_priority: Optional[int] = None,
+              replay_cache: Optional[CacheBackend] = None, blob_store: Optional[BlobStore] = None,
+              claim_check_threshold: int = CLAIM_CHECK_THRESHOLD):
         """
         Starts a RabbitMQ consumer that listens for requests.
 
-        :param connection_parameters: RabbitMQ host and user parameters.
+        :param connection_parameters: RabbitMQ host and user parameters, a sequence of them to fail over between
+        the nodes of a cluster, or another transport (see nauron.transport).
         :param service_name: Nauron service name. Used by RabbitMQ as the exchange name. Should be identical to the
         name parameter in Service.
         :param routing_key: Worker's routing key. Will be used by RabbitMQ as the queue name. The actual queue name
         will also  automatically include the service name to ensure that unique queues names are used.
         :param alt_routes: alternative allowed routing keys to be used in case of dynamic routing, for example in
         addition to 'default.et.en', 'default.est.eng' might be allowed if routing is based on language codes.
+        :param prefetch_count: Maximum number of unacknowledged requests delivered to the worker at once, defaults
+        to the concurrency value multiplied by the batch size.
+        :param concurrency: Number of requests processed simultaneously when an executor is used.
+        :param executor: None (default) to process requests one at a time on the connection thread, 'thread' to
+        process them in a thread pool (for I/O-bound or GIL-releasing workers) or 'process' to use a process
+        pool where each process holds its own copy of the worker.
+        :param batch_size: Maximum number of requests passed to process_batch() at once. Batching is disabled by
+        default.
+        :param batch_timeout: Maximum time in milliseconds to wait for more requests before processing an
+        incomplete batch.
+        :param compression: Compression codec ('gzip', 'zlib' or the optional 'lz4') used for responses larger
+        than compression_threshold bytes. Responses are only compressed if the producer supports the codec.
+        :param compression_threshold: Minimum response size in bytes to be compressed.
+        :param metrics_port: If set, worker metrics are served in the Prometheus text format on this port.
+        :param max_priority: If set, the queue is declared as a priority queue so that requests with a higher
+        priority (see Nauron.add_service()) are processed first. An existing queue must be deleted before enabling
+        priorities. Requests whose deadline has passed are skipped regardless of this setting.
+        :param replay_cache: If set (e.g. nauron.cache.LRUCache()), responses are kept by correlation id for the
+        cache TTL and replayed when RabbitMQ redelivers a request that was already processed, for example after
+        the connection was lost before the request was acknowledged. Use a shared backend to replay responses
+        computed by other workers.
+        :param blob_store: A store shared with the service (e.g. nauron.blob_store.DirectoryBlobStore on a shared
+        or NFS directory) for requests and responses that are too large to be sent through RabbitMQ. Only a
+        reference to the stored payload is sent instead. Should be used together with the blob_store parameter of
+        Nauron.add_service().
+        :param claim_check_threshold: Minimum response size in bytes to be offloaded to the blob store.
         """
         from nauron.mq_consumer import MQConsumer
+        if metrics_port is not None:
+            start_metrics_server(metrics_port)
         self._consumer = MQConsumer(worker=self,
                                     connection_parameters=connection_parameters,
                                     exchange_name=service_name,
                                     routing_key=routing_key,
-                                    alt_routes=alt_routes)
+                                    alt_routes=alt_routes,
+                                    prefetch_count=prefetch_count,
+                                    concurrency=concurrency,
+                                    executor=executor,
+                                    batch_size=batch_size,
+                                    batch_timeout=batch_timeout,
+                                    compression=compression,
+                                    compression_threshold=compression_threshold,
+                                    max_priority=max_priority,
+                                    replay_cache=replay_cache,
+                                    blob_store=blob_store,
+                                    claim_check_threshold=claim_check_threshold)
 
         self._consumer.start()
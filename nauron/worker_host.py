@@ -0,0 +1,116 @@
+import logging
+from time import sleep
+
+from typing import Optional, Tuple, List
+
+import pika.exceptions
+
+from nauron.worker import Worker
+from nauron.cache import CacheBackend
+from nauron.blob_store import BlobStore, CLAIM_CHECK_THRESHOLD
+from nauron.helpers import COMPRESSION_THRESHOLD
+from nauron.metrics import start_metrics_server
+from nauron.transport import BrokerParameters, Reconnector, get_transport
+from nauron.mq_consumer import MQConsumer
+
+LOGGER = logging.getLogger(__name__)
+
+
+class WorkerHost:
+    def __init__(self, connection_parameters: BrokerParameters, metrics_port: Optional[int] = None):
+        """
+        Runs several workers (or the same worker for several routing keys) in a single process. All workers share
+        one connection while each of them consumes from its own queue on a separate channel with its own prefetch
+        count. Deliveries of different channels are dispatched in turns and each channel can hold at most
+        prefetch_count unacknowledged requests, so a busy queue cannot starve the others. Workers without an
+        executor are processed one at a time on the connection thread, which suits a single GPU shared by several
+        models.
+
+        Memory-heavy components such as tokenizers or embeddings can be loaded once and shared between the workers
+        using nauron.worker.shared_resource().
+
+        :param connection_parameters: RabbitMQ host and user parameters, a sequence of them to fail over between
+        the nodes of a cluster, or another transport (see nauron.transport).
+        :param metrics_port: If set, metrics of all workers are served in the Prometheus text format on this port.
+        """
+        self.connection_parameters = connection_parameters
+        self.transport = get_transport(connection_parameters)
+        self.metrics_port = metrics_port
+        self.consumers: List[MQConsumer] = []
+        self.connection = None
+        self._stopped = False
+        self._reconnector = Reconnector('worker_host')
+
+    def add_worker(self, worker: Worker, service_name: str,
+                   routing_key: str = "default", alt_routes: Tuple[str] = (),
+                   prefetch_count: Optional[int] = None, concurrency: int = 1, executor: Optional[str] = None,
+                   batch_size: int = 1, batch_timeout: int = 0,
+                   compression: Optional[str] = None, compression_threshold: int = COMPRESSION_THRESHOLD,
+                   max_priority: Optional[int] = None, replay_cache: Optional[CacheBackend] = None,
+                   blob_store: Optional[BlobStore] = None,
+                   claim_check_threshold: int = CLAIM_CHECK_THRESHOLD) -> MQConsumer:
+        """
+        Adds a worker that listens for requests of a service with the given routing key. The same worker instance
+        can be added several times with different routing keys. The parameters are the same as in Worker.start().
+        """
+        consumer = MQConsumer(worker=worker,
+                              connection_parameters=self.transport,
+                              exchange_name=service_name,
+                              routing_key=routing_key,
+                              alt_routes=alt_routes,
+                              prefetch_count=prefetch_count,
+                              concurrency=concurrency,
+                              executor=executor,
+                              batch_size=batch_size,
+                              batch_timeout=batch_timeout,
+                              compression=compression,
+                              compression_threshold=compression_threshold,
+                              max_priority=max_priority,
+                              replay_cache=replay_cache,
+                              blob_store=blob_store,
+                              claim_check_threshold=claim_check_threshold)
+        worker._consumer = consumer
+        self.consumers.append(consumer)
+        return consumer
+
+    def start(self):
+        """
+        Connects to RabbitMQ and starts listening for requests of all workers. Automatically tries to reconnect if
+        the connection is lost.
+        """
+        if not self.consumers:
+            raise ValueError("No workers have been added.")
+        if self.metrics_port is not None:
+            start_metrics_server(self.metrics_port)
+        for consumer in self.consumers:
+            consumer._init_executor()
+        while not self._stopped:
+            try:
+                LOGGER.info(f'Connecting to message broker: {self.transport}')
+                self.connection = self.transport.connect()
+                for consumer in self.consumers:
+                    consumer._open_channel(self.connection)
+                self._reconnector.connected()
+                LOGGER.info(f'Ready to process requests: {{queues: {[c.queue_name for c in self.consumers]}}}')
+                while not self._stopped:
+                    self.connection.process_data_events(time_limit=None)
+            except pika.exceptions.AMQPConnectionError as e:
+                sleep(self._reconnector.failed(e))
+            except KeyboardInterrupt:
+                LOGGER.info('Interrupted by user. Exiting...')
+                break
+
+        if self.connection is not None and self.connection.is_open:
+            self.connection.close()
+        for consumer in self.consumers:
+            if consumer.executor is not None:
+                consumer.executor.shutdown(wait=False)
+
+    def stop(self):
+        """
+        Stops all workers and makes start() return. Can be called from any thread.
+        """
+        self._stopped = True
+        if self.connection is not None and self.connection.is_open:
+            # Wakes up the connection thread.
+            self.connection.add_callback_threadsafe(lambda: None)
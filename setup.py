@@ -30,5 +30,9 @@ setuptools.setup(
         'flask>=1.1.2',
         'flask-cors>=3.0.9',
         'dataclasses>=0.7; python_version < "3.7.0"'
-    ]
+    ],
+    extras_require={
+        'lz4': ['lz4>=3.1.0'],
+        'async': ['flask[async]>=2.0.0']
+    }
 )
@@ -0,0 +1,165 @@
+import uuid
+import threading
+from time import time
+
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pika
+import pytest
+
+from nauron import Nauron, Worker, Response
+from nauron.nauron import Service
+from nauron.memory_broker import InMemoryBroker
+from nauron.mq_consumer import MQConsumer
+
+# Time in seconds to wait for anything that runs on a background thread.
+WAIT_TIMEOUT = 5
+
+
+def wait_for(condition: Callable[[], bool], timeout: float = WAIT_TIMEOUT) -> bool:
+    deadline = time() + timeout
+    while not condition():
+        if time() > deadline:
+            return False
+        threading.Event().wait(0.01)
+    return True
+
+
+class EchoWorker(Worker):
+    def __init__(self, delay: float = 0):
+        """
+        Answers each request with its content and signature after an optional delay in seconds and records the
+        requests and batch sizes it has seen.
+        """
+        self.delay = delay
+        self.calls = []
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def process_request(self, content, signature):
+        with self._lock:
+            self.calls.append(content)
+        threading.Event().wait(self.delay)
+        return Response({'echo': content, 'signature': signature})
+
+    def process_batch(self, contents, signatures):
+        with self._lock:
+            self.batches.append(len(contents))
+        return super().process_batch(contents, signatures)
+
+
+@pytest.fixture
+def broker() -> InMemoryBroker:
+    return InMemoryBroker()
+
+
+@pytest.fixture
+def service_name() -> str:
+    # Metrics are global, so every test uses its own service name.
+    return f'svc-{uuid.uuid4().hex[:8]}'
+
+
+@pytest.fixture
+def start_worker(broker: InMemoryBroker, service_name: str):
+    """
+    Starts workers on background threads and stops them after the test. Returns the consumer once it is
+    listening.
+    """
+    threads: List[Tuple[MQConsumer, threading.Thread]] = []
+
+    def start(worker: Worker, routing_key: str = 'default', **kwargs) -> MQConsumer:
+        queue_name = '{}.{}'.format(service_name, routing_key)
+        consumers = broker.consumer_count(queue_name)
+        thread = threading.Thread(target=worker.start, args=(broker, service_name),
+                                  kwargs=dict(routing_key=routing_key, **kwargs), daemon=True)
+        thread.start()
+        assert broker.wait_for_consumers(queue_name, consumers + 1, timeout=WAIT_TIMEOUT)
+        threads.append((worker._consumer, thread))
+        return worker._consumer
+
+    yield start
+    for consumer, thread in threads:
+        consumer.stop()
+        thread.join(WAIT_TIMEOUT)
+
+
+@pytest.fixture
+def start_service(broker: InMemoryBroker, service_name: str):
+    """
+    Adds a remote service to a new application and waits until it is ready.
+    """
+    apps: List[Nauron] = []
+    services: List[Service] = []
+
+    def start(timeout: int = 5000, **kwargs) -> Service:
+        app = Nauron(__name__, mq_parameters=broker, timeout=timeout)
+        service = app.add_service(service_name, remote=True, **kwargs)
+        assert service.wait_ready(WAIT_TIMEOUT)
+        apps.append(app)
+        services.append(service)
+        return service
+
+    yield start
+    for service in services:
+        service.close()
+    for app in apps:
+        if app._mq_router is not None:
+            app._mq_router.stop()
+
+
+class RawClient:
+    def __init__(self, broker: InMemoryBroker, service_name: str):
+        """
+        Publishes hand-crafted messages to a service and collects the replies, bypassing the producer so that
+        malformed requests can be sent.
+        """
+        self.service_name = service_name
+        self.connection = broker.connect()
+        self.channel = self.connection.channel()
+        self.reply_queue = self.channel.queue_declare(queue='', exclusive=True).method.queue
+        self.replies: Dict[str, List[Tuple[pika.BasicProperties, bytes]]] = {}
+        self.channel.basic_consume(queue=self.reply_queue, on_message_callback=self._on_reply, auto_ack=True)
+
+    def _on_reply(self, _, __, properties: pika.BasicProperties, body: bytes):
+        self.replies.setdefault(properties.correlation_id, []).append((properties, body))
+
+    def send(self, body: bytes, routing_key: str = 'default', correlation_id: Optional[str] = None,
+             **properties) -> str:
+        correlation_id = correlation_id or str(uuid.uuid4())
+        self.channel.basic_publish(exchange=self.service_name,
+                                   routing_key='{}.{}'.format(self.service_name, routing_key),
+                                   properties=pika.BasicProperties(reply_to=self.reply_queue,
+                                                                   correlation_id=correlation_id, **properties),
+                                   body=body)
+        return correlation_id
+
+    def wait(self, correlation_id: str, count: int = 1,
+             timeout: float = WAIT_TIMEOUT) -> List[Tuple[pika.BasicProperties, bytes]]:
+        deadline = time() + timeout
+        while len(self.replies.get(correlation_id, [])) < count and time() < deadline:
+            self.connection.process_data_events(time_limit=0.05)
+        return self.replies.get(correlation_id, [])
+
+    def close(self):
+        self.connection.close()
+
+
+@pytest.fixture
+def raw_client(broker: InMemoryBroker, service_name: str) -> RawClient:
+    client = RawClient(broker, service_name)
+    yield client
+    client.close()
+
+
+def redeliver(broker: InMemoryBroker, queue_name: str, properties: pika.BasicProperties, body: bytes):
+    """
+    Puts a message back into a queue with the redelivered flag set, as RabbitMQ does when a connection is lost
+    before the message is acknowledged.
+    """
+    with broker._condition:
+        broker._queues[queue_name].push(next(broker._sequence), properties, body, queue_name, redelivered=True)
+        broker._condition.notify_all()
+
+
+def unacked(consumer: MQConsumer) -> int:
+    return len(consumer.channel._unacked)
@@ -0,0 +1,59 @@
+import threading
+
+import pytest
+from werkzeug.exceptions import ServiceUnavailable, TooManyRequests
+
+from nauron import Nauron, Worker, Response
+from nauron.metrics import REQUESTS_REJECTED
+
+
+class GatedWorker(Worker):
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def process_request(self, content, signature):
+        self.started.set()
+        self.release.wait(5)
+        return Response({'ok': True})
+
+
+def test_requests_over_the_in_flight_limit_are_rejected(service_name):
+    worker = GatedWorker()
+    service = Nauron(__name__).add_service(service_name, max_in_flight=1, overload_status_code=429, retry_after=5)
+    service.add_worker(worker)
+    first = threading.Thread(target=service._process_request, args=({}, 'default', 'default'))
+    first.start()
+    assert worker.started.wait(5)
+
+    with pytest.raises(TooManyRequests) as rejected:
+        service._process_request({}, 'default', 'default')
+    worker.release.set()
+    first.join(5)
+
+    assert rejected.value.get_response().headers['Retry-After'] == '5'
+    assert REQUESTS_REJECTED.value(service=service_name, reason='in_flight') == 1
+    assert service._process_request({}, 'default', 'default') == Response({'ok': True})
+
+
+def test_requests_are_rejected_while_the_queue_is_too_deep(broker, service_name, start_service):
+    service = start_service(max_queue_depth=2, queue_depth_interval=0)
+    connection = broker.connect()
+    channel = connection.channel()
+    queue_name = f'{service_name}.default'
+    channel.queue_declare(queue=queue_name)
+    channel.queue_bind(exchange=service_name, queue=queue_name, routing_key=queue_name)
+    for _ in range(2):
+        channel.basic_publish(exchange=service_name, routing_key=queue_name, body=b'{}')
+
+    with pytest.raises(ServiceUnavailable):
+        service._process_request({}, 'default', 'default')
+    connection.close()
+
+    assert REQUESTS_REJECTED.value(service=service_name, reason='queue_depth') == 1
+    assert service.stats()['queue_depth'] == {'default': 2}
+
+
+def test_invalid_overload_status_code_is_rejected():
+    with pytest.raises(ValueError):
+        Nauron(__name__).add_service('svc', overload_status_code=500)
@@ -0,0 +1,79 @@
+import asyncio
+import threading
+
+import pytest
+
+from nauron import Worker, Response
+
+from conftest import WAIT_TIMEOUT
+
+
+class EchoWorker(Worker):
+    def process_request(self, content, signature):
+        return Response({'echo': content})
+
+
+class CorruptWorker:
+    def __init__(self, broker, service_name):
+        """
+        Answers every request with a compressed body that cannot be decompressed.
+        """
+        self.connection = broker.connect()
+        channel = self.connection.channel()
+        queue_name = f'{service_name}.default'
+        channel.queue_declare(queue=queue_name)
+        channel.exchange_declare(exchange=service_name, exchange_type='direct')
+        channel.queue_bind(exchange=service_name, queue=queue_name, routing_key=queue_name)
+        channel.basic_consume(queue=queue_name, on_message_callback=self._on_request)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self.connection.process_data_events(time_limit=0.05)
+
+    def _on_request(self, channel, method, properties, body):
+        channel.basic_publish(exchange='', routing_key=properties.reply_to, body=b'not zlib',
+                              properties=type(properties)(correlation_id=properties.correlation_id,
+                                                          content_encoding='zlib'))
+        channel.basic_ack(delivery_tag=method.delivery_tag)
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join(WAIT_TIMEOUT)
+        self.connection.close()
+
+
+def test_messages_are_encoded_and_decoded_off_the_event_loop(start_worker, start_service, monkeypatch):
+    start_worker(EchoWorker())
+    service = start_service()
+    threads = []
+    for name in ('_encode_request', '_decode_response'):
+        method = getattr(service._pool, name)
+        monkeypatch.setattr(service._pool, name,
+                            lambda *args, method=method: threads.append(threading.get_ident()) or method(*args))
+
+    async def request():
+        return threading.get_ident(), await service._get_response_async({'i': 1}, 'default', 'default')
+
+    loop_thread, response = asyncio.run(request())
+
+    assert response == Response({'echo': {'i': 1}})
+    assert len(threads) == 2
+    assert loop_thread not in threads
+
+
+@pytest.mark.parametrize('asynchronous', [False, True], ids=['sync', 'async'])
+def test_corrupt_reply_is_a_bad_gateway(broker, service_name, start_service, asynchronous):
+    worker = CorruptWorker(broker, service_name)
+    try:
+        service = start_service()
+        if asynchronous:
+            response = asyncio.run(service._get_response_async({}, 'default', 'default'))
+        else:
+            response = service._get_response({}, 'default', 'default')
+    finally:
+        worker.stop()
+
+    assert response.http_status_code == 502
@@ -0,0 +1,49 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from nauron import Nauron
+from nauron.batching import MicroBatcher
+
+from conftest import EchoWorker, WAIT_TIMEOUT
+
+
+def test_concurrent_requests_are_processed_in_batches():
+    worker = EchoWorker()
+    batcher = MicroBatcher(worker, batch_size=4, batch_timeout=200)
+    try:
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            responses = list(pool.map(lambda i: batcher.process_request({'i': i}, 'sig'), range(8)))
+    finally:
+        batcher.close()
+
+    assert [response.content for response in responses] == [{'echo': {'i': i}, 'signature': 'sig'}
+                                                             for i in range(8)]
+    assert sum(worker.batches) == 8
+    assert max(worker.batches) > 1
+
+
+def test_closed_batcher_stops_its_thread():
+    batcher = MicroBatcher(EchoWorker(), batch_size=4)
+
+    batcher.close()
+    batcher._thread.join(WAIT_TIMEOUT)
+
+    assert not batcher._thread.is_alive()
+    with pytest.raises(RuntimeError):
+        batcher.process_request({}, 'sig')
+
+
+def test_service_stops_the_batchers_of_closed_and_replaced_workers():
+    app = Nauron(__name__)
+    service = app.add_service('batched')
+    service.add_worker(EchoWorker(), batch_size=4)
+    replaced = service._handlers['default']
+
+    service.add_worker(EchoWorker(), batch_size=4)
+    current = service._handlers['default']
+    service.close()
+
+    for batcher in (replaced, current):
+        batcher._thread.join(WAIT_TIMEOUT)
+        assert not batcher._thread.is_alive()
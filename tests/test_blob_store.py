@@ -0,0 +1,109 @@
+import os
+import threading
+from time import time
+
+import pytest
+
+from nauron import Worker, Response
+from nauron.blob_store import DirectoryBlobStore, MemoryBlobStore
+from nauron.hedging import HedgePolicy
+
+from conftest import wait_for
+
+
+class SizeWorker(Worker):
+    def __init__(self, delay: float = 0, response_size: int = 0):
+        self.delay = delay
+        self.response_size = response_size
+
+    def process_request(self, content, signature):
+        threading.Event().wait(self.delay)
+        return Response({'size': len(content['text']), 'padding': 'x' * self.response_size})
+
+
+@pytest.fixture(params=['memory', 'directory'])
+def blob_store(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryBlobStore()
+    return DirectoryBlobStore(str(tmp_path))
+
+
+def stored(blob_store) -> int:
+    if isinstance(blob_store, MemoryBlobStore):
+        return len(blob_store._blobs)
+    return len(os.listdir(blob_store.path))
+
+
+def test_blobs_are_stored_and_deleted(blob_store):
+    reference = blob_store.put(b'payload')
+
+    with blob_store.open(reference) as data:
+        assert bytes(data) == b'payload'
+    blob_store.delete(reference)
+    with pytest.raises(KeyError):
+        with blob_store.open(reference):
+            pass
+    assert stored(blob_store) == 0
+
+
+def test_expired_blobs_are_removed(tmp_path):
+    blob_store = DirectoryBlobStore(str(tmp_path), ttl=60, cleanup_interval=0)
+    expired = blob_store.put(b'old')
+    os.utime(os.path.join(blob_store.path, expired), (time() - 120, time() - 120))
+
+    blob_store.put(b'new')
+
+    assert stored(blob_store) == 1
+    with pytest.raises(KeyError):
+        with blob_store.open(expired):
+            pass
+
+
+def test_invalid_references_are_rejected(tmp_path):
+    blob_store = DirectoryBlobStore(str(tmp_path))
+
+    with pytest.raises(KeyError):
+        with blob_store.open('../outside'):
+            pass
+
+
+@pytest.mark.parametrize('envelope', ['json', 'binary'])
+@pytest.mark.parametrize('response_size', [16, 4096], ids=['small-response', 'large-response'])
+def test_offloaded_messages_are_deleted_after_use(start_worker, start_service, blob_store, monkeypatch, envelope,
+                                                  response_size):
+    offloaded = []
+    put = blob_store.put
+    monkeypatch.setattr(blob_store, 'put', lambda data: offloaded.append(len(data)) or put(data))
+    start_worker(SizeWorker(response_size=response_size), blob_store=blob_store, claim_check_threshold=1024)
+    service = start_service(blob_store=blob_store, claim_check_threshold=1024, envelope=envelope)
+
+    response = service._get_response({'text': 'x' * 4096}, 'default', 'default')
+
+    assert response.content == {'size': 4096, 'padding': 'x' * response_size}
+    # The request is always offloaded, the response only if it is larger than the threshold.
+    assert len(offloaded) == (2 if response_size > 1024 else 1)
+    assert stored(blob_store) == 0
+
+
+def test_offloaded_request_is_deleted_after_timeout(start_worker, start_service, blob_store):
+    start_worker(SizeWorker(delay=0.5), blob_store=blob_store)
+    service = start_service(timeout=100, blob_store=blob_store, claim_check_threshold=1024)
+
+    response = service._get_response({'text': 'x' * 4096}, 'default', 'default')
+
+    assert response.http_status_code == 504
+    assert stored(blob_store) == 0
+
+
+def test_hedged_request_shares_the_offloaded_request(start_worker, start_service, blob_store):
+    start_worker(SizeWorker(delay=1), executor='thread', blob_store=blob_store)
+    start_worker(SizeWorker(), routing_key='standby', blob_store=blob_store)
+    policy = HedgePolicy(min_samples=1, max_rate=1, min_delay=100, routing_key='standby')
+    service = start_service(blob_store=blob_store, claim_check_threshold=1024, hedging=policy)
+    policy.observe(f'{service.name}.default', 0)
+
+    response = service._get_response({'text': 'x' * 4096}, 'default', 'default')
+
+    assert response.content['size'] == 4096
+    assert policy.stats()['hedge_won'] == 1
+    assert wait_for(lambda: stored(blob_store) == 0)
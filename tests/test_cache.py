@@ -0,0 +1,84 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from nauron import Nauron, Worker, Response
+from nauron.cache import LRUCache, ResponseCache, cache_key
+
+
+class CountingWorker(Worker):
+    def __init__(self, delay: float = 0, status: int = 200):
+        self.delay = delay
+        self.status = status
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def process_request(self, content, signature):
+        with self._lock:
+            self.calls += 1
+        threading.Event().wait(self.delay)
+        return Response({'echo': content}, http_status_code=self.status)
+
+
+def test_cache_key_does_not_depend_on_the_field_order():
+    assert cache_key('svc', 'default', 'sig', {'a': 1, 'b': 2}) == cache_key('svc', 'default', 'sig', {'b': 2, 'a': 1})
+    assert cache_key('svc', 'default', 'sig', {'a': 1}) != cache_key('svc', 'default', 'other', {'a': 1})
+
+
+def test_least_recently_used_responses_are_evicted():
+    cache = LRUCache(max_size=20, ttl=None)
+    cache.set('a', Response(b'x' * 10))
+    cache.set('b', Response(b'x' * 10))
+    assert cache.get('a') is not None
+
+    cache.set('c', Response(b'x' * 10))
+
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.get('c') is not None
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['size'] == 20
+
+
+def test_expired_responses_are_not_returned():
+    cache = LRUCache(ttl=0)
+    cache.set('a', Response({'a': 1}))
+
+    assert cache.get('a') is None
+    assert cache.stats()['expirations'] == 1
+
+
+def test_responses_larger_than_the_cache_are_not_stored():
+    cache = LRUCache(max_size=4)
+    cache.set('a', Response(b'x' * 10))
+
+    assert cache.stats()['items'] == 0
+
+
+def test_concurrent_identical_requests_are_collapsed():
+    worker = CountingWorker(delay=0.2)
+    cache = ResponseCache(LRUCache())
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        responses = list(pool.map(lambda _: cache.get_or_compute('key', lambda: worker.process_request({}, '')),
+                                  range(4)))
+
+    assert worker.calls == 1
+    assert all(response == Response({'echo': {}}) for response in responses)
+    assert cache.stats()['collapsed'] == 3
+
+
+def test_service_caches_only_successful_responses():
+    app = Nauron(__name__)
+    ok, failing = CountingWorker(), CountingWorker(status=500)
+    service = app.add_service('cached', cache=LRUCache())
+    service.add_worker(ok)
+    service.add_worker(failing, routing_key='failing')
+
+    for _ in range(2):
+        assert service._get_response({'i': 1}, 'default', 'default') == Response({'echo': {'i': 1}})
+        assert service._get_response({'i': 1}, 'default', 'failing').http_status_code == 500
+
+    assert ok.calls == 1
+    assert failing.calls == 2
+    assert service._get_response({'i': 2}, 'default', 'default') == Response({'echo': {'i': 2}})
+    assert ok.calls == 2
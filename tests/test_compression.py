@@ -0,0 +1,47 @@
+import gzip
+import json
+import zlib
+
+import pytest
+
+from nauron.helpers import BINARY_ENVELOPE, available_codecs, compress, decompress
+
+from conftest import EchoWorker, wait_for, unacked
+
+
+@pytest.mark.parametrize('codec', available_codecs())
+def test_large_bodies_are_compressed(codec):
+    body = json.dumps({'text': 'x' * 4096}).encode()
+
+    compressed, content_encoding = compress(body, codec, threshold=1024)
+
+    assert content_encoding == codec
+    assert len(compressed) < len(body)
+    assert decompress(compressed, content_encoding) == body
+
+
+def test_small_bodies_are_not_compressed():
+    assert compress(b'{"i": 1}', 'gzip', threshold=1024) == (b'{"i": 1}', None)
+    assert decompress(b'{"i": 1}', None) == b'{"i": 1}'
+
+
+@pytest.mark.parametrize('content_encoding, body', [
+    ('zlib', zlib.compress(b'{"i": 1}')[:5]),
+    ('gzip', gzip.compress(b'{"i": 1}')[:12]),
+    ('gzip', b'not gzip at all'),
+    ('brotli', b'{"i": 1}'),
+], ids=['truncated-zlib', 'truncated-gzip', 'invalid-gzip', 'unknown-codec'])
+def test_corrupt_body_is_rejected_without_stopping_the_worker(start_worker, raw_client, content_encoding, body):
+    worker = EchoWorker()
+    consumer = start_worker(worker)
+
+    corrupt_id = raw_client.send(body, content_type=BINARY_ENVELOPE, content_encoding=content_encoding,
+                                 headers={'signature': 'default'})
+    valid_id = raw_client.send(json.dumps({'i': 2}).encode(), content_type=BINARY_ENVELOPE,
+                               headers={'signature': 'default'})
+
+    [(properties, _)] = raw_client.wait(corrupt_id)
+    assert properties.headers['http_status_code'] == 400
+    assert len(raw_client.wait(valid_id)) == 1
+    assert worker.calls == [{'i': 2}]
+    assert wait_for(lambda: unacked(consumer) == 0)
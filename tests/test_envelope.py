@@ -0,0 +1,89 @@
+import json
+import threading
+
+import pytest
+
+from nauron import Worker, Response
+from nauron.helpers import BINARY_ENVELOPE, encode_request, decode_request
+
+from conftest import WAIT_TIMEOUT
+
+
+class LegacyWorker:
+    def __init__(self, broker, service_name):
+        """
+        Answers requests the way workers released before the binary envelope do: the whole message body is
+        parsed as JSON and the response is sent as a JSON document without a content type.
+        """
+        self.requests = []
+        self.connection = broker.connect()
+        channel = self.connection.channel()
+        queue_name = f'{service_name}.default'
+        channel.queue_declare(queue=queue_name)
+        channel.exchange_declare(exchange=service_name, exchange_type='direct')
+        channel.queue_bind(exchange=service_name, queue=queue_name, routing_key=queue_name)
+        channel.basic_consume(queue=queue_name, on_message_callback=self._on_request)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self.connection.process_data_events(time_limit=0.05)
+
+    def _on_request(self, channel, method, properties, body):
+        request = json.loads(body)
+        self.requests.append(request)
+        response = Response({'echo': request['content'], 'signature': request['signature']})
+        channel.basic_publish(exchange='', routing_key=properties.reply_to, body=response.encode(),
+                              properties=type(properties)(correlation_id=properties.correlation_id))
+        channel.basic_ack(delivery_tag=method.delivery_tag)
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join(WAIT_TIMEOUT)
+        self.connection.close()
+
+
+class BytesWorker(Worker):
+    def process_request(self, content, signature):
+        return Response(bytes(range(256)) * 4, mimetype='audio/wav')
+
+
+def test_legacy_workers_are_supported_by_default(broker, service_name, start_service):
+    worker = LegacyWorker(broker, service_name)
+    try:
+        service = start_service()
+        response = service._get_response({'i': 1}, 'sig', 'default')
+    finally:
+        worker.stop()
+
+    assert response == Response({'echo': {'i': 1}, 'signature': 'sig'})
+    assert worker.requests == [{'content': {'i': 1}, 'signature': 'sig'}]
+
+
+@pytest.mark.parametrize('envelope', ['json', 'binary'])
+def test_binary_content_survives_both_envelopes(start_worker, start_service, envelope):
+    start_worker(BytesWorker())
+    service = start_service(envelope=envelope)
+
+    response = service._get_response({}, 'default', 'default')
+
+    content = response.content
+    if envelope == 'json':
+        # The legacy envelope carries bytes as an ISO-8859-1 string that is encoded again for the client.
+        content = content.encode('ISO-8859-1')
+    assert content == bytes(range(256)) * 4
+    assert response.mimetype == 'audio/wav'
+
+
+@pytest.mark.parametrize('envelope, content_type', [('json', None), ('binary', BINARY_ENVELOPE)])
+def test_requests_decode_in_both_envelopes(envelope, content_type):
+    body, headers = encode_request({'i': 1}, 'sig', envelope)
+
+    assert decode_request(body, content_type, headers) == {'content': {'i': 1}, 'signature': 'sig'}
+
+
+def test_unknown_envelope_is_rejected(start_service):
+    with pytest.raises(ValueError):
+        start_service(envelope='xml')
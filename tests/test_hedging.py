@@ -0,0 +1,121 @@
+import asyncio
+import threading
+
+import pytest
+
+from nauron import Worker, Response
+from nauron.hedging import HedgePolicy
+from nauron.metrics import REQUESTS_HEDGED
+
+from conftest import wait_for
+
+
+class SlowWorker(Worker):
+    def __init__(self, name):
+        self.name = name
+
+    def process_request(self, content, signature):
+        threading.Event().wait(1 if content.get('slow') and self.name == 'primary' else 0)
+        return Response({'worker': self.name, 'i': content.get('i')})
+
+
+def test_no_hedging_before_enough_samples():
+    policy = HedgePolicy(min_samples=3)
+
+    for _ in range(2):
+        policy.observe('key', 0.1)
+
+    assert policy.delay('key') is None
+
+
+def test_hedge_delay_is_the_percentile_of_recent_latencies():
+    policy = HedgePolicy(percentile=50, min_samples=4, min_delay=0)
+
+    for latency in (0.1, 0.2, 0.3, 0.4):
+        policy.observe('key', latency)
+
+    assert policy.delay('key') == pytest.approx(0.3)
+    assert policy.delay('other') is None
+
+
+def test_min_delay_is_respected():
+    policy = HedgePolicy(min_samples=1, min_delay=500)
+
+    policy.observe('key', 0.01)
+
+    assert policy.delay('key') == pytest.approx(0.5)
+
+
+def test_timed_out_requests_raise_the_hedge_delay():
+    policy = HedgePolicy(percentile=50, min_samples=4, min_delay=0)
+
+    for latency in (0.1, 0.1):
+        policy.observe('key', latency)
+    for _ in range(2):
+        policy.observe('key', 1.0, timed_out=True)
+
+    assert policy.delay('key') == pytest.approx(1.0)
+    assert policy.stats()['timed_out'] == 2
+
+
+def test_hedge_rate_is_capped():
+    policy = HedgePolicy(max_rate=0.5)
+
+    for _ in range(4):
+        policy.delay('key')
+
+    assert [policy.acquire() for _ in range(3)] == [True, True, False]
+    assert policy.stats()['capped'] == 1
+
+
+def test_invalid_parameters_are_rejected():
+    with pytest.raises(ValueError):
+        HedgePolicy(percentile=100)
+    with pytest.raises(ValueError):
+        HedgePolicy(max_rate=2)
+
+
+def test_late_request_is_answered_by_the_hedge(start_worker, start_service, service_name):
+    start_worker(SlowWorker('primary'), executor='thread', concurrency=2)
+    start_worker(SlowWorker('standby'), routing_key='standby')
+    policy = HedgePolicy(percentile=50, max_rate=1, min_samples=5, routing_key='standby')
+    service = start_service(hedging=policy)
+
+    for i in range(5):
+        assert service._get_response({'i': i}, 'default', 'default').content['worker'] == 'primary'
+    response = service._get_response({'i': 5, 'slow': True}, 'default', 'default')
+
+    assert response.content == {'worker': 'standby', 'i': 5}
+    assert REQUESTS_HEDGED.value(service=service_name, winner='hedge') == 1
+    assert policy.stats()['hedge_won'] == 1
+    # The late response of the primary worker is dropped.
+    assert wait_for(lambda: service.router.pending() == 0)
+
+
+def test_fast_request_is_not_hedged(start_worker, start_service, service_name):
+    start_worker(SlowWorker('primary'))
+    start_worker(SlowWorker('standby'), routing_key='standby')
+    policy = HedgePolicy(percentile=50, max_rate=1, min_samples=5, min_delay=1000, routing_key='standby')
+    service = start_service(hedging=policy)
+
+    for i in range(6):
+        assert service._get_response({'i': i}, 'default', 'default').content['worker'] == 'primary'
+
+    assert policy.stats()['hedged'] == 0
+    assert REQUESTS_HEDGED.value(service=service_name, winner='hedge') == 0
+
+
+@pytest.mark.parametrize('asynchronous', [False, True], ids=['sync', 'async'])
+def test_timed_out_request_is_observed(start_worker, start_service, service_name, asynchronous):
+    start_worker(SlowWorker('primary'))
+    policy = HedgePolicy(min_samples=1)
+    service = start_service(timeout=200, hedging=policy)
+
+    if asynchronous:
+        response = asyncio.run(service._get_response_async({'slow': True}, 'default', 'default'))
+    else:
+        response = service._get_response({'slow': True}, 'default', 'default')
+
+    assert response.http_status_code == 504
+    assert policy.stats()['timed_out'] == 1
+    assert policy.delay(f'{service_name}.default') >= 0.2
@@ -0,0 +1,86 @@
+import queue
+import threading
+
+import pytest
+from werkzeug.exceptions import ServiceUnavailable
+
+from nauron import Nauron, Worker, Response
+from nauron.local_executor import LocalExecutor
+
+from conftest import wait_for
+
+
+class GatedWorker(Worker):
+    def __init__(self):
+        self.release = threading.Event()
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def process_request(self, content, signature):
+        with self._lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        self.release.wait(5)
+        with self._lock:
+            self.running -= 1
+        return Response({'i': content['i']})
+
+
+def submit(handler, count: int) -> list:
+    threads = [threading.Thread(target=handler.process_request, args=({'i': i}, 'default')) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def test_concurrency_is_limited():
+    worker = GatedWorker()
+    executor = LocalExecutor(worker, concurrency=2)
+    threads = submit(executor, 4)
+
+    assert wait_for(lambda: executor.stats()['queued'] == 2)
+    assert executor.stats()['running'] == 2
+    worker.release.set()
+    for thread in threads:
+        thread.join(5)
+    executor.close()
+
+    assert worker.max_running == 2
+    assert executor.stats() == {'running': 0, 'queued': 0, 'processed': 4, 'rejected': 0}
+
+
+def test_requests_are_rejected_once_the_queue_is_full():
+    worker = GatedWorker()
+    executor = LocalExecutor(worker, concurrency=1, max_queue_size=1)
+    threads = submit(executor, 2)
+    assert wait_for(lambda: executor.stats()['queued'] == 1)
+
+    with pytest.raises(queue.Full):
+        executor.process_request({'i': 2}, 'default')
+    worker.release.set()
+    for thread in threads:
+        thread.join(5)
+    executor.close()
+
+    assert executor.stats()['rejected'] == 1
+
+
+def test_service_rejects_requests_when_the_worker_queue_is_full():
+    worker = GatedWorker()
+    service = Nauron(__name__).add_service('pooled')
+    service.add_worker(worker, executor='thread', concurrency=1, max_queue_size=0)
+    threads = submit(service._handlers['default'], 1)
+    assert wait_for(lambda: worker.running == 1)
+
+    with pytest.raises(ServiceUnavailable):
+        service._process_request({'i': 1}, 'default', 'default')
+    worker.release.set()
+    for thread in threads:
+        thread.join(5)
+    service.close()
+
+
+def test_executor_cannot_be_combined_with_batching():
+    with pytest.raises(ValueError):
+        Nauron(__name__).add_service('pooled').add_worker(GatedWorker(), executor='thread', batch_size=4)
@@ -0,0 +1,92 @@
+from urllib.request import urlopen
+
+import pytest
+
+from nauron import Nauron
+from nauron.metrics import MetricsRegistry, CONTENT_TYPE, REQUESTS, REQUEST_DURATION, REQUESTS_IN_FLIGHT, \
+    WORKER_REQUESTS, WORKER_PROCESSING_TIME, start_metrics_server
+
+from conftest import EchoWorker, wait_for
+
+
+def test_counters_and_gauges_are_rendered_with_labels():
+    registry = MetricsRegistry()
+    counter = registry.counter('test_total', 'A counter.', ('name',))
+    gauge = registry.gauge('test_gauge', 'A gauge.')
+
+    counter.inc(name='a "quoted"\nvalue')
+    counter.inc(2, name='b')
+    gauge.set(5)
+    gauge.dec()
+
+    assert registry.render() == ('# HELP test_total A counter.\n'
+                                 '# TYPE test_total counter\n'
+                                 'test_total{name="a \\"quoted\\"\\nvalue"} 1\n'
+                                 'test_total{name="b"} 2\n'
+                                 '# HELP test_gauge A gauge.\n'
+                                 '# TYPE test_gauge gauge\n'
+                                 'test_gauge 4\n')
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    histogram = registry.histogram('test_seconds', 'A histogram.', buckets=(0.1, 1))
+
+    for value in [0.05, 0.1, 0.5, 5]:
+        histogram.observe(value)
+
+    samples = registry.render().splitlines()[2:]
+    assert samples == ['test_seconds_bucket{le="0.1"} 2',
+                       'test_seconds_bucket{le="1"} 3',
+                       'test_seconds_bucket{le="+Inf"} 4',
+                       'test_seconds_sum 5.65',
+                       'test_seconds_count 4']
+    assert histogram.count() == 4
+
+
+def test_metrics_are_registered_once():
+    registry = MetricsRegistry()
+
+    assert registry.counter('test_total', 'A counter.') is registry.counter('test_total', 'A counter.')
+    with pytest.raises(ValueError):
+        registry.gauge('test_total', 'A gauge.')
+
+
+def test_metrics_server_serves_the_registry():
+    registry = MetricsRegistry()
+    registry.counter('test_total', 'A counter.').inc()
+    server = start_metrics_server(0, address='127.0.0.1', registry=registry)
+
+    with urlopen(f'http://127.0.0.1:{server.server_address[1]}/metrics', timeout=5) as response:
+        assert response.headers['Content-Type'] == CONTENT_TYPE
+        assert response.read().decode('utf8') == registry.render()
+    server.shutdown()
+
+
+def test_requests_are_counted(service_name):
+    app = Nauron(__name__, metrics_endpoint='/metrics')
+    service = app.add_service(service_name)
+    service.add_worker(EchoWorker())
+    labels = {'service': service_name, 'routing_key': 'default', 'signature': 'default'}
+
+    with app.test_request_context():
+        service.process_request({'text': 'x'})
+    metrics = app.test_client().get('/metrics')
+
+    assert REQUESTS.value(status=200, **labels) == 1
+    assert REQUEST_DURATION.count(**labels) == 1
+    assert REQUESTS_IN_FLIGHT.value(**labels) == 0
+    assert metrics.headers['Content-Type'] == CONTENT_TYPE
+    assert f'nauron_requests_total{{service="{service_name}",routing_key="default",signature="default",' \
+           f'status="200"}} 1' in metrics.get_data(as_text=True)
+
+
+def test_worker_requests_are_counted(start_worker, start_service, service_name):
+    start_worker(EchoWorker())
+    service = start_service()
+
+    service._get_response({'text': 'x'}, 'default', 'default')
+
+    assert wait_for(lambda: WORKER_REQUESTS.value(service=service_name, routing_key='default', signature='default',
+                                                  status=200) == 1)
+    assert WORKER_PROCESSING_TIME.count(service=service_name, routing_key='default', signature='default') == 1
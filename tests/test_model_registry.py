@@ -0,0 +1,96 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from nauron.model_registry import ModelRegistry
+
+from conftest import wait_for
+
+SIZES = {'small': 1, 'medium': 2, 'large': 3}
+
+
+class Loader:
+    def __init__(self, delay: float = 0, failures: int = 0):
+        self.delay = delay
+        self.failures = failures
+        self.loaded = []
+        self.unloaded = []
+
+    def load(self, key):
+        threading.Event().wait(self.delay)
+        self.loaded.append(key)
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("Model not found.")
+        return {'key': key, 'size': SIZES.get(key, 1)}
+
+    def unload(self, key, model):
+        self.unloaded.append(key)
+
+
+def registry(loader: Loader, **kwargs) -> ModelRegistry:
+    return ModelRegistry(loader.load, sizeof=lambda model: model['size'], unloader=loader.unload, **kwargs)
+
+
+def test_least_recently_used_models_are_evicted_to_fit_the_budget():
+    loader = Loader()
+    models = registry(loader, max_size=4)
+    models.get('small')
+    models.get('medium')
+    models.get('small')
+
+    models.get('large')
+
+    assert loader.unloaded == ['medium']
+    assert 'small' in models and 'large' in models
+    assert models.stats()['size'] == 4
+
+
+def test_models_in_use_are_not_evicted():
+    loader = Loader()
+    models = registry(loader, max_size=3)
+
+    with models.use('medium'):
+        models.get('large')
+        # The budget is exceeded while the model is in use.
+        assert 'medium' in models
+        assert models.stats()['size'] == 5
+
+    models.get('small')
+
+    assert loader.unloaded == ['medium', 'large']
+    assert models.stats()['size'] == 1
+
+
+def test_concurrent_requests_wait_for_a_single_load():
+    loader = Loader(delay=0.1)
+    models = registry(loader)
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(lambda _: models.get('small'), range(4)))
+
+    assert loader.loaded == ['small']
+    assert all(model is results[0] for model in results)
+    assert models.stats()['misses'] == 1
+
+
+def test_failed_load_is_retried_on_the_next_request():
+    loader = Loader(failures=1)
+    models = registry(loader)
+
+    with pytest.raises(RuntimeError):
+        models.get('small')
+
+    assert models.get('small')['key'] == 'small'
+    assert models.stats()['load_errors'] == 1
+
+
+def test_idle_models_are_unloaded():
+    loader = Loader()
+    models = registry(loader, idle_timeout=0.05)
+    models.get('small')
+
+    assert wait_for(lambda: 'small' not in models)
+    assert loader.unloaded == ['small']
+    models.close()
@@ -0,0 +1,41 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from conftest import EchoWorker, wait_for, unacked
+
+
+@pytest.mark.parametrize('executor, batch_size', [(None, 1), ('thread', 1), (None, 4), ('thread', 4)])
+def test_every_request_is_answered_and_acknowledged(start_worker, start_service, executor, batch_size):
+    worker = EchoWorker(delay=0.01)
+    consumer = start_worker(worker, executor=executor, concurrency=4, batch_size=batch_size, batch_timeout=50)
+    service = start_service()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        responses = list(pool.map(lambda i: service._get_response({'i': i}, 'sig', 'default'), range(24)))
+
+    assert [response.content for response in responses] == [{'echo': {'i': i}, 'signature': 'sig'}
+                                                             for i in range(24)]
+    assert len(worker.calls) == 24
+    assert wait_for(lambda: unacked(consumer) == 0)
+    if batch_size > 1:
+        assert sum(worker.batches) == 24
+        assert max(worker.batches) > 1
+
+
+@pytest.mark.parametrize('executor, batch_size', [(None, 1), ('thread', 1), (None, 4)])
+@pytest.mark.parametrize('body', [b'{"content": {"i": 1}}', b'{"signature": "default"}', b'[1, 2]', b'{'],
+                         ids=['no-signature', 'no-content', 'not-an-object', 'invalid-json'])
+def test_malformed_legacy_request_is_rejected(start_worker, raw_client, body, executor, batch_size):
+    worker = EchoWorker()
+    consumer = start_worker(worker, executor=executor, batch_size=batch_size)
+
+    malformed_id = raw_client.send(body)
+    valid_id = raw_client.send(json.dumps({'content': {'i': 2}, 'signature': 'default'}).encode())
+
+    [(_, reply)] = raw_client.wait(malformed_id)
+    assert json.loads(reply)['http_status_code'] == 400
+    [(_, reply)] = raw_client.wait(valid_id)
+    assert json.loads(reply)['content'] == {'echo': {'i': 2}, 'signature': 'default'}
+    assert wait_for(lambda: unacked(consumer) == 0)
@@ -0,0 +1,56 @@
+import json
+import threading
+
+from nauron import Worker, Response
+from nauron.helpers import BINARY_ENVELOPE
+
+from conftest import EchoWorker, wait_for, unacked
+
+
+class GatedWorker(Worker):
+    def __init__(self):
+        """
+        Blocks on the first request until it is released and records the order of the requests.
+        """
+        self.calls = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def process_request(self, content, signature):
+        self.calls.append(content['i'])
+        self.started.set()
+        self.release.wait(5)
+        return Response({'i': content['i']})
+
+
+def test_higher_priority_requests_are_processed_first(start_worker, raw_client):
+    worker = GatedWorker()
+    start_worker(worker, max_priority=10)
+
+    def send(i, priority):
+        return raw_client.send(json.dumps({'i': i}).encode(), content_type=BINARY_ENVELOPE,
+                               headers={'signature': 'default'}, priority=priority)
+
+    send(0, 1)
+    assert worker.started.wait(5)
+
+    correlation_ids = [send(1, 1), send(2, 5), send(3, None)]
+    worker.release.set()
+
+    for correlation_id in correlation_ids:
+        assert len(raw_client.wait(correlation_id)) == 1
+    assert worker.calls == [0, 2, 1, 3]
+
+
+def test_expired_request_is_acknowledged_without_processing(start_worker, raw_client, service_name):
+    worker = EchoWorker()
+    consumer = start_worker(worker)
+
+    raw_client.send(json.dumps({}).encode(), content_type=BINARY_ENVELOPE,
+                    headers={'signature': 'default', 'deadline': 1})
+    correlation_id = raw_client.send(json.dumps({'i': 1}).encode(), content_type=BINARY_ENVELOPE,
+                                     headers={'signature': 'default'})
+
+    assert len(raw_client.wait(correlation_id)) == 1
+    assert worker.calls == [{'i': 1}]
+    assert wait_for(lambda: unacked(consumer) == 0)
@@ -0,0 +1,129 @@
+import pika.exceptions
+import pytest
+from werkzeug.exceptions import ServiceUnavailable
+
+from nauron.memory_broker import InMemoryBroker
+from nauron.metrics import BROKER_RECONNECTS
+from nauron.mq_producer import MQProducerPool
+
+from conftest import wait_for
+
+
+class FlakyBroker(InMemoryBroker):
+    """
+    An in-memory broker that refuses connections while it is down.
+    """
+    down = False
+
+    def connect(self):
+        if self.down:
+            raise pika.exceptions.AMQPConnectionError('Connection refused')
+        return super().connect()
+
+
+@pytest.fixture
+def pool():
+    pools = []
+
+    def create(**kwargs) -> MQProducerPool:
+        pools.append(MQProducerPool(FlakyBroker(), 'svc', **kwargs))
+        return pools[-1]
+
+    yield create
+    for pool in pools:
+        pool.close()
+
+
+def reconnects() -> float:
+    return BROKER_RECONNECTS.value(component='producer')
+
+
+def test_connections_are_reused(pool):
+    pool = pool(size=2)
+
+    with pool.acquire() as first:
+        pass
+    with pool.acquire() as second:
+        pass
+
+    assert second is first
+    assert pool.stats() == {'size': 2, 'open': 1, 'idle': 1, 'in_use': 0, 'created': 1, 'reconnected': 0,
+                            'discarded': 0, 'acquired': 2, 'waited': 0}
+
+
+def test_checkout_is_aborted_if_no_connection_becomes_available(pool):
+    pool = pool(size=1)
+
+    with pool.acquire():
+        with pytest.raises(ServiceUnavailable):
+            with pool.acquire(timeout=0.05):
+                pass
+
+    assert pool.stats()['waited'] == 1
+
+
+def test_closed_idle_connection_is_replaced_without_counting_an_outage(pool):
+    pool = pool(keepalive_interval=None)
+    before = reconnects()
+    with pool.acquire() as producer:
+        pass
+    producer.mq_connection.close()
+
+    with pool.acquire() as replaced:
+        assert replaced.is_healthy()
+
+    assert pool.stats()['reconnected'] == 1
+    assert reconnects() == before
+
+
+def test_reconnection_after_an_outage_is_recorded(pool):
+    pool = pool(keepalive_interval=None)
+    before = reconnects()
+    pool.transport.down = True
+    with pytest.raises(ServiceUnavailable):
+        with pool.acquire():
+            pass
+    pool.transport.down = False
+
+    with pool.acquire():
+        pass
+
+    assert reconnects() == before + 1
+
+
+def test_connection_lost_while_in_use_is_recorded(pool):
+    pool = pool(keepalive_interval=None)
+    before = reconnects()
+    with pytest.raises(pika.exceptions.StreamLostError):
+        with pool.acquire():
+            raise pika.exceptions.StreamLostError('Connection reset')
+
+    with pool.acquire():
+        pass
+
+    assert pool.stats()['discarded'] == 1
+    assert reconnects() == before + 1
+
+
+def test_idle_connections_are_kept_alive(pool, monkeypatch):
+    pool = pool(size=2, keepalive_interval=0.02)
+    pool.warm()
+    serviced = []
+    for producer in pool._idle:
+        events = producer.mq_connection.process_data_events
+        monkeypatch.setattr(producer.mq_connection, 'process_data_events',
+                            lambda time_limit=0, producer=producer, events=events:
+                            serviced.append(producer) or events(time_limit))
+
+    assert wait_for(lambda: len(set(serviced)) == 2)
+
+
+def test_broken_idle_connection_is_reconnected_in_the_background(pool):
+    pool = pool(keepalive_interval=0.02)
+    before = reconnects()
+    pool.warm(1)
+    pool._idle[0].mq_connection.close()
+
+    assert wait_for(lambda: pool.stats()['reconnected'] == 1)
+    assert pool._idle[0].is_healthy()
+    assert reconnects() == before
@@ -0,0 +1,80 @@
+import json
+import threading
+
+import pika
+import pytest
+
+from nauron.cache import LRUCache
+from nauron.helpers import BINARY_ENVELOPE
+from nauron.metrics import WORKER_REDELIVERED
+
+from conftest import EchoWorker, WAIT_TIMEOUT, wait_for, redeliver, unacked
+
+
+def test_redelivered_request_joins_the_delivery_in_progress(start_worker, start_service, service_name):
+    worker = EchoWorker(delay=0.5)
+    consumer = start_worker(worker, executor='thread', replay_cache=LRUCache())
+    service = start_service()
+
+    def drop_connection():
+        wait_for(lambda: worker.calls)
+        # Closing the channel returns the unacknowledged request to the queue.
+        consumer.connection.add_callback_threadsafe(consumer.channel.close)
+
+    threading.Thread(target=drop_connection).start()
+    response = service._get_response({'i': 1}, 'default', 'default')
+
+    assert response.content == {'echo': {'i': 1}, 'signature': 'default'}
+    assert worker.calls == [{'i': 1}]
+    assert WORKER_REDELIVERED.value(service=service_name, routing_key='default', outcome='joined') == 1
+
+
+def test_redelivered_request_is_replayed_after_completion(start_worker, raw_client, broker, service_name):
+    worker = EchoWorker()
+    start_worker(worker, replay_cache=LRUCache())
+    properties = pika.BasicProperties(reply_to=raw_client.reply_queue, correlation_id='request-1',
+                                      content_type=BINARY_ENVELOPE, headers={'signature': 'default'})
+    body = json.dumps({'i': 1}).encode()
+
+    raw_client.send(body, correlation_id='request-1', content_type=BINARY_ENVELOPE,
+                    headers={'signature': 'default'})
+    assert len(raw_client.wait('request-1')) == 1
+    redeliver(broker, f'{service_name}.default', properties, body)
+    replies = raw_client.wait('request-1', count=2)
+
+    assert len(replies) == 2
+    assert replies[0][1] == replies[1][1]
+    assert worker.calls == [{'i': 1}]
+    assert WORKER_REDELIVERED.value(service=service_name, routing_key='default', outcome='replayed') == 1
+
+
+def test_redelivered_request_is_processed_without_replay_cache(start_worker, raw_client, broker, service_name):
+    worker = EchoWorker()
+    start_worker(worker)
+    properties = pika.BasicProperties(reply_to=raw_client.reply_queue, correlation_id='request-1',
+                                      content_type=BINARY_ENVELOPE, headers={'signature': 'default'})
+
+    redeliver(broker, f'{service_name}.default', properties, json.dumps({'i': 1}).encode())
+
+    assert len(raw_client.wait('request-1', timeout=WAIT_TIMEOUT)) == 1
+    assert worker.calls == [{'i': 1}]
+    assert WORKER_REDELIVERED.value(service=service_name, routing_key='default', outcome='processed') == 1
+
+
+@pytest.mark.parametrize('headers, body, outcome', [
+    ({'signature': 'default', 'deadline': 1}, json.dumps({'i': 1}).encode(), 'expired'),
+    ({'signature': 'default'}, b'{', 'rejected'),
+], ids=['expired', 'rejected'])
+def test_redelivered_request_that_is_not_processed_is_counted(start_worker, raw_client, broker, service_name,
+                                                              headers, body, outcome):
+    worker = EchoWorker()
+    consumer = start_worker(worker, replay_cache=LRUCache())
+    properties = pika.BasicProperties(reply_to=raw_client.reply_queue, correlation_id='request-1',
+                                      content_type=BINARY_ENVELOPE, headers=headers)
+
+    redeliver(broker, f'{service_name}.default', properties, body)
+
+    assert wait_for(lambda: WORKER_REDELIVERED.value(service=service_name, routing_key='default',
+                                                     outcome=outcome) == 1)
+    assert worker.calls == []
+    assert wait_for(lambda: unacked(consumer) == 0)
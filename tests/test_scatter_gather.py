@@ -0,0 +1,73 @@
+import threading
+from time import time
+
+from nauron import Worker, Response
+from nauron.scatter_gather import split_list, merge_lists
+
+from conftest import wait_for
+
+
+class UpperWorker(Worker):
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.calls = []
+
+    def process_request(self, content, signature):
+        self.calls.append(content['items'])
+        threading.Event().wait(self.delay)
+        if 'fail' in content['items']:
+            return Response('Invalid item.', http_status_code=400)
+        return Response({'items': [item.upper() for item in content['items']], 'language': content['language']})
+
+
+def test_short_lists_are_not_split():
+    split = split_list('items', 3)
+
+    assert split({'items': [1, 2, 3]}) == [{'items': [1, 2, 3]}]
+    assert split({'items': 'not a list'}) == [{'items': 'not a list'}]
+
+
+def test_lists_are_split_into_shards():
+    assert split_list('items', 2)({'items': [1, 2, 3], 'x': 1}) == [{'items': [1, 2], 'x': 1}, {'items': [3], 'x': 1}]
+
+
+def test_first_failed_shard_is_returned():
+    failed = Response(http_status_code=400)
+
+    assert merge_lists('items')([Response({'items': [1]}), failed, Response(http_status_code=500)]) is failed
+
+
+def test_shards_are_merged_in_order(start_worker, start_service):
+    start_worker(UpperWorker(), executor='thread', concurrency=4)
+    service = start_service(splitter=split_list('items', 2), merger=merge_lists('items'))
+    items = [f'item {i}' for i in range(9)]
+
+    response = service._get_response({'items': items, 'language': 'et'}, 'default', 'default')
+
+    assert response.content == {'items': [item.upper() for item in items], 'language': 'et'}
+
+
+def test_failed_shard_fails_the_request(start_worker, start_service):
+    start_worker(UpperWorker())
+    service = start_service(splitter=split_list('items', 1), merger=merge_lists('items'))
+
+    response = service._get_response({'items': ['a', 'fail', 'b'], 'language': 'et'}, 'default', 'default')
+
+    assert response.http_status_code == 400
+
+
+def test_shards_share_the_deadline_of_the_request(start_worker, start_service):
+    worker = UpperWorker(delay=0.3)
+    start_worker(worker)
+    service = start_service(timeout=500, splitter=split_list('items', 1), merger=merge_lists('items'),
+                            shard_concurrency=1)
+
+    t1 = time()
+    response = service._get_response({'items': ['a', 'b', 'c', 'd'], 'language': 'et'}, 'default', 'default')
+
+    assert response.http_status_code == 504
+    assert time() - t1 < 0.8
+    # Shards that were still waiting for the executor at the deadline are never published.
+    assert wait_for(lambda: service._shard_executor._work_queue.empty())
+    threading.Event().wait(0.5)
+    assert len(worker.calls) == 2
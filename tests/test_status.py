@@ -0,0 +1,58 @@
+import pika.exceptions
+import pytest
+from werkzeug.exceptions import ServiceUnavailable
+
+from nauron import Nauron
+from nauron.memory_broker import InMemoryBroker
+
+from conftest import EchoWorker, wait_for
+
+
+class UnreachableBroker(InMemoryBroker):
+    """
+    An in-memory broker that refuses all connections.
+    """
+
+    def connect(self):
+        raise pika.exceptions.AMQPConnectionError('Connection refused')
+
+
+def test_local_services_are_always_ready(service_name):
+    app = Nauron(__name__)
+    service = app.add_service(service_name)
+    service.add_worker(EchoWorker())
+
+    assert service.status == 'ready'
+    assert service.wait_ready(0)
+    assert app.status()[service_name] == 'ready'
+
+
+def test_unreachable_service_is_initializing(service_name):
+    app = Nauron(__name__, mq_parameters=UnreachableBroker())
+    service = app.add_service(service_name, remote=True)
+
+    assert service.status == 'initializing'
+    assert not service.wait_ready(0.1)
+    assert app.status()[service_name] == 'initializing'
+    with pytest.raises(ServiceUnavailable):
+        service._process_request({}, 'default', 'default')
+    app._mq_router.stop()
+
+
+def test_remote_service_becomes_ready(start_worker, start_service, service_name):
+    start_worker(EchoWorker())
+    service = start_service()
+
+    assert service.status == 'ready'
+    assert service.stats()['status'] == 'ready'
+    assert service._process_request({'text': 'x'}, 'default', 'default').content['echo'] == {'text': 'x'}
+
+
+def test_service_is_disconnected_without_the_response_router(start_service):
+    service = start_service()
+
+    service.router.stop()
+
+    assert wait_for(lambda: service.status == 'disconnected')
+    with pytest.raises(ServiceUnavailable):
+        service._process_request({}, 'default', 'default')
@@ -0,0 +1,144 @@
+import asyncio
+import threading
+
+import pika
+import pytest
+
+from nauron import Nauron, Worker, Response, StreamingResponse
+from nauron.mq_producer import MQProducerPool
+
+from conftest import WAIT_TIMEOUT, wait_for, unacked
+
+
+class StreamingWorker(Worker):
+    def __init__(self, chunks, fail_after=None):
+        self.chunks = chunks
+        self.fail_after = fail_after
+
+    def process_request(self, content, signature):
+        def generate():
+            for i, chunk in enumerate(self.chunks):
+                if i == self.fail_after:
+                    raise RuntimeError("Worker failed.")
+                yield chunk
+
+        return StreamingResponse(generate(), mimetype='text/plain')
+
+
+@pytest.mark.parametrize('executor', [None, 'thread'])
+def test_chunks_arrive_in_order(start_worker, start_service, executor):
+    chunks = [f'chunk {i};' for i in range(50)]
+    consumer = start_worker(StreamingWorker(chunks), executor=executor)
+    service = start_service(envelope='binary')
+
+    response = service._get_response({}, 'default', 'default')
+
+    assert isinstance(response, StreamingResponse)
+    assert response.mimetype == 'text/plain'
+    assert b''.join(response.iter_bytes()) == ''.join(chunks).encode()
+    assert service.router.pending() == 0
+    assert wait_for(lambda: unacked(consumer) == 0)
+
+
+def test_broken_stream_raises_an_error(start_worker, start_service):
+    start_worker(StreamingWorker(['a', 'b', 'c'], fail_after=1))
+    service = start_service(envelope='binary')
+
+    response = service._get_response({}, 'default', 'default')
+
+    with pytest.raises(IOError):
+        b''.join(response.iter_bytes())
+    assert service.router.pending() == 0
+
+
+def test_async_request_collects_the_stream(start_worker, start_service):
+    start_worker(StreamingWorker(['a', 'b', 'c']))
+    service = start_service(envelope='binary')
+
+    response = asyncio.run(service._get_response_async({}, 'default', 'default'))
+
+    assert response == Response(content=b'abc', mimetype='text/plain')
+    assert service.router.pending() == 0
+
+
+def test_chunk_out_of_order_is_rejected():
+    properties = pika.BasicProperties(headers={'stream_sequence': 2})
+
+    with pytest.raises(IOError):
+        MQProducerPool._check_chunk(properties, 1, 'request-1')
+
+
+class EndlessWorker(Worker):
+    def process_request(self, content, signature):
+        def generate():
+            for i in range(20):
+                threading.Event().wait(0.01)
+                yield f'{i};'
+
+        return StreamingResponse(generate())
+
+
+def test_unread_stream_stops_waiting_when_closed(start_worker, start_service):
+    start_worker(EndlessWorker(), executor='thread')
+    service = start_service(envelope='binary')
+
+    response = service._get_response({}, 'default', 'default')
+    assert service.router.pending() == 1
+    response.close()
+
+    assert service.router.pending() == 0
+
+
+@pytest.mark.parametrize('read', [False, True])
+def test_flask_response_releases_the_stream_when_closed(broker, service_name, start_worker, read):
+    start_worker(EndlessWorker(), executor='thread')
+    app = Nauron(__name__, mq_parameters=broker, timeout=5000)
+    service = app.add_service(service_name, remote=True, envelope='binary')
+    assert service.wait_ready(WAIT_TIMEOUT)
+    try:
+        with app.test_request_context():
+            response = service.process_request({})
+            if read:
+                assert b''.join(response.response) == ''.join(f'{i};' for i in range(20)).encode()
+            response.close()
+
+        assert service.router.pending() == 0
+    finally:
+        service.close()
+        app._mq_router.stop()
+
+
+class GatedWorker(Worker):
+    """
+    Produces the last chunk only once the client has received the first one.
+    """
+    def __init__(self):
+        self.first_chunk_received = threading.Event()
+        self.threads = []
+        self.gate_opened = []
+
+    def process_request(self, content, signature):
+        def generate():
+            self.threads.append(threading.current_thread().name)
+            yield 'first;'
+            self.gate_opened.append(self.first_chunk_received.wait(2))
+            yield 'last;'
+
+        return StreamingResponse(generate())
+
+
+def test_stream_is_produced_in_the_executor_and_sent_chunk_by_chunk(start_worker, start_service):
+    worker = GatedWorker()
+    start_worker(worker, executor='thread')
+    service = start_service(envelope='binary')
+
+    # Fast workers often finish before the done callback is attached, so several requests are sent.
+    for _ in range(5):
+        worker.first_chunk_received.clear()
+        chunks = service._get_response({}, 'default', 'default').iter_bytes()
+        assert next(chunks) == b'first;'
+        worker.first_chunk_received.set()
+        assert b''.join(chunks) == b'last;'
+
+    assert all(thread.startswith('nauron-worker') for thread in worker.threads)
+    assert worker.gate_opened == [True] * 5
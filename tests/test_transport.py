@@ -0,0 +1,91 @@
+import pika
+import pika.exceptions
+import pytest
+
+from nauron import Worker
+from nauron.mq_consumer import MQConsumer
+from nauron.mq_producer import MQProducerPool
+from nauron.mq_router import MQResponseRouter
+from nauron.metrics import BROKER_RECONNECTS, BROKER_DOWNTIME
+from nauron.transport import RabbitMQTransport, Backoff, Reconnector, get_transport
+
+
+class FakeConnection:
+    def __init__(self, parameters):
+        self.host = parameters.host
+
+
+class Network:
+    def __init__(self):
+        """
+        Replaces pika connections, connecting fails for the hosts that are marked unreachable.
+        """
+        self.unreachable = set()
+        self.attempts = []
+
+    def connect(self, parameters) -> FakeConnection:
+        self.attempts.append(parameters.host)
+        if parameters.host in self.unreachable:
+            raise pika.exceptions.AMQPConnectionError('Connection refused')
+        return FakeConnection(parameters)
+
+
+@pytest.fixture
+def network(monkeypatch) -> Network:
+    network = Network()
+    monkeypatch.setattr(pika, 'BlockingConnection', network.connect)
+    return network
+
+
+def test_default_parameters_are_used_without_parameters():
+    transport = get_transport(None)
+
+    assert transport.endpoints[0].host == pika.ConnectionParameters().host
+    assert str(transport) == '{hosts: [localhost:5672]}'
+
+
+def test_components_accept_missing_parameters():
+    for component in (MQProducerPool(None, 'svc'), MQResponseRouter(None), MQConsumer(Worker(), None, 'svc')):
+        assert isinstance(component.transport, RabbitMQTransport)
+
+
+def test_failover_sticks_to_the_reachable_node(network):
+    transport = RabbitMQTransport([pika.ConnectionParameters('node-1'), pika.ConnectionParameters('node-2')])
+    network.unreachable.add('node-1')
+
+    assert transport.connect().host == 'node-2'
+    assert transport.connect().host == 'node-2'
+    assert network.attempts == ['node-1', 'node-2', 'node-2']
+
+
+def test_error_is_raised_if_no_node_is_reachable(network):
+    transport = RabbitMQTransport([pika.ConnectionParameters('node-1'), pika.ConnectionParameters('node-2')])
+    network.unreachable.update({'node-1', 'node-2'})
+
+    with pytest.raises(pika.exceptions.AMQPConnectionError):
+        transport.connect()
+
+
+def test_backoff_grows_up_to_the_maximum():
+    backoff = Backoff(initial=0.1, maximum=1)
+
+    delays = [backoff.next() for _ in range(10)]
+
+    assert 0.05 <= delays[0] <= 0.1
+    assert all(0.5 <= delay <= 1 for delay in delays[4:])
+    backoff.reset()
+    assert backoff.next() <= 0.1
+
+
+def test_only_reconnections_are_recorded():
+    reconnector = Reconnector('test-component')
+
+    reconnector.failed(ConnectionError())
+    reconnector.connected()
+    assert BROKER_RECONNECTS.value(component='test-component') == 0
+
+    reconnector.failed(ConnectionError())
+    reconnector.failed(ConnectionError())
+    reconnector.connected()
+    assert BROKER_RECONNECTS.value(component='test-component') == 1
+    assert BROKER_DOWNTIME.count(component='test-component') == 1
@@ -0,0 +1,73 @@
+import pytest
+
+from nauron import Nauron, Response
+from nauron.metrics import REQUESTS_REJECTED
+from nauron.validation import compile_validator
+
+from conftest import EchoWorker
+
+
+def require_text(content):
+    if not isinstance(content.get('text'), str):
+        raise ValueError("'text' must be a string.")
+    return {'text': content['text'].strip()}
+
+
+class SchemaError(ValueError):
+    def __init__(self, messages):
+        super().__init__(str(messages))
+        self.messages = messages
+
+
+class LanguageSchema:
+    """
+    Mimics a marshmallow schema: load() returns the normalized content or raises an error with messages.
+    """
+    def load(self, content):
+        if content.get('lang') not in ('et', 'en'):
+            raise SchemaError({'lang': ['Unsupported language.']})
+        return content
+
+
+@pytest.fixture
+def service(service_name):
+    service = Nauron(__name__).add_service(service_name, validator=require_text,
+                                           signature_validators={'language': LanguageSchema})
+    service.add_worker(EchoWorker())
+    return service
+
+
+def test_valid_request_reaches_the_worker_normalized(service):
+    response = service._get_response({'text': ' tere '}, 'default', 'default')
+
+    assert response == Response({'echo': {'text': 'tere'}, 'signature': 'default'})
+
+
+def test_invalid_request_is_rejected_before_the_worker(service, service_name):
+    response = service._get_response({'text': 1}, 'default', 'default')
+
+    assert response == Response("'text' must be a string.", http_status_code=400)
+    assert service.workers['default'].calls == []
+    assert REQUESTS_REJECTED.value(service=service_name, reason='validation') == 1
+
+
+def test_signature_validator_overrides_the_default(service):
+    assert service._get_response({'lang': 'et'}, 'language', 'default').http_status_code == 200
+
+    response = service._get_response({'lang': 'xx'}, 'language', 'default')
+
+    assert response == Response({'lang': ['Unsupported language.']}, http_status_code=400)
+
+
+def test_invalid_request_to_a_remote_service_is_not_published(start_service):
+    service = start_service(validator=require_text)
+
+    response = service._get_response({}, 'default', 'default')
+
+    assert response.http_status_code == 400
+    assert service.stats()['pool']['acquired'] == 0
+
+
+def test_unsupported_validator_is_rejected():
+    with pytest.raises(TypeError):
+        compile_validator(42)
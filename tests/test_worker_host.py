@@ -0,0 +1,82 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+
+import pytest
+
+from nauron.worker import shared_resource
+from nauron.worker_host import WorkerHost
+
+from conftest import EchoWorker, WAIT_TIMEOUT
+
+
+@pytest.fixture
+def start_host(broker):
+    """
+    Starts a worker host on a background thread once all consumers are listening and stops it after the test.
+    """
+    hosts = []
+
+    def start(host: WorkerHost) -> WorkerHost:
+        thread = threading.Thread(target=host.start, daemon=True)
+        thread.start()
+        for consumer in host.consumers:
+            assert broker.wait_for_consumers(consumer.queue_name, 1, timeout=WAIT_TIMEOUT)
+        hosts.append((host, thread))
+        return host
+
+    yield start
+    for host, thread in hosts:
+        host.stop()
+        thread.join(WAIT_TIMEOUT)
+
+
+def test_host_requires_workers(broker):
+    with pytest.raises(ValueError):
+        WorkerHost(broker).start()
+
+
+def test_workers_share_one_connection(broker, service_name, start_host, start_service):
+    worker = EchoWorker()
+    host = WorkerHost(broker)
+    host.add_worker(worker, service_name, routing_key='en')
+    host.add_worker(worker, service_name, routing_key='et')
+    start_host(host)
+    service = start_service()
+
+    for routing_key in ['en', 'et']:
+        response = service._get_response({'text': routing_key}, 'default', routing_key)
+        assert response.content['echo'] == {'text': routing_key}
+
+    assert len(worker.calls) == 2
+    assert len({id(consumer.connection) for consumer in host.consumers}) == 1
+
+
+def test_busy_queue_does_not_starve_the_others(broker, service_name, start_host, start_service):
+    host = WorkerHost(broker)
+    host.add_worker(EchoWorker(delay=0.2), service_name, routing_key='slow')
+    host.add_worker(EchoWorker(), service_name, routing_key='fast')
+    start_host(host)
+    service = start_service()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        backlog = [executor.submit(service._get_response, {}, 'default', 'slow') for _ in range(8)]
+        threading.Event().wait(0.1)
+        t1 = time()
+        response = service._get_response({}, 'default', 'fast')
+        latency = time() - t1
+        assert all(future.result().http_status_code == 200 for future in backlog)
+
+    assert response.http_status_code == 200
+    # The fast request waits for at most one slow request instead of the whole backlog.
+    assert latency < 0.8
+
+
+def test_shared_resources_are_loaded_once():
+    loads = []
+
+    first = shared_resource('test-worker-host-tokenizer', lambda: loads.append(1) or object())
+    second = shared_resource('test-worker-host-tokenizer', lambda: loads.append(1) or object())
+
+    assert first is second
+    assert loads == [1]